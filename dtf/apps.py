@@ -3,4 +3,26 @@ from django.apps import AppConfig
 
 class DtfConfig(AppConfig):
     name = 'dtf'
-    verbose_name = 'Django Testing Framework'
\ No newline at end of file
+    verbose_name = 'Django Testing Framework'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from dtf.backends.sqlite3.base import configure_connection
+        from dtf.metrics import count_created_rows
+        from dtf.project_cache import forget_changed_project
+        from dtf.references import forget_created_reference_value
+        from dtf.routers import sync_project_copy
+
+        connection_created.connect(configure_connection, dispatch_uid="dtf_configure_sqlite_connection")
+
+        post_save.connect(forget_created_reference_value, sender=self.get_model('ReferenceValue'),
+            dispatch_uid="dtf_forget_created_reference_value")
+        post_save.connect(sync_project_copy, sender=self.get_model('Project'), dispatch_uid="dtf_sync_project_copy")
+        post_save.connect(forget_changed_project, sender=self.get_model('Project'),
+            dispatch_uid="dtf_forget_saved_project")
+        post_delete.connect(forget_changed_project, sender=self.get_model('Project'),
+            dispatch_uid="dtf_forget_deleted_project")
+
+        for model in self.get_models():
+            post_save.connect(count_created_rows, sender=model, dispatch_uid=f"dtf_metrics_{model.__name__}")
\ No newline at end of file
@@ -0,0 +1,41 @@
+"""
+SQLite database backend tuned for several processes writing at the same time
+
+Compared to the default SQLite backend, transactions are started with 'BEGIN IMMEDIATE'. The write lock is
+taken at the start of the transaction, so concurrent writers wait for each other within the busy timeout instead of
+failing with 'database is locked' when a read lock can not be upgraded.
+The pragmas in DTF_SQLITE_PRAGMAS, by default WAL journaling, synchronous=NORMAL, a busy timeout and larger mmap and
+page caches, are applied to every new connection by the 'configure_connection' receiver of the connection_created
+signal. Combine it with persistent connections (CONN_MAX_AGE), so the pragmas are not applied on every request.
+"""
+
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 268435456,
+    'cache_size': -65536,
+    'temp_store': 'MEMORY',
+}
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def _start_transaction_under_autocommit(self):
+        """
+        Django starts the transactions of atomic blocks explicitly, take the write lock right away
+        """
+        self.cursor().execute("BEGIN IMMEDIATE")
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    connection_created receiver applying the DTF_SQLITE_PRAGMAS to connections of this backend
+    """
+    if not isinstance(connection, DatabaseWrapper):
+        return
+    pragmas = getattr(settings, 'DTF_SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
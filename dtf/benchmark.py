@@ -0,0 +1,286 @@
+"""
+Synthetic data generation and benchmarks for the ingestion and read paths
+
+The benchmarks talk to the API and views through the Django test client, so the whole request handling is measured.
+Run them with the 'dtf_benchmark' management command.
+"""
+
+import base64
+import io
+import math
+import random
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from dtf.fastpath import TEST_RESULT_FIELDS, dumps, test_result_rows
+from dtf.models import TestResult
+from dtf.parsers import MessagePackParser
+from dtf.references import resolve_result_references
+from dtf.renderers import MessagePackRenderer, msgpack
+from dtf.serializers import TestResultSerializer
+
+VALUE_TYPES = ['integer', 'float', 'string', 'list', 'image']
+
+# media types of the formats the API can be benchmarked with
+FORMATS = {
+    'json': 'application/json',
+    'msgpack': 'application/msgpack',
+}
+
+def get_codecs():
+    """
+    Return the (renderer, parser) pairs of all available formats
+    """
+    codecs = {'json': (JSONRenderer(), JSONParser())}
+    if msgpack is not None:
+        codecs['msgpack'] = (MessagePackRenderer(), MessagePackParser())
+    return codecs
+
+class SyntheticDataGenerator:
+    """
+    Generates API payloads for projects, submissions, test results and references
+
+    The generated data only depends on the seed, so runs with the same configuration are comparable
+    """
+
+    def __init__(self, seed=0, parameters=5, value_types=None, list_length=100, image_size=1024):
+        self.random = random.Random(seed)
+        self.parameters = parameters
+        self.value_types = value_types or ['integer', 'float']
+        self.list_length = list_length
+        self.image_size = image_size
+
+    def project(self, index):
+        return {
+            'name': f"Benchmark Project {index}",
+            'slug': f"benchmark-project-{index}"
+        }
+
+    def submission(self, project_id, index):
+        return {
+            'project_id': project_id,
+            'info': {
+                'branch': self.random.choice(['master', 'develop', f"feature-{index % 7}"]),
+                'commit': f"{self.random.getrandbits(160):040x}",
+                'host': f"runner-{index % 4}",
+            }
+        }
+
+    def value(self, valuetype):
+        if valuetype == 'integer':
+            return self.random.randint(0, 1000)
+        if valuetype == 'float':
+            return self.random.random() * 1000
+        if valuetype == 'string':
+            return f"value-{self.random.getrandbits(32):08x}"
+        if valuetype == 'list':
+            return [self.random.random() for _ in range(self.list_length)]
+        if valuetype == 'image':
+            data = bytes(self.random.getrandbits(8) for _ in range(self.image_size))
+            return base64.b64encode(data).decode('ascii')
+        raise ValueError(f"unknown valuetype {valuetype}")
+
+    def test_result(self, submission_id, index):
+        results = []
+        for p in range(self.parameters):
+            valuetype = self.value_types[p % len(self.value_types)]
+            results.append({
+                'name': f"parameter{p}",
+                'value': self.value(valuetype),
+                'valuetype': valuetype,
+                'status': self.random.choices(['successful', 'unstable', 'failed'], [90, 5, 5])[0],
+            })
+        return {
+            'name': f"TEST_{index}",
+            'submission_id': submission_id,
+            'results': results
+        }
+
+    def references(self, project_id, test_payload, test_id):
+        return {
+            'project_id': project_id,
+            'test_name': test_payload['name'],
+            'test_id': test_id,
+            'references': {
+                r['name']: {'value': r['value']} for r in test_payload['results']
+            }
+        }
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a list of values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+class BenchmarkResult:
+    """
+    Collects the latencies and query counts of the calls of a single benchmark
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.peak_memory = None
+
+    def latency_ms(self, percent):
+        latency = percentile(self.latencies, percent)
+        return latency * 1000 if latency is not None else None
+
+    def as_dict(self):
+        total = sum(self.latencies)
+        return {
+            'calls': len(self.queries),
+            'throughput_per_s': len(self.latencies) / total if total else None,
+            'p50_ms': self.latency_ms(50),
+            'p95_ms': self.latency_ms(95),
+            'p99_ms': self.latency_ms(99),
+            'queries_per_call': sum(self.queries) / len(self.queries),
+            'peak_memory_bytes': self.peak_memory,
+        }
+
+def run_codec_benchmarks(payloads, repeat=20):
+    """
+    Measure the size and the encoding and decoding times of the payloads in every available format
+
+    The payloads are encoded and decoded with the renderers and parsers of the API, without the request handling.
+    """
+    results = {}
+    for name, (renderer, parser) in get_codecs().items():
+        encode_times = []
+        decode_times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = renderer.render(payloads)
+            encode_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            parser.parse(io.BytesIO(body))
+            decode_times.append(time.perf_counter() - start)
+        results[name] = {
+            'bytes': len(body),
+            'encode_p50_ms': percentile(encode_times, 50) * 1000,
+            'decode_p50_ms': percentile(decode_times, 50) * 1000,
+        }
+    return results
+
+class BenchmarkRunner:
+    """
+    Runs the ingestion and read benchmarks and collects their results
+
+    The API is called with request and response bodies in the given format, out of FORMATS.
+    """
+
+    def __init__(self, generator, projects=1, submissions=5, tests=50, repeat=20, format='json'):
+        self.generator = generator
+        self.projects = projects
+        self.submissions = submissions
+        self.tests = tests
+        self.repeat = repeat
+        self.format = format
+        self.renderer = get_codecs()[format][0]
+        self.client = Client(HTTP_ACCEPT=FORMATS[format])
+        self.results = {}
+
+    def call(self, name, method, path, payload=None, **extra):
+        """
+        Execute and time a single request. The response is returned so its data can be used by later calls
+        """
+        if payload is None:
+            request = lambda: getattr(self.client, method)(path, **extra)
+        else:
+            # the payload is encoded outside of the timed request, like a client would have it ready
+            body = self.renderer.render(payload)
+            request = lambda: getattr(self.client, method)(
+                path, body, content_type=FORMATS[self.format], **extra)
+
+        response = self.measure(name, request)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method.upper()} {path} failed with {response.status_code}")
+        return response
+
+    def measure(self, name, function):
+        """
+        Execute and time the function as a call of the named benchmark and return its result
+        """
+        result = self.results.setdefault(name, BenchmarkResult())
+        with CaptureQueriesContext(connection) as context:
+            if result.peak_memory is None:
+                # the first call of every benchmark is traced for its memory usage. Tracing slows it down,
+                # so it is not timed
+                tracemalloc.start()
+                value = function()
+                result.peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                start = time.perf_counter()
+                value = function()
+                result.latencies.append(time.perf_counter() - start)
+        result.queries.append(len(context.captured_queries))
+        return value
+
+    def run(self):
+        ingested = self.run_ingestion()
+        self.run_reads(ingested)
+        self.run_serialization(ingested)
+        return {name: result.as_dict() for name, result in self.results.items()}
+
+    def run_ingestion(self):
+        ingested = []
+        for p in range(self.projects):
+            project = self.generator.project(p)
+            response = self.call('create_project', 'post', '/api/create_project', project)
+            project_id = response.data['project_id']
+
+            for s in range(self.submissions):
+                response = self.call('create_submission', 'post', reverse('create_submission'),
+                    self.generator.submission(project_id, s))
+                submission_id = response.data['id']
+
+                for t in range(self.tests):
+                    payload = self.generator.test_result(submission_id, t)
+                    response = self.call('submit_test_results', 'post', '/api/submit_test_results', payload)
+                    test_id = response.data['test_result_id']
+                    if s == 0:
+                        self.call('update_references', 'put', reverse('update_references'),
+                            self.generator.references(project_id, payload, test_id))
+                ingested.append((project['slug'], submission_id, test_id))
+        return ingested
+
+    def run_reads(self, ingested):
+        for i in range(self.repeat):
+            slug, submission_id, test_id = ingested[i % len(ingested)]
+            test_name = f"TEST_{self.tests - 1}"
+            self.call('frontpage', 'get', '/')
+            self.call('view_projects', 'get', reverse('projects'))
+            self.call('view_project_details', 'get', reverse('project_details', args=[slug]))
+            self.call('view_project_settings', 'get', reverse('project_settings', args=[slug]))
+            self.call('view_submission_details', 'get', reverse('submission_details', args=[submission_id]))
+            self.call('view_test_result_details', 'get', reverse('test_result_details', args=[test_id]))
+            self.call('get_projects', 'get', reverse('get_projects'))
+            self.call('get_submission_by_id', 'get', reverse('get_submission_by_id', args=[submission_id]))
+            self.call('get_reference', 'get', reverse('get_reference', args=[slug, test_name]))
+            self.call('get_reference_by_test_id', 'get', reverse('get_reference_by_test_id', args=[test_id]))
+
+    def run_serialization(self, ingested):
+        """
+        Compare the serialization of a submission to JSON by the TestResultSerializer and the JSONRenderer \
+            to the fast read path, without the request handling
+        """
+        renderer = JSONRenderer()
+        for i in range(self.repeat):
+            submission_id = ingested[i % len(ingested)][1]
+            tests = TestResult.objects.filter(submission_id=submission_id)
+            self.measure('serialize_submission_serializer', lambda: renderer.render(
+                TestResultSerializer(resolve_result_references(list(tests)), many=True).data))
+            self.measure('serialize_submission_fastpath', lambda: dumps(
+                test_result_rows(list(tests.values(*TEST_RESULT_FIELDS)))))
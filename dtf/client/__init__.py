@@ -0,0 +1,5 @@
+"""
+Python client for the DTF REST API, see dtf.client.client
+"""
+
+from dtf.client.client import Client, ClientError, UploadReport
@@ -0,0 +1,274 @@
+"""
+Python client for the DTF REST API
+
+Test results are buffered and uploaded in batches to 'api/submit_test_results' by a pool of background threads, which
+share one keep-alive session. A batch is sent as soon as it holds 'batch_size' results, or after 'flush_interval'
+seconds. Failed requests are retried with exponential backoff. All retries of a request carry the same 'Idempotency-Key', so the server
+handles a request only once even if a response was lost. Closing the client, either explicitly, by leaving the
+'with' block or at interpreter exit, uploads all buffered results and reports the results that could not be uploaded.
+
+.. code-block:: python
+
+    from dtf.client import Client
+
+    with Client("http://dtf.example.com") as client:
+        submission_id = client.create_submission(project_slug="my-project", info={"branch": "master"})
+        client.submit(submission_id, "UNIT_TEST", [{"name": "parameter1", "value": 5, "valuetype": "integer"}])
+    print(client.report)
+
+The client only depends on requests, it does not need Django.
+"""
+
+import atexit
+import concurrent.futures
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('dtf.client')
+
+# responses with these status codes are retried, all other responses are final. 409 is returned while an earlier
+# attempt with the same Idempotency-Key is still handled
+RETRY_STATUS_CODES = [409, 429, 500, 502, 503, 504]
+
+class ClientError(Exception):
+    """
+    Raised when a request to the API fails
+    """
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+class UploadReport:
+    """
+    Summary of the uploads of a client
+
+    'failed' is a list of (results, error) tuples for every batch that could not be uploaded
+    """
+    def __init__(self):
+        self.uploaded = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = []
+        self._lock = threading.Lock()
+
+    def add_success(self, results):
+        with self._lock:
+            self.uploaded += len(results)
+            self.batches += 1
+
+    def add_failure(self, results, error):
+        with self._lock:
+            self.failed.append((results, error))
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    @property
+    def failed_results(self):
+        return sum(len(results) for results, _ in self.failed)
+
+    def __str__(self):
+        return (f"{self.uploaded} results uploaded in {self.batches} batches, "
+                f"{self.failed_results} results failed, {self.retries} retries")
+
+class Client:
+    """
+    Client for the DTF REST API at the given base url
+
+    :param batch_size: Number of results uploaded per request
+    :param flush_interval: Maximum number of seconds a result is buffered
+    :param workers: Number of concurrent uploads, and of pooled connections
+    :param retries: Number of retries of a failed request
+    :param backoff: Base of the exponential backoff between retries in seconds
+    :param timeout: Timeout of a single request in seconds
+    :param compress: Compress the request bodies with gzip, the server must accept 'Content-Encoding: gzip'
+    :param headers: Additional headers sent with every request, e.g. for authentication
+    """
+
+    def __init__(self, url, batch_size=100, flush_interval=1.0, workers=4, retries=5, backoff=0.5, max_backoff=30,
+                 timeout=30, compress=False, headers=None):
+        self.url = url.rstrip('/')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.compress = compress
+        self.report = UploadReport()
+
+        # retries are handled by the client itself, to apply the backoff to all errors
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(headers or {})
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._closed = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dtf-upload')
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name='dtf-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(self, method, path, data=None, params=None):
+        """
+        Send a request to the API, retrying connection errors and retryable status codes
+
+        Returns the final response, which can still be an error response. Raises a ClientError if all attempts failed.
+        """
+        headers = {}
+        if method != 'GET':
+            headers['Idempotency-Key'] = str(uuid.uuid4())
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+            if self.compress:
+                body = gzip.compress(body)
+                headers['Content-Encoding'] = 'gzip'
+
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                response = self.session.request(method, self.url + path, data=body, params=params, headers=headers,
+                    timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                failure = ClientError(f"{method} {path} failed: {error}")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                failure = ClientError(f"{method} {path} returned {response.status_code}", response)
+            if attempt < self.retries:
+                self.report.add_retry()
+                time.sleep(self.get_backoff(attempt, response))
+        raise failure
+
+    def get_backoff(self, attempt, response=None):
+        """
+        Return the seconds to wait before the next attempt, honoring a 'Retry-After' header
+        """
+        if response is not None:
+            try:
+                return min(float(response.headers['Retry-After']), self.max_backoff)
+            except (KeyError, ValueError):
+                pass
+        # full jitter keeps many clients from retrying at the same time
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def call(self, method, path, data=None, params=None):
+        """
+        Send a request and return the decoded response data, raise a ClientError for error responses
+        """
+        response = self.request(method, path, data, params)
+        if not response.ok:
+            raise ClientError(f"{method} {path} returned {response.status_code}: {response.text[:200]}", response)
+        return response.json()
+
+    def create_submission(self, project_slug=None, project_id=None, project_name=None, info=None):
+        """
+        Create a submission for the given project and return its id
+        """
+        data = {'info': info or {}}
+        for key, value in [('project_slug', project_slug), ('project_id', project_id), ('project_name', project_name)]:
+            if value is not None:
+                data[key] = value
+        return self.call('POST', '/api/create_submission', data)['id']
+
+    def get_references(self, project_slug, test_names):
+        """
+        Return a dict mapping the given test names to their current references
+        """
+        return self.call('POST', f'/api/get_references/{project_slug}', {'test_names': list(test_names)})['references']
+
+    def append(self, test_id, results):
+        """
+        Append result parameters to an existing test result right away, replacing the parameters with the same name
+
+        Returns the new status of the test result.
+        """
+        return self.call('PATCH', f'/api/append_test_results/{test_id}', {'results': results})['status']
+
+    def submit(self, submission_id, name, results):
+        """
+        Buffer a test result for upload
+        """
+        with self._lock:
+            if self._closed:
+                raise ClientError("The client is closed")
+            self._buffer.append({'submission_id': submission_id, 'name': name, 'results': results})
+            if len(self._buffer) >= self.batch_size:
+                self._dispatch()
+
+    def _dispatch(self):
+        # must be called with the lock held
+        while self._buffer:
+            batch = self._buffer[:self.batch_size]
+            del self._buffer[:self.batch_size]
+            future = self._executor.submit(self._upload, batch)
+            self._pending.add(future)
+            future.add_done_callback(self._pending.discard)
+
+    def _upload(self, batch):
+        try:
+            response = self.request('POST', '/api/submit_test_results', batch)
+        except ClientError as error:
+            self.report.add_failure(batch, str(error))
+            return
+        if response.ok:
+            self.report.add_success(batch)
+        else:
+            self.report.add_failure(batch, f"{response.status_code}: {response.text[:200]}")
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                self._dispatch()
+
+    def flush(self):
+        """
+        Upload all buffered results and wait until all uploads are finished
+        """
+        with self._lock:
+            self._dispatch()
+            pending = list(self._pending)
+        concurrent.futures.wait(pending)
+
+    def close(self):
+        """
+        Upload all buffered results, release the connections and return the upload report
+
+        Batches that could not be uploaded are logged to the 'dtf.client' logger.
+        """
+        with self._lock:
+            if self._closed:
+                return self.report
+            self._closed = True
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+        self._executor.shutdown(wait=True)
+        self.session.close()
+        atexit.unregister(self.close)
+        for results, error in self.report.failed:
+            logger.error("Could not upload %d results: %s", len(results), error)
+        return self.report
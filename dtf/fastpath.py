@@ -0,0 +1,141 @@
+"""
+Fast read path of the GET API endpoints
+
+The rows of the endpoints returning many rows are fetched with '.values()' and turned into the representation of \
+    the serializers by plain functions, without instantiating serializers and fields per row. JSON responses are
+    encoded with orjson if it is installed, and with the json module of the standard library otherwise. The decoded
+    output is identical to the output of the serializers, which is checked by the tests.
+
+All GET endpoints returning objects accept the comma separated 'fields' and 'exclude' query parameters. Only the \
+    columns of the selected fields are read from the database.
+"""
+
+import json
+
+from django.http import HttpResponse
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from dtf.instrumentation import timer
+from dtf.references import get_reference_values, resolve_parameter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# output fields of the serializers, in the same order
+PROJECT_FIELDS = ['id', 'name', 'slug']
+SUBMISSION_FIELDS = ['id', 'project_id', 'created', 'updated', 'info']
+TEST_RESULT_FIELDS = ['name', 'results', 'id', 'first_submitted', 'last_updated', 'submission_id', 'status']
+TEST_REFERENCE_FIELDS = ['id', 'test_name', 'references', 'project_id']
+REFERENCE_VALUE_FIELDS = ['id', 'test_name', 'parameter', 'reference', 'valid_from']
+
+# model fields of the output fields, which differ in name
+TEST_REFERENCE_COLUMNS = {'project_id': 'project'}
+REFERENCE_VALUE_COLUMNS = {'reference': ['data', 'ref_id']}
+
+# formats datetimes exactly like the DateTimeFields of the serializers
+DATETIME_FIELD = serializers.DateTimeField()
+
+def get_fieldset(request, available):
+    """
+    Return the fields out of 'available' selected by the 'fields' and 'exclude' query parameters, in the order of \
+        'available'
+
+    Raises a ValidationError for unknown fields and if no field is left.
+    """
+    fields = available
+    for parameter in ['fields', 'exclude']:
+        if parameter not in request.query_params:
+            continue
+        requested = [field.strip() for field in request.query_params[parameter].split(',') if field.strip()]
+        unknown = [field for field in requested if field not in available]
+        if unknown:
+            raise serializers.ValidationError({parameter:
+                f"Unknown fields {', '.join(unknown)}, available are {', '.join(available)}"})
+        if parameter == 'fields':
+            fields = [field for field in fields if field in requested]
+        else:
+            fields = [field for field in fields if field not in requested]
+    if not fields:
+        raise serializers.ValidationError({'fields': "No fields selected"})
+    return fields
+
+def get_columns(fields, columns):
+    """
+    Return the model fields of the output fields, for '.only()' and '.values()'
+    """
+    result = []
+    for field in fields:
+        column = columns.get(field, field)
+        result.extend(column if isinstance(column, list) else [column])
+    return result
+
+def format_datetime(value):
+    return DATETIME_FIELD.to_representation(value) if value is not None else None
+
+def dumps(data):
+    """
+    Encode the data to compact UTF-8 JSON, like the JSONRenderer
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            # e.g. integers of more than 64 bits
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), allow_nan=False).encode()
+
+def json_response(request, data, status=200):
+    """
+    Return the data encoded by dumps, or as DRF Response if the client negotiated another format than JSON
+    """
+    if request.accepted_renderer.format != 'json':
+        return Response(data, status)
+    with timer('serializer'):
+        body = dumps(data)
+    return HttpResponse(body, status=status, content_type='application/json')
+
+def submission_rows(rows):
+    """
+    Turn rows of SUBMISSION_FIELDS values into their representation, in place
+    """
+    with timer('serializer'):
+        for row in rows:
+            for field in ['created', 'updated']:
+                if field in row:
+                    row[field] = format_datetime(row[field])
+    return rows
+
+def test_result_rows(rows, using='default'):
+    """
+    Turn rows of TEST_RESULT_FIELDS values into the representation of the TestResultSerializer, in place
+
+    The 'reference_id' of every result parameter is replaced by its 'reference'.
+    """
+    ids = [parameter['reference_id'] for row in rows for parameter in row.get('results') or []
+           if 'reference_id' in parameter]
+    values = get_reference_values(ids, using) if ids else {}
+    with timer('serializer'):
+        for row in rows:
+            for field in ['first_submitted', 'last_updated']:
+                if field in row:
+                    row[field] = format_datetime(row[field])
+            if ids and row.get('results'):
+                row['results'] = [resolve_parameter(parameter, values) for parameter in row['results']]
+    return rows
+
+def reference_value_rows(rows, fields=REFERENCE_VALUE_FIELDS):
+    """
+    Turn rows of the columns of the fields into the representation of the ReferenceValueSerializer
+    """
+    with timer('serializer'):
+        result = []
+        for row in rows:
+            if 'reference' in fields:
+                row['reference'] = {**row.pop('data'), 'ref_id': row.pop('ref_id')}
+            if 'valid_from' in fields:
+                row['valid_from'] = format_datetime(row['valid_from'])
+            result.append({field: row[field] for field in fields})
+        return result
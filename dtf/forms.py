@@ -17,4 +17,5 @@ class ProjectSettingsForm(forms.ModelForm):
 
     class Meta:
         model = Project
-        fields = ['name', 'slug']
+        fields = ['name', 'slug', 'retention_max_submissions', 'retention_max_days',
+                  'rate_limit_per_minute', 'rate_limit_burst', 'client_rate_limit_per_minute']
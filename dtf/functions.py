@@ -1,4 +1,6 @@
-from dtf.models import Project, TestReference
+from dtf.models import TestCase, TestReference
+from dtf.metrics import CHECK_RESULT_STRUCTURE_SECONDS
+from dtf.project_cache import get_project
 
 def result_structure_is_valid(test_result_data):
     """
@@ -19,27 +21,57 @@ def get_default_margin(valuetype):
         return 0
     return None
 
-def check_result_structure(results, test_name, submission):
+def get_test_reference(project, test_name, using='default'):
+    """
+    Return the TestReference of a test with its TestCase, creating both if needed
+
+    The reference is found through the unique name of its test case, joined by the integer key.
+    """
+    test_reference = TestReference.objects.using(using).select_related('test_case').filter(
+        test_case__project=project,
+        test_case__name=test_name
+    ).first()
+    if test_reference is None:
+        test_case, _ = TestCase.objects.using(using).get_or_create(project=project, name=test_name)
+        test_reference, _ = TestReference.objects.using(using).get_or_create(
+            test_case=test_case,
+            defaults={'project': project, 'test_name': test_name}
+        )
+    return test_reference
+
+@CHECK_RESULT_STRUCTURE_SECONDS.time()
+def check_result_structure(results, current_reference):
+    """
+    Check the result parameters of a test and fill in their defaults from the given TestReference of the test
+    """
     errors = ["Format in 'results' is not valid:"]
     if not isinstance(results, list):
         errors.append("'results' field is not a list")
         return None, errors
 
-    current_reference, _ = TestReference.objects.get_or_create(
-            project=submission.project,
-            test_name=test_name
-        )
-    
     for r in results:
         if not result_structure_is_valid(r):
             errors.append(f"field {r} does not match wanted format")
-        if not 'reference' in r:
-            r['reference'] = current_reference.get_reference_or_none(r['name'])
-        if not 'margin' in r:
-            r['margin'] = get_default_margin(r['valuetype'])
-        r['status'] = check_status_of_test_parameter(r.get('status'))
+        fill_result_parameter_defaults(r, current_reference)
     return results, errors
 
+def fill_result_parameter_defaults(parameter, current_reference):
+    """
+    Fill in the 'reference', 'margin' and 'status' fields of a single result parameter, if they were not supplied
+
+    The reference is taken from the given TestReference object. Only the id of the current reference version is \
+        stored in the 'reference_id' field, see dtf.references.
+    """
+    if not 'reference' in parameter and not 'reference_id' in parameter:
+        reference = current_reference.references.get(parameter['name'])
+        if isinstance(reference, int):
+            parameter['reference_id'] = reference
+        else:
+            parameter['reference'] = reference
+    if not 'margin' in parameter:
+        parameter['margin'] = get_default_margin(parameter['valuetype'])
+    parameter['status'] = check_status_of_test_parameter(parameter.get('status'))
+
 def check_status_of_test_parameter(status):
     if not status:
         return 'unknown'
@@ -79,34 +111,26 @@ def get_project_by_id(project_id):
     """
     Retrieve a project by its Id. Returns None if no project is found.
     """
-    try:
-        return Project.objects.get(pk=project_id)
-    except Project.DoesNotExist:
-        return None
+    return get_project('id', project_id)
 
 def get_project_by_name(project_name):
     """
     Retrieve a project by its name. Returns None if no project is found or multiple projects with the same name exist.
     """
-    try:
-        return Project.objects.get(name=project_name)
-    except Project.DoesNotExist:
-        return None
-    except Project.MultipleObjectsReturned:
-        return None
+    return get_project('name', project_name)
 
 def get_project_by_slug(project_slug):
     """
     Retrieve a project by its slug. Returns None if no project is found.
     """
-    try:
-        return Project.objects.get(slug=project_slug)
-    except Project.DoesNotExist:
-        return None
+    return get_project('slug', project_slug)
 
 def get_project_from_data(data):
     """
     Get a project from json data posted to the API
+
+    Projects always live in the default database, use 'dtf.routers.get_project_database' to get the database \
+        of its submissions, test results and references. The projects are cached, see dtf.project_cache
     """
     if 'project_id' in data:
         return get_project_by_id(data['project_id'])
@@ -0,0 +1,131 @@
+"""
+Idempotency keys for the POST, PUT and PATCH API endpoints
+
+Clients can send an 'Idempotency-Key' header with a unique value, e.g. a random UUID, per logical request. The first
+request with a key is handled and its response is stored. Repeating the request with the same key returns the stored
+response with the 'Idempotent-Replayed: true' header, without handling the request again. So requests can be retried
+without creating duplicate submissions or test results.
+
+A key that is reused for a different request is rejected with status 422. A repeated request arriving while the first
+one is still handled is rejected with status 409 and should be retried later. Server errors are not stored, the key is
+released again, so the request can be retried with the same key. A key whose request did not finish within
+PENDING_KEY_TIMEOUT seconds, e.g. because the worker was killed, is given to the next request with that key.
+Keys expire after DTF_IDEMPOTENCY_KEY_TTL seconds and are deleted by the 'prune_idempotency_keys' management command.
+
+The key is claimed and its response stored in short transactions of their own. The request is handled outside of
+them, so requests with keys do not hold the write lock of the default database while they run, and the changes of
+requests to sharded projects are not made in the transaction of the key.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from dtf.models import IdempotencyKey
+
+logger = logging.getLogger('dtf.idempotency')
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+
+# seconds after which a key without a response is considered abandoned
+PENDING_KEY_TIMEOUT = 10 * 60
+
+# responses with these status codes are not stored, the request may succeed when it is repeated
+TRANSIENT_STATUS_CODES = [status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS]
+
+def get_expiry():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'DTF_IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+def get_fingerprint(request):
+    data = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f"{request.method} {request.path}\n{data}".encode()).hexdigest()
+
+def claim_key(key, fingerprint):
+    """
+    Create the IdempotencyKey for a new request, or return the stored one if the key was already used
+
+    Returns a (idempotency_key, created) tuple. Expired keys are replaced, and abandoned keys without a response \
+        are taken over.
+    """
+    with transaction.atomic(using='default'):
+        IdempotencyKey.objects.filter(key=key, created__lt=get_expiry()).delete()
+        try:
+            with transaction.atomic(using='default'):
+                return IdempotencyKey.objects.create(key=key, fingerprint=fingerprint), True
+        except IntegrityError:
+            idempotency_key = IdempotencyKey.objects.get(key=key)
+        pending_since = timezone.now() - timedelta(seconds=PENDING_KEY_TIMEOUT)
+        if idempotency_key.status_code is None and idempotency_key.created < pending_since:
+            idempotency_key.fingerprint = fingerprint
+            idempotency_key.created = timezone.now()
+            idempotency_key.save(update_fields=['fingerprint', 'created'])
+            return idempotency_key, True
+        return idempotency_key, False
+
+def release_key(idempotency_key):
+    """
+    Delete the key of a request that failed, so it can be retried with the same key
+    """
+    try:
+        IdempotencyKey.objects.filter(pk=idempotency_key.pk, status_code=None).delete()
+    except Exception:
+        # the key is taken over after PENDING_KEY_TIMEOUT
+        logger.exception("Could not release the idempotency key %s", idempotency_key.key)
+
+def idempotent(view):
+    """
+    Decorator for API views, which stores the response of requests with an 'Idempotency-Key' header \
+        and returns it for repeated requests
+
+    Must be applied below the 'api_view' decorator.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"error":f"The {IDEMPOTENCY_KEY_HEADER} is longer than 255 characters"},
+                status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = get_fingerprint(request)
+        idempotency_key, created = claim_key(key, fingerprint)
+        if not created:
+            if idempotency_key.fingerprint != fingerprint:
+                return Response({"error":f"The {IDEMPOTENCY_KEY_HEADER} was already used for another request"},
+                    status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if idempotency_key.status_code is None:
+                return Response({"error":"A request with this key is still being handled"},
+                    status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+            return Response(idempotency_key.response, idempotency_key.status_code,
+                headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            release_key(idempotency_key)
+            raise
+        if response.status_code >= 500 or response.status_code in TRANSIENT_STATUS_CODES:
+            release_key(idempotency_key)
+            return response
+        IdempotencyKey.objects.filter(pk=idempotency_key.pk).update(
+            status_code=response.status_code, response=response.data)
+        return response
+    return wrapper
+
+def delete_expired_keys():
+    """
+    Delete all expired idempotency keys and return their number
+    """
+    count, _ = IdempotencyKey.objects.filter(created__lt=get_expiry()).delete()
+    return count
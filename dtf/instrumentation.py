@@ -0,0 +1,99 @@
+"""
+Per-request instrumentation
+
+While a request is instrumented, the number and duration of the SQL queries as well as the time spent in named
+sections, like serializers and template rendering, are collected. Collection is enabled by the
+'ServerTimingMiddleware' for sampled requests only. Outside of an instrumented request, the timers do nothing.
+"""
+
+import threading
+import time
+
+from contextlib import contextmanager
+
+from django import shortcuts
+
+_state = threading.local()
+
+class RequestMetrics:
+    """
+    Metrics collected during a single request
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.timers = {}
+        self.active = set()
+
+    def query_wrapper(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper, see https://docs.djangoproject.com/en/3.1/topics/db/instrumentation/
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    def add_time(self, name, duration):
+        self.timers[name] = self.timers.get(name, 0.0) + duration
+
+    def as_dict(self):
+        data = {
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 3),
+        }
+        for name, duration in self.timers.items():
+            data[f"{name}_ms"] = round(duration * 1000, 3)
+        return data
+
+    def server_timing(self, total):
+        """
+        Value of the 'Server-Timing' header, see https://www.w3.org/TR/server-timing/
+        """
+        metrics = [f'db;dur={self.db_time * 1000:.3f};desc="{self.queries} queries"']
+        for name, duration in self.timers.items():
+            metrics.append(f"{name};dur={duration * 1000:.3f}")
+        metrics.append(f"total;dur={total * 1000:.3f}")
+        return ', '.join(metrics)
+
+def start_request():
+    _state.metrics = RequestMetrics()
+    return _state.metrics
+
+def end_request():
+    _state.metrics = None
+
+def current_metrics():
+    """
+    Return the metrics of the current request, or None if the request is not instrumented
+    """
+    return getattr(_state, 'metrics', None)
+
+@contextmanager
+def timer(name):
+    """
+    Add the time spent in the block to the timer with the given name
+
+    Nested blocks with the same name are only counted once
+    """
+    metrics = current_metrics()
+    if metrics is None or name in metrics.active:
+        yield
+        return
+    metrics.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_time(name, time.perf_counter() - start)
+        metrics.active.discard(name)
+
+def render(request, template_name, context=None, *args, **kwargs):
+    """
+    Same as django.shortcuts.render, but the rendering time is recorded in the 'template' timer
+    """
+    with timer('template'):
+        return shortcuts.render(request, template_name, context, *args, **kwargs)
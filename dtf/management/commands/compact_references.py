@@ -0,0 +1,111 @@
+"""
+Convert copied reference values into pointers to reference versions
+
+Before references were stored as immutable ReferenceValue versions, the reference value was copied into the
+references of a TestReference and into every result parameter. This command creates one version for every distinct
+copied reference and replaces the copies by its id, see dtf.references. The API output does not change.
+Rows that are already converted are skipped, so the command can be run repeatedly.
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from dtf.models import TestResult, TestReference, ReferenceValue
+from dtf.routers import get_all_databases
+
+class Command(BaseCommand):
+    help = "Replace the reference values copied into references and test results by pointers to reference versions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+            help="Number of rows converted per transaction")
+
+    def handle(self, *args, **options):
+        for database in get_all_databases():
+            self.versions = {}
+            for value in ReferenceValue.objects.using(database).order_by('id').iterator():
+                key, _ = self.version_key(value.project_id, value.test_name, value.parameter, value.as_reference())
+                self.versions.setdefault(key, value.id)
+
+            self.saved_bytes = 0
+            reference_count = self.compact(TestReference.objects.using(database), database,
+                options['chunk_size'], self.compact_test_reference, 'references')
+            test_count = self.compact(
+                TestResult.objects.using(database).annotate(submission_project_id=F('submission__project_id')),
+                database, options['chunk_size'], self.compact_test_result, 'results')
+            self.stdout.write(
+                f"{database}: compacted {reference_count} references and {test_count} test results, "
+                f"saved {self.saved_bytes} bytes of JSON")
+
+    def compact(self, rows, using, chunk_size, convert, field):
+        """
+        Convert the given rows in chunks, 'convert' changes a row in place and returns whether it changed
+        """
+        last_id = 0
+        count = 0
+        while True:
+            chunk = list(rows.filter(id__gt=last_id).order_by('id')[:chunk_size])
+            if not chunk:
+                return count
+            with transaction.atomic(using=using):
+                changed = []
+                for row in chunk:
+                    size = len(json.dumps(getattr(row, field)))
+                    if convert(row, using):
+                        self.saved_bytes += size - len(json.dumps(getattr(row, field)))
+                        changed.append(row)
+                if changed:
+                    rows.model.objects.using(using).bulk_update(changed, [field])
+            last_id = chunk[-1].id
+            count += len(changed)
+
+    @staticmethod
+    def version_key(project_id, test_name, parameter, reference):
+        data = {key: value for key, value in reference.items() if key != 'ref_id'}
+        return (project_id, test_name, parameter, reference.get('ref_id'), json.dumps(data, sort_keys=True)), data
+
+    def get_version_id(self, using, project_id, test_name, parameter, reference):
+        key, data = self.version_key(project_id, test_name, parameter, reference)
+        if key not in self.versions:
+            # the time the reference was set is unknown, the referenced test was submitted before
+            valid_from = TestResult.objects.using(using).filter(
+                id=reference.get('ref_id')).values_list('first_submitted', flat=True).first()
+            self.versions[key] = ReferenceValue.objects.using(using).create(
+                project_id=project_id,
+                test_name=test_name,
+                parameter=parameter,
+                data=data,
+                ref_id=reference.get('ref_id'),
+                valid_from=valid_from or timezone.now()).id
+        return self.versions[key]
+
+    def compact_test_reference(self, test_reference, using):
+        changed = False
+        for parameter, reference in test_reference.references.items():
+            if isinstance(reference, dict):
+                test_reference.references[parameter] = self.get_version_id(
+                    using, test_reference.project_id, test_reference.test_name, parameter, reference)
+                changed = True
+        return changed
+
+    def compact_test_result(self, test_result, using):
+        changed = False
+        results = []
+        for parameter in test_result.results or []:
+            reference = parameter.get('reference')
+            # only references taken from a TestReference carry a 'ref_id', explicitly submitted ones are kept
+            if isinstance(reference, dict) and 'ref_id' in reference:
+                version_id = self.get_version_id(
+                    using, test_result.submission_project_id, test_result.name, parameter['name'], reference)
+                parameter = {
+                    ('reference_id' if key == 'reference' else key): (version_id if key == 'reference' else value)
+                    for key, value in parameter.items()
+                }
+                changed = True
+            results.append(parameter)
+        test_result.results = results
+        return changed
@@ -0,0 +1,89 @@
+"""
+Benchmark the ingestion and read paths on synthetic data
+"""
+
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from dtf.benchmark import SyntheticDataGenerator, BenchmarkRunner, VALUE_TYPES, FORMATS
+from dtf.benchmark import get_codecs, run_codec_benchmarks
+
+class Command(BaseCommand):
+    help = ("Run the ingestion and read benchmarks on synthetic data and print the results as JSON. "
+            "The benchmarks run on a temporary test database, the configured database is not touched.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic data generator")
+        parser.add_argument('--projects', type=int, default=1, help="Number of projects")
+        parser.add_argument('--submissions', type=int, default=5, help="Number of submissions per project")
+        parser.add_argument('--tests', type=int, default=50, help="Number of tests per submission")
+        parser.add_argument('--parameters', type=int, default=5, help="Number of parameters per test")
+        parser.add_argument('--value-types', default='integer,float',
+            help=f"Comma separated valuetypes of the parameters, out of {', '.join(VALUE_TYPES)}")
+        parser.add_argument('--list-length', type=int, default=100, help="Length of 'list' values")
+        parser.add_argument('--image-size', type=int, default=1024, help="Size of 'image' values in bytes")
+        parser.add_argument('--repeat', type=int, default=20, help="Number of calls of every read benchmark")
+        parser.add_argument('--format', choices=list(FORMATS), default='json',
+            help="Format of the request and response bodies of the API calls")
+        parser.add_argument('--output', help="Write the results to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        value_types = options['value_types'].split(',')
+        unknown = set(value_types) - set(VALUE_TYPES)
+        if unknown:
+            raise CommandError(f"Unknown valuetypes: {', '.join(sorted(unknown))}")
+        if options['format'] not in get_codecs():
+            raise CommandError(f"The {options['format']} format is not available, install the msgpack package")
+
+        generator = SyntheticDataGenerator(
+            seed=options['seed'],
+            parameters=options['parameters'],
+            value_types=value_types,
+            list_length=options['list_length'],
+            image_size=options['image_size'])
+        runner = BenchmarkRunner(
+            generator,
+            projects=options['projects'],
+            submissions=options['submissions'],
+            tests=options['tests'],
+            repeat=options['repeat'],
+            format=options['format'])
+
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            benchmarks = runner.run()
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+        # a submission worth of test results, encoded and decoded in every format. Generated after the runs, so the
+        # data of the API benchmarks does not depend on it
+        codecs = run_codec_benchmarks(
+            [generator.test_result(1, t) for t in range(options['tests'])],
+            repeat=options['repeat'])
+
+        config = {key: options[key] for key in [
+            'seed', 'projects', 'submissions', 'tests', 'parameters', 'list_length', 'image_size', 'repeat', 'format']}
+        config['value_types'] = value_types
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'config': config,
+            'benchmarks': benchmarks,
+            'codecs': codecs,
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,90 @@
+"""
+Compare the sustained write throughput of the default SQLite backend with the DTF SQLite backend
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction, OperationalError
+
+from dtf.functions import get_test_reference
+from dtf.models import Project, Submission, TestResult
+
+PROFILES = {
+    'default': 'django.db.backends.sqlite3',
+    'dtf': 'dtf.backends.sqlite3',
+}
+
+class Command(BaseCommand):
+    help = ("Run concurrent writers against a temporary SQLite file with the default and the DTF SQLite backend "
+            "and report the sustained writes per second and the number of 'database is locked' errors")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="Number of concurrent writer threads")
+        parser.add_argument('--duration', type=float, default=5, help="Duration of every run in seconds")
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        report = {}
+        try:
+            for profile, engine in PROFILES.items():
+                alias = f"dtf_stress_{profile}"
+                connections.databases[alias] = {
+                    'ENGINE': engine,
+                    'NAME': os.path.join(directory, f"{profile}.sqlite3"),
+                }
+                try:
+                    call_command('migrate', database=alias, verbosity=0)
+                    report[profile] = self.run_writers(alias, options['writers'], options['duration'])
+                finally:
+                    connections[alias].close()
+                    del connections.databases[alias]
+        finally:
+            shutil.rmtree(directory)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run_writers(self, alias, writer_count, duration):
+        project = Project.objects.using(alias).create(name="Stress", slug="stress")
+        submission = Submission.objects.using(alias).create(project=project)
+        writes = [0] * writer_count
+        errors = [0] * writer_count
+        deadline = time.monotonic() + duration
+
+        def writer(index):
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        # same write pattern as 'api/submit_test_results'
+                        with transaction.atomic(using=alias):
+                            test_reference = get_test_reference(project, f"TEST_{index}", alias)
+                            TestResult.objects.using(alias).create(
+                                name=f"TEST_{index}", submission=submission, test_case=test_reference.test_case,
+                                results=[
+                                    {"name": "parameter1", "value": writes[index], "valuetype": "integer",
+                                     "status": "successful"}
+                                ])
+                        writes[index] += 1
+                    except OperationalError:
+                        errors[index] += 1
+            finally:
+                connections[alias].close()
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(writer_count)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        return {
+            'writes': sum(writes),
+            'writes_per_s': sum(writes) / elapsed,
+            'locked_errors': sum(errors),
+        }
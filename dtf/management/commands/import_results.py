@@ -0,0 +1,349 @@
+"""
+Bulk import of historical test results from JSON-lines dumps
+
+Every line of a dump describes one submission, using the same fields the API accepts:
+
+.. code-block:: json
+
+    {
+        "project_slug": "my-project",
+        "project_name": "My Project",
+        "info": {"branch": "master"},
+        "created": "2020-12-01T10:00:00+00:00",
+        "tests": [
+            {
+                "name": "UNIT_TEST",
+                "results": [{"name": "parameter1", "value": 5, "valuetype": "integer"}],
+                "references": {"parameter1": {"value": 5}}
+            }
+        ]
+    }
+
+A project is looked up by 'project_id', 'project_slug' or 'project_name', like in the API. If it does not exist and both a slug and a name are given, it is created.
+The optional 'references' of a test are applied as if 'api/update_references' was called with the id of that test, so later tests in the dump see them as their current reference.
+
+Files ending in '.gz' are read as gzip compressed, so archives written by the 'prune_submissions' command can be restored.
+The importer allocates primary keys itself and therefore expects to be the only writer while it runs.
+"""
+
+import gzip
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from dtf.models import Project, TestCase, Submission, TestResult, TestReference, ReferenceValue
+from dtf.functions import result_structure_is_valid
+from dtf.functions import fill_result_parameter_defaults
+from dtf.functions import get_project_from_data
+from dtf.metrics import ROWS_WRITTEN
+from dtf.routers import get_project_database, get_shard_id_base, is_shard
+from dtf.references import forget_reference_values
+from dtf.submission_info import index_submissions
+
+# pragmas used for the load when --fast-sqlite is given. They trade durability for speed, a crash during
+# the import can leave the database in an inconsistent state
+FAST_SQLITE_PRAGMAS = {
+    'synchronous': 'OFF',
+    'journal_mode': 'MEMORY',
+    'temp_store': 'MEMORY',
+    'cache_size': '-262144',
+}
+
+IMPORTED_TABLES = [
+    Submission._meta.db_table,
+    TestResult._meta.db_table,
+    TestReference._meta.db_table,
+    ReferenceValue._meta.db_table,
+]
+
+class Command(BaseCommand):
+    help = "Import projects, submissions, test results and references from JSON-lines dumps"
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help="JSON-lines files to import")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+            help="Number of submissions written per transaction")
+        parser.add_argument('--defer-indexes', action='store_true',
+            help="Drop the indexes of the imported tables during the load and rebuild them afterwards (SQLite only)")
+        parser.add_argument('--fast-sqlite', action='store_true',
+            help="Tune SQLite pragmas for the load. Not crash safe")
+
+    def handle(self, *args, **options):
+        self.projects = {}
+        self.test_cases = {}
+        self.references = {}
+        self.submission_count = 0
+        self.test_count = 0
+
+        is_sqlite = connection.vendor == 'sqlite'
+        if (options['defer_indexes'] or options['fast_sqlite']) and not is_sqlite:
+            raise CommandError("--defer-indexes and --fast-sqlite are only supported with SQLite")
+        if options['fast_sqlite'] and connection.in_atomic_block:
+            self.stderr.write("Cannot change SQLite pragmas inside a transaction, ignoring --fast-sqlite")
+            options['fast_sqlite'] = False
+        self.fast_sqlite = options['fast_sqlite']
+        self.defer_indexes = options['defer_indexes']
+        # previous pragmas and dropped indexes of every database written to, the shards are prepared when the
+        # first record of one of their projects is imported
+        self.prepared_databases = {}
+
+        start = time.perf_counter()
+        try:
+            for file_name in options['files']:
+                self.import_file(file_name, options['chunk_size'])
+        finally:
+            for using, (previous_pragmas, deferred_indexes) in self.prepared_databases.items():
+                if deferred_indexes:
+                    self.restore_indexes(using, deferred_indexes)
+                if previous_pragmas:
+                    self.set_pragmas(using, previous_pragmas)
+
+        duration = time.perf_counter() - start
+        rows = self.submission_count + self.test_count
+        self.stdout.write(
+            f"Imported {self.submission_count} submissions and {self.test_count} test results "
+            f"in {duration:.2f}s ({rows / max(duration, 1e-9):.0f} rows/s)"
+        )
+
+    def import_file(self, file_name, chunk_size):
+        chunk = []
+        opener = gzip.open if file_name.endswith('.gz') else open
+        with opener(file_name, 'rt') as dump:
+            for line_number, line in enumerate(dump, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    chunk.append(json.loads(line))
+                except json.JSONDecodeError as error:
+                    raise CommandError(f"{file_name}:{line_number}: invalid JSON: {error}")
+                if len(chunk) >= chunk_size:
+                    self.import_chunk(chunk)
+                    chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+
+    def import_chunk(self, records):
+        records_by_database = {}
+        for record in records:
+            project = self.get_project(record)
+            records_by_database.setdefault(get_project_database(project), []).append((project, record))
+        for database, project_records in records_by_database.items():
+            self.prepare_database(database)
+            self.import_records(project_records, database)
+
+    def prepare_database(self, using):
+        """
+        Apply --fast-sqlite and --defer-indexes to the database, once per database
+        """
+        if using in self.prepared_databases:
+            return
+        previous_pragmas = self.set_pragmas(using, FAST_SQLITE_PRAGMAS) if self.fast_sqlite else {}
+        deferred_indexes = self.drop_indexes(using) if self.defer_indexes else []
+        self.prepared_databases[using] = (previous_pragmas, deferred_indexes)
+
+    def import_records(self, project_records, using):
+        with transaction.atomic(using=using):
+            next_test_case_id = self.next_id(TestCase, using)
+            next_submission_id = self.next_id(Submission, using)
+            next_test_id = self.next_id(TestResult, using)
+            next_reference_id = self.next_id(TestReference, using)
+            next_value_id = self.next_id(ReferenceValue, using)
+
+            new_test_cases = []
+            submissions = []
+            test_results = []
+            timestamps = []
+            new_references = []
+            new_values = []
+            changed_references = {}
+
+            for project, record in project_records:
+                submission = Submission(
+                    id=next_submission_id,
+                    project=project,
+                    info=record.get('info') or {}
+                )
+                next_submission_id += 1
+                submissions.append(submission)
+                if 'created' in record or 'updated' in record:
+                    timestamps.append((submission, record))
+                # references set by the tests of the submission are valid from the time of the submission
+                valid_from = parse_datetime(record.get('created') or record.get('updated') or '') or timezone.now()
+
+                for test in record.get('tests', []):
+                    reference = self.references.get((project.id, test['name']))
+                    if reference is None:
+                        test_case = self.test_cases.get((project.id, test['name']))
+                        if test_case is None:
+                            test_case = TestCase(id=next_test_case_id, project=project, name=test['name'])
+                            next_test_case_id += 1
+                            self.test_cases[(project.id, test['name'])] = test_case
+                            new_test_cases.append(test_case)
+                        reference = TestReference(id=next_reference_id, project=project, test_name=test['name'],
+                            test_case_id=test_case.id)
+                        next_reference_id += 1
+                        self.references[(project.id, test['name'])] = reference
+                        new_references.append(reference)
+
+                    results = test['results']
+                    if not isinstance(results, list):
+                        raise CommandError(f"'results' of test {test['name']} is not a list")
+                    for parameter in results:
+                        if not result_structure_is_valid(parameter):
+                            raise CommandError(f"field {parameter} does not match wanted format")
+                        fill_result_parameter_defaults(parameter, reference)
+
+                    test_result = TestResult(
+                        id=next_test_id,
+                        name=test['name'],
+                        test_case_id=reference.test_case_id,
+                        submission=submission,
+                        results=results
+                    )
+                    next_test_id += 1
+                    test_result.calculate_status()
+                    test_results.append(test_result)
+
+                    if test.get('references'):
+                        # same as TestReference.update_references, with ids allocated for bulk_create
+                        for parameter, data in test['references'].items():
+                            new_values.append(ReferenceValue(id=next_value_id, project=project,
+                                test_name=test['name'], test_case_id=reference.test_case_id, parameter=parameter,
+                                data=data, ref_id=test_result.id, valid_from=valid_from))
+                            reference.references[parameter] = next_value_id
+                            next_value_id += 1
+                        if reference.pk not in changed_references:
+                            changed_references[reference.pk] = reference
+
+            TestCase.objects.using(using).bulk_create(new_test_cases)
+            Submission.objects.using(using).bulk_create(submissions)
+            index_submissions(submissions, using)
+            TestResult.objects.using(using).bulk_create(test_results)
+            TestReference.objects.using(using).bulk_create(new_references)
+            ReferenceValue.objects.using(using).bulk_create(new_values)
+
+            for reference in new_references:
+                changed_references.pop(reference.pk, None)
+            if changed_references:
+                TestReference.objects.using(using).bulk_update(changed_references.values(), ['references'])
+
+            if timestamps:
+                self.apply_timestamps(timestamps, using)
+            self.reserve_ids(using, {
+                TestCase: next_test_case_id - 1,
+                Submission: next_submission_id - 1,
+                TestResult: next_test_id - 1,
+                TestReference: next_reference_id - 1,
+                ReferenceValue: next_value_id - 1,
+            })
+
+        ROWS_WRITTEN.inc(len(new_test_cases), table=TestCase._meta.db_table)
+        ROWS_WRITTEN.inc(len(submissions), table=Submission._meta.db_table)
+        ROWS_WRITTEN.inc(len(test_results), table=TestResult._meta.db_table)
+        forget_reference_values([value.id for value in new_values], using)
+        ROWS_WRITTEN.inc(len(new_references), table=TestReference._meta.db_table)
+        ROWS_WRITTEN.inc(len(new_values), table=ReferenceValue._meta.db_table)
+        self.submission_count += len(submissions)
+        self.test_count += len(test_results)
+
+    def apply_timestamps(self, timestamps, using):
+        """
+        Overwrite the automatically set 'created' and 'updated' fields with the ones from the dump
+        """
+        for submission, record in timestamps:
+            created = parse_datetime(record.get('created') or record['updated'])
+            updated = parse_datetime(record.get('updated') or record['created'])
+            if created is None or updated is None:
+                raise CommandError(f"Invalid timestamp in submission {record}")
+            submission.created = created
+            submission.updated = updated
+        Submission.objects.using(using).bulk_update([s for s, _ in timestamps], ['created', 'updated'])
+
+    def get_project(self, record):
+        key = (record.get('project_id'), record.get('project_slug'), record.get('project_name'))
+        project = self.projects.get(key)
+        if project is not None:
+            return project
+
+        project = get_project_from_data(record)
+        if project is None:
+            if not record.get('project_slug') or not record.get('project_name'):
+                raise CommandError(
+                    f"Could not get a corresponding project for {key}. "
+                    "Provide a project_slug and project_name to create it")
+            project = Project.objects.create(name=record['project_name'], slug=record['project_slug'])
+
+        database = get_project_database(project)
+        for test_case in TestCase.objects.using(database).filter(project=project):
+            self.test_cases[(project.id, test_case.name)] = test_case
+        for reference in TestReference.objects.using(database).filter(project=project):
+            self.references[(project.id, reference.test_name)] = reference
+        self.projects[key] = project
+        return project
+
+    @staticmethod
+    def next_id(model, using):
+        # the ids in a shard start at the id base of the shard, see dtf.routers
+        first_id = get_shard_id_base(using) + 1 if is_shard(using) else 1
+        max_id = model.objects.using(using).aggregate(max_id=Max('id'))['max_id'] or 0
+        # ids of deleted rows are not reused, as other processes may still cache them, e.g. the reference values
+        sequence = 0
+        if connections[using].vendor == 'sqlite':
+            with connections[using].cursor() as cursor:
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [model._meta.db_table])
+                row = cursor.fetchone()
+                sequence = row[0] if row else 0
+        return max(first_id, max_id + 1, sequence + 1)
+
+    @staticmethod
+    def reserve_ids(using, last_ids):
+        """
+        Advance the sequences of the tables past the last ids allocated by the importer, given by model
+        """
+        if connections[using].vendor != 'sqlite':
+            return
+        with connections[using].cursor() as cursor:
+            for model, max_id in last_ids.items():
+                table = model._meta.db_table
+                cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s", [max_id, table])
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                    [table, max_id, table]
+                )
+
+    @staticmethod
+    def set_pragmas(using, pragmas):
+        previous = {}
+        with connections[using].cursor() as cursor:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}")
+                previous[name] = cursor.fetchone()[0]
+                cursor.execute(f"PRAGMA {name} = {value}")
+        return previous
+
+    @staticmethod
+    def drop_indexes(using):
+        placeholders = ', '.join(['%s'] * len(IMPORTED_TABLES))
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master "
+                f"WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})",
+                IMPORTED_TABLES
+            )
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX "{name}"')
+        return indexes
+
+    @staticmethod
+    def restore_indexes(using, indexes):
+        with connections[using].cursor() as cursor:
+            for _, sql in indexes:
+                cursor.execute(sql)
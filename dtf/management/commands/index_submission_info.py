@@ -0,0 +1,22 @@
+"""
+Rebuild the index of the submission info
+"""
+
+from django.core.management.base import BaseCommand
+
+from dtf.routers import get_all_databases
+from dtf.submission_info import get_indexed_keys, reindex_submissions
+
+class Command(BaseCommand):
+    help = ("Index the info of all submissions with the keys of DTF_INDEXED_INFO_KEYS. "
+            "Run it after changing the setting.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+            help="Number of submissions indexed per transaction")
+
+    def handle(self, *args, **options):
+        keys = ', '.join(get_indexed_keys())
+        for database in get_all_databases():
+            count = reindex_submissions(database, options['chunk_size'])
+            self.stdout.write(f"{database}: indexed {count} values of the keys {keys}")
@@ -0,0 +1,167 @@
+"""
+Move a project from the default database into its own shard
+
+The test cases, submissions, test results and references of the project are copied into the shard and get new ids in the id
+range of the shard, see dtf.routers. References to test ids and reference versions in results and references are
+rewritten accordingly.
+Afterwards the project is switched to the shard and its data is removed from the default database. The default
+database stays locked for writing from the start of the copy until the removal, so the move should be done at a quiet
+time for large projects.
+"""
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from dtf.models import Project, TestCase, Submission, SubmissionInfo, TestResult, TestReference, ReferenceValue
+from dtf.routers import ensure_database, get_shard_alias, get_shard_id_base
+
+class Command(BaseCommand):
+    help = "Move the submissions, test results and references of a project into its own database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', help="Slug of the project to move")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+            help="Number of rows copied at once")
+
+    def handle(self, *args, **options):
+        project = Project.objects.using('default').filter(slug=options['project']).first()
+        if project is None:
+            raise CommandError(f"Unknown project: {options['project']}")
+        if project.database:
+            raise CommandError(f"Project {project.slug} is already stored in {project.database}")
+
+        alias = ensure_database(get_shard_alias(project.id))
+        call_command('migrate', database=alias, verbosity=0)
+        if Project.objects.using(alias).filter(pk=project.pk).exists():
+            raise CommandError(f"The shard {alias} already contains the project, remove it first")
+
+        self.id_base = get_shard_id_base(alias)
+        self.chunk_size = options['chunk_size']
+        # the write lock of the default database is held from the copy until the delete, so no submission or result
+        # of the project can be written in between and get lost. Writers wait up to their busy timeout
+        with transaction.atomic(using='default'):
+            with transaction.atomic(using=alias):
+                project.database = alias
+                project.save(using=alias, force_insert=True)
+                self.copy_rows(TestCase, alias, project, self.copy_test_case)
+                submission_count = self.copy_rows(Submission, alias, project, self.copy_submission,
+                    ['created', 'updated'])
+                self.copy_rows(SubmissionInfo, alias, project, self.copy_submission_info)
+                test_count = self.copy_rows(TestResult, alias, project, self.copy_test_result,
+                    ['first_submitted', 'last_updated'])
+                self.copy_rows(TestReference, alias, project, self.copy_test_reference)
+                self.copy_rows(ReferenceValue, alias, project, self.copy_reference_value)
+                self.reserve_ids(alias)
+
+            project.save(using='default', update_fields=['database'])
+            TestResult.objects.using('default').filter(submission__project=project).delete()
+            Submission.objects.using('default').filter(project=project).delete()
+            TestReference.objects.using('default').filter(project=project).delete()
+            ReferenceValue.objects.using('default').filter(project=project).delete()
+            TestCase.objects.using('default').filter(project=project).delete()
+
+        self.stdout.write(
+            f"Moved {submission_count} submissions and {test_count} test results of {project.slug} to {alias}")
+
+    def copy_rows(self, model, alias, project, copy, timestamp_fields=None):
+        """
+        Copy the rows of the project in chunks, 'copy' returns the copy of a single row
+        """
+        if model in [SubmissionInfo, TestResult]:
+            rows = model.objects.using('default').filter(submission__project=project)
+        else:
+            rows = model.objects.using('default').filter(project=project)
+        last_id = 0
+        count = 0
+        while True:
+            chunk = list(rows.filter(id__gt=last_id).order_by('id')[:self.chunk_size])
+            if not chunk:
+                return count
+            copies = [copy(row) for row in chunk]
+            model.objects.using(alias).bulk_create(copies)
+            if timestamp_fields:
+                # bulk_create sets the automatic timestamps to the current time, restore the original ones
+                for row, row_copy in zip(chunk, copies):
+                    for field in timestamp_fields:
+                        setattr(row_copy, field, getattr(row, field))
+                model.objects.using(alias).bulk_update(copies, timestamp_fields)
+            last_id = chunk[-1].id
+            count += len(chunk)
+
+    def shard_id(self, object_id):
+        if object_id is None or object_id >= self.id_base:
+            return object_id
+        return object_id + self.id_base
+
+    def copy_test_case(self, test_case):
+        return TestCase(id=self.shard_id(test_case.id), project_id=test_case.project_id, name=test_case.name)
+
+    def copy_submission(self, submission):
+        return Submission(id=self.shard_id(submission.id), project_id=submission.project_id, info=submission.info)
+
+    def copy_submission_info(self, submission_info):
+        return SubmissionInfo(
+            id=self.shard_id(submission_info.id),
+            submission_id=self.shard_id(submission_info.submission_id),
+            key=submission_info.key,
+            value=submission_info.value
+        )
+
+    def copy_test_result(self, test_result):
+        results = test_result.results
+        for parameter in results or []:
+            reference = parameter.get('reference')
+            if isinstance(reference, dict) and reference.get('ref_id') is not None:
+                reference['ref_id'] = self.shard_id(reference['ref_id'])
+            if 'reference_id' in parameter:
+                parameter['reference_id'] = self.shard_id(parameter['reference_id'])
+        return TestResult(
+            id=self.shard_id(test_result.id),
+            name=test_result.name,
+            test_case_id=self.shard_id(test_result.test_case_id),
+            submission_id=self.shard_id(test_result.submission_id),
+            results=results,
+            status=test_result.status
+        )
+
+    def copy_test_reference(self, test_reference):
+        references = test_reference.references
+        for name, reference in references.items():
+            if isinstance(reference, int):
+                references[name] = self.shard_id(reference)
+            elif reference.get('ref_id') is not None:
+                reference['ref_id'] = self.shard_id(reference['ref_id'])
+        return TestReference(
+            id=self.shard_id(test_reference.id),
+            project_id=test_reference.project_id,
+            test_name=test_reference.test_name,
+            test_case_id=self.shard_id(test_reference.test_case_id),
+            references=references
+        )
+
+    def copy_reference_value(self, reference_value):
+        return ReferenceValue(
+            id=self.shard_id(reference_value.id),
+            project_id=reference_value.project_id,
+            test_name=reference_value.test_name,
+            test_case_id=self.shard_id(reference_value.test_case_id),
+            parameter=reference_value.parameter,
+            data=reference_value.data,
+            ref_id=self.shard_id(reference_value.ref_id),
+            valid_from=reference_value.valid_from
+        )
+
+    def reserve_ids(self, alias):
+        """
+        Make sure new rows in the shard get ids in the id range of the shard, even if no rows were copied
+        """
+        with connections[alias].cursor() as cursor:
+            for model in [TestCase, Submission, SubmissionInfo, TestResult, TestReference, ReferenceValue]:
+                table = model._meta.db_table
+                cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s", [self.id_base, table])
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                    [table, self.id_base, table]
+                )
@@ -0,0 +1,14 @@
+"""
+Remove expired idempotency keys
+"""
+
+from django.core.management.base import BaseCommand
+
+from dtf.idempotency import delete_expired_keys
+
+class Command(BaseCommand):
+    help = "Delete the idempotency keys older than DTF_IDEMPOTENCY_KEY_TTL seconds."
+
+    def handle(self, *args, **options):
+        count = delete_expired_keys()
+        self.stdout.write(f"deleted {count} expired idempotency keys")
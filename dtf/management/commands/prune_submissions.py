@@ -0,0 +1,49 @@
+"""
+Remove submissions that are outside of the retention policy of their project
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from dtf.models import Project
+from dtf.retention import get_prunable_submission_ids, prune_project
+
+class Command(BaseCommand):
+    help = ("Delete submissions outside of the retention policy of their project. "
+            "Archived submissions can be restored with the 'import_results' command.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('projects', nargs='*', help="Slugs of the projects to prune. Defaults to all projects")
+        parser.add_argument('--chunk-size', type=int, default=100,
+            help="Number of submissions deleted per transaction")
+        parser.add_argument('--archive-dir',
+            help="Directory to write the pruned submissions to, as gzip compressed JSON-lines files")
+        parser.add_argument('--dry-run', action='store_true',
+            help="Only report how many submissions would be pruned")
+
+    def handle(self, *args, **options):
+        projects = Project.objects.order_by('id')
+        if options['projects']:
+            projects = projects.filter(slug__in=options['projects'])
+            missing = set(options['projects']) - set(projects.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f"Unknown projects: {', '.join(sorted(missing))}")
+
+        archive_dir = options['archive_dir']
+        if archive_dir and not options['dry_run']:
+            os.makedirs(archive_dir, exist_ok=True)
+
+        timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
+        for project in projects:
+            if options['dry_run']:
+                count = len(get_prunable_submission_ids(project))
+                self.stdout.write(f"{project.slug}: {count} submissions would be pruned")
+                continue
+
+            archive_path = None
+            if archive_dir:
+                archive_path = os.path.join(archive_dir, f"{project.slug}_{timestamp}.jsonl.gz")
+            count = prune_project(project, options['chunk_size'], archive_path)
+            self.stdout.write(f"{project.slug}: pruned {count} submissions")
@@ -0,0 +1,238 @@
+"""
+Metrics registry with counters and histograms, exposed in the Prometheus text format
+
+Every process collects its samples locally and periodically adds them to a shared SQLite file, so the metrics of
+all worker processes are combined without any external service. The file is set by the DTF_METRICS_DATABASE setting.
+If it is None, the metrics are only kept in the memory of the current process.
+DTF_METRICS_FLUSH_INTERVAL sets the number of seconds between two writes to the shared file.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from dtf.shared import SharedDatabase
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def sample_sort_key(sample):
+    (sample_name, label_items), _ = sample
+    # buckets are sorted by their numerical bound
+    return sample_name, tuple((name, float(value) if name == 'le' else value) for name, value in label_items)
+
+class Metric:
+    """
+    Base class of all metrics
+    """
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def sample_names(self):
+        return {self.name}
+
+    def label_items(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+class Counter(Metric):
+    """
+    Monotonically increasing value
+    """
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(self.name, self.label_items(labels), amount)
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets
+    """
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def sample_names(self):
+        return {f"{self.name}_bucket", f"{self.name}_sum", f"{self.name}_count"}
+
+    def observe(self, value, **labels):
+        label_items = self.label_items(labels)
+        samples = [
+            (f"{self.name}_sum", label_items, value),
+            (f"{self.name}_count", label_items, 1),
+        ]
+        # every bucket gets a sample, so all of them are exposed even if they are still empty
+        for bound in self.buckets:
+            samples.append((f"{self.name}_bucket", label_items + (('le', format_value(bound)),), int(value <= bound)))
+        self.registry.add_many(samples)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of the block in seconds. Can also be used as a decorator
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+class MetricsRegistry:
+    """
+    Holds all metrics and their samples
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.pending = {}
+        self.local = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.database = SharedDatabase('DTF_METRICS_DATABASE',
+            "CREATE TABLE IF NOT EXISTS samples "
+            "(name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, PRIMARY KEY (name, labels))")
+        self.pid = os.getpid()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add(self, sample_name, label_items, value):
+        self.add_many([(sample_name, label_items, value)])
+
+    def add_many(self, samples):
+        with self.lock:
+            if self.pid != os.getpid():
+                # samples of the parent process are flushed by the parent
+                self.pid = os.getpid()
+                self.pending = {}
+            for sample_name, label_items, value in samples:
+                key = (sample_name, label_items)
+                self.pending[key] = self.pending.get(key, 0) + value
+            interval = getattr(settings, 'DTF_METRICS_FLUSH_INTERVAL', 5)
+            if time.monotonic() - self.last_flush >= interval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        pending, self.pending = self.pending, {}
+        self.last_flush = time.monotonic()
+        connection = self._get_connection()
+        if connection is None:
+            for key, value in pending.items():
+                self.local[key] = self.local.get(key, 0) + value
+            return
+        with connection:
+            connection.executemany(
+                "INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+                [(name, json.dumps(labels), value) for (name, labels), value in pending.items()]
+            )
+
+    def _get_connection(self):
+        return self.database.get_connection()
+
+    def collect(self):
+        """
+        Flush the local samples and return the combined samples of all processes
+        """
+        with self.lock:
+            self._flush()
+            connection = self._get_connection()
+            if connection is None:
+                return dict(self.local)
+            rows = connection.execute("SELECT name, labels, value FROM samples").fetchall()
+        return {
+            (name, tuple(tuple(item) for item in json.loads(labels))): value
+            for name, labels, value in rows
+        }
+
+    def exposition(self):
+        """
+        Return all metrics in the Prometheus text format
+        """
+        samples = self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            sample_names = metric.sample_names()
+            for (sample_name, label_items), value in sorted(samples.items(), key=sample_sort_key):
+                if sample_name in sample_names:
+                    lines.append(f"{sample_name}{format_labels(label_items)} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """
+        Remove all samples. Mainly useful for tests
+        """
+        with self.lock:
+            self.pending = {}
+            self.local = {}
+            connection = self._get_connection()
+            if connection is not None:
+                with connection:
+                    connection.execute("DELETE FROM samples")
+
+REGISTRY = MetricsRegistry()
+
+INGESTED_TEST_RESULTS = REGISTRY.counter(
+    'dtf_ingested_test_results_total', "Number of submitted test results", ['project'])
+CHECK_RESULT_STRUCTURE_SECONDS = REGISTRY.histogram(
+    'dtf_check_result_structure_seconds', "Duration of the validation of submitted results")
+REQUEST_PAYLOAD_BYTES = REGISTRY.histogram(
+    'dtf_request_payload_bytes', "Size of the request bodies", ['view'], buckets=BYTE_BUCKETS)
+ROWS_WRITTEN = REGISTRY.counter(
+    'dtf_rows_written_total', "Number of database rows created", ['table'])
+CACHE_REQUESTS = REGISTRY.counter(
+    'dtf_cache_requests_total', "Number of cache lookups", ['cache', 'result'])
+VIEW_DURATION_SECONDS = REGISTRY.histogram(
+    'dtf_view_duration_seconds', "Duration of the request handling", ['view'])
+
+def count_created_rows(sender, instance, created, **kwargs):
+    """
+    post_save receiver counting the created rows of the DTF models
+    """
+    if created:
+        ROWS_WRITTEN.inc(table=sender._meta.db_table)
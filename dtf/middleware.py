@@ -0,0 +1,219 @@
+"""
+Middleware classes of the DTF app
+"""
+
+import cProfile
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+
+from dtf import instrumentation
+from dtf.profiling import QueryLog, StackSampler, save_profile
+from dtf.ratelimit import BUCKETS
+from dtf.metrics import REQUEST_PAYLOAD_BYTES, VIEW_DURATION_SECONDS
+
+timing_logger = logging.getLogger('dtf.timing')
+
+DEFAULT_TIMING_SAMPLE_RATE = 0.1
+
+class ServerTimingMiddleware:
+    """
+    Instruments a sample of the requests and reports the number of SQL queries, the database time, \
+        the serializer time and the template rendering time
+
+    The metrics are added to the response as 'Server-Timing' header and logged as JSON to the 'dtf.timing' logger.
+    The fraction of instrumented requests is set by the DTF_TIMING_SAMPLE_RATE setting, between 0 and 1, and is 0.1 \
+        if it is not set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, 'DTF_TIMING_SAMPLE_RATE', DEFAULT_TIMING_SAMPLE_RATE)
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return self.get_response(request)
+
+        metrics = instrumentation.start_request()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.query_wrapper))
+                response = self.get_response(request)
+        finally:
+            instrumentation.end_request()
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = metrics.server_timing(total)
+        timing_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 3),
+            **metrics.as_dict()
+        }))
+        return response
+
+class MetricsMiddleware:
+    """
+    Records the request handling duration and the request body size per view in the metrics registry
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view = request.resolver_match.view_name if request.resolver_match else 'unresolved'
+        VIEW_DURATION_SECONDS.observe(duration, view=view)
+        content_length = request.META.get('CONTENT_LENGTH')
+        if content_length:
+            REQUEST_PAYLOAD_BYTES.observe(int(content_length), view=view)
+        return response
+
+# window bits of zlib.decompressobj for the supported 'Content-Encoding' values of request bodies
+DECOMPRESSION_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+class RequestTooLarge(Exception):
+    pass
+
+def decompress_stream(stream, wbits, limit, chunk_size=64 * 1024):
+    """
+    Decompress the data read from the stream, raise RequestTooLarge as soon as the output exceeds 'limit' bytes
+    """
+    decompressor = zlib.decompressobj(wbits)
+    chunks = []
+    size = 0
+    for data in iter(lambda: stream.read(chunk_size), b''):
+        while data:
+            chunk = decompressor.decompress(data, limit + 1 - size)
+            size += len(chunk)
+            if size > limit:
+                raise RequestTooLarge()
+            chunks.append(chunk)
+            data = decompressor.unconsumed_tail
+    chunk = decompressor.flush()
+    size += len(chunk)
+    if size > limit:
+        raise RequestTooLarge()
+    if not decompressor.eof:
+        raise zlib.error("incomplete compressed data")
+    chunks.append(chunk)
+    return b''.join(chunks)
+
+class RequestDecompressionMiddleware:
+    """
+    Decompresses request bodies sent with 'Content-Encoding: gzip' or 'Content-Encoding: deflate'
+
+    The body is decompressed before the view reads it, so the DRF parsers see the plain data. To guard against
+    decompression bombs, decompression stops as soon as the output exceeds DTF_MAX_DECOMPRESSED_BODY_SIZE bytes,
+    and the request is rejected with status 413.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if not encoding or encoding == 'identity':
+            return self.get_response(request)
+        if encoding not in DECOMPRESSION_WBITS:
+            return JsonResponse({'detail': f"Unsupported content encoding '{encoding}'"}, status=415)
+
+        limit = getattr(settings, 'DTF_MAX_DECOMPRESSED_BODY_SIZE', 64 * 1024 * 1024)
+        try:
+            body = decompress_stream(request, DECOMPRESSION_WBITS[encoding], limit)
+        except RequestTooLarge:
+            return JsonResponse({'detail': f"Decompressed request body exceeds {limit} bytes"}, status=413)
+        except zlib.error as error:
+            return JsonResponse({'detail': f"Invalid {encoding} request body: {error}"}, status=400)
+
+        request._body = body
+        request._stream = io.BytesIO(body)
+        request._read_started = False
+        request.META['CONTENT_LENGTH'] = str(len(body))
+        del request.META['HTTP_CONTENT_ENCODING']
+        return self.get_response(request)
+
+class ProfilingMiddleware:
+    """
+    Profiles single requests of staff users with cProfile
+
+    Profiling is requested with the 'profile=1' query parameter, which returns the sorted profile instead of \
+        the page, or with the 'X-DTF-Profile: 1' header, which keeps the response and adds an 'X-DTF-Profile-Id' header.
+    The profile, the SQL queries of the request and collapsed stacks for flamegraphs, sampled every
+    DTF_PROFILE_SAMPLE_INTERVAL seconds, are stored in DTF_PROFILE_DIR.
+    Every user can profile at most DTF_PROFILE_RATE_LIMIT requests per DTF_PROFILE_RATE_PERIOD seconds, counted \
+        by all worker processes together, see dtf.ratelimit.
+    Must be placed after the AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested_by_parameter = request.GET.get('profile') == '1'
+        requested_by_header = request.headers.get('X-DTF-Profile') == '1'
+        if not (requested_by_parameter or requested_by_header):
+            return self.get_response(request)
+
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_active or not user.is_staff:
+            return self.get_response(request)
+
+        if not self.within_rate_limit(user):
+            response = self.get_response(request)
+            response['X-DTF-Profile'] = 'rate limited'
+            return response
+
+        profiler = cProfile.Profile()
+        query_log = QueryLog()
+        sampler = StackSampler(
+            threading.get_ident(),
+            sys._getframe(),
+            getattr(settings, 'DTF_PROFILE_SAMPLE_INTERVAL', 0.001))
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+            sampler.start()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+                sampler.stop()
+
+        directory = getattr(settings, 'DTF_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'dtf-profiles'))
+        text, profile_id = save_profile(profiler, sampler, request, query_log, directory)
+        if requested_by_parameter:
+            response = HttpResponse(text, content_type='text/plain; charset=utf-8')
+        response['X-DTF-Profile-Id'] = profile_id
+        return response
+
+    @staticmethod
+    def within_rate_limit(user):
+        # the token buckets of the ingestion rate limits are shared by all worker processes
+        limit = getattr(settings, 'DTF_PROFILE_RATE_LIMIT', 10)
+        period = getattr(settings, 'DTF_PROFILE_RATE_PERIOD', 60)
+        allowed, _ = BUCKETS.consume(f"profile:{user.pk}", limit / period, limit)
+        return allowed
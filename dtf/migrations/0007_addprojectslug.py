@@ -5,7 +5,8 @@ from django.utils.text import slugify
 
 def generate_default_project_slugs(apps, schema_editor):
     Project = apps.get_model('dtf', 'Project')
-    for project in Project.objects.all().iterator():
+    db_alias = schema_editor.connection.alias
+    for project in Project.objects.using(db_alias).all().iterator():
         project.slug = slugify(project.name)
         project.save()
 
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dtf', '0007_addprojectslug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='retention_max_days',
+            field=models.PositiveIntegerField(blank=True, help_text='Keep submissions for this many days. Leave empty to keep submissions forever.', null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='retention_max_submissions',
+            field=models.PositiveIntegerField(blank=True, help_text='Keep at most this many submissions. Leave empty to keep all submissions.', null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 04:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dtf', '0008_project_retention'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='testreference',
+            index=models.Index(fields=['project', 'test_name'], name='dtf_testref_project_5fae98_idx'),
+        ),
+    ]
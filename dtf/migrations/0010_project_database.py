@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dtf', '0009_testreference_project_test_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='database',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-19 05:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dtf', '0010_project_database'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_name', models.CharField(max_length=100)),
+                ('parameter', models.CharField(max_length=100)),
+                ('data', models.JSONField(default=dict)),
+                ('ref_id', models.IntegerField(null=True)),
+                ('project', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='dtf.project')),
+            ],
+        ),
+    ]
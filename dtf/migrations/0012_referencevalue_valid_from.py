@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 05:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dtf', '0011_referencevalue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='referencevalue',
+            name='valid_from',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='referencevalue',
+            index=models.Index(fields=['project', 'test_name', 'parameter', 'valid_from'], name='dtf_referen_project_728e05_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-19 05:34
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dtf', '0013_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='client_rate_limit_per_minute',
+            field=models.PositiveIntegerField(blank=True, help_text='Accept at most this many test results per minute from a single client. Leave empty for no limit.', null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='rate_limit_burst',
+            field=models.PositiveIntegerField(blank=True, help_text='Number of test results accepted at once, before the rate limit applies. Defaults to the limit per minute.', null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='rate_limit_per_minute',
+            field=models.PositiveIntegerField(blank=True, help_text='Accept at most this many test results per minute. Leave empty for no limit.', null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.25 on 2026-10-19 05:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dtf', '0014_project_rate_limits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestCase',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('project', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='dtf.project')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='testcase',
+            constraint=models.UniqueConstraint(fields=('project', 'name'), name='dtf_testcase_project_name'),
+        ),
+        migrations.AddField(
+            model_name='referencevalue',
+            name='test_case',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reference_values', to='dtf.testcase'),
+        ),
+        migrations.AddField(
+            model_name='testreference',
+            name='test_case',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='test_references', to='dtf.testcase'),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='test_case',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='test_results', to='dtf.testcase'),
+        ),
+        migrations.RemoveIndex(
+            model_name='referencevalue',
+            name='dtf_referen_project_728e05_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='testreference',
+            name='dtf_testref_project_5fae98_idx',
+        ),
+        migrations.AlterField(
+            model_name='testresult',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='referencevalue',
+            index=models.Index(fields=['test_case', 'parameter', 'valid_from'], name='dtf_referen_test_ca_8b4d38_idx'),
+        ),
+    ]
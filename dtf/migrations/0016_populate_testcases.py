@@ -0,0 +1,51 @@
+"""
+Create the test cases of all existing test results, references and reference versions and point the rows to them
+
+The rows are updated in chunks of ids, so a large table is not rewritten by a single statement.
+"""
+
+from django.db import migrations
+from django.db.models import Max, OuterRef, Subquery
+
+CHUNK_SIZE = 10000
+
+def populate_test_cases(apps, schema_editor):
+    using = schema_editor.connection.alias
+    TestCase = apps.get_model('dtf', 'TestCase')
+    Submission = apps.get_model('dtf', 'Submission')
+    TestResult = apps.get_model('dtf', 'TestResult')
+    TestReference = apps.get_model('dtf', 'TestReference')
+    ReferenceValue = apps.get_model('dtf', 'ReferenceValue')
+
+    names = set(TestResult.objects.using(using).exclude(submission=None).values_list(
+        'submission__project_id', 'name').distinct())
+    for model in [TestReference, ReferenceValue]:
+        names.update(model.objects.using(using).values_list('project_id', 'test_name').distinct())
+    # rows without a project keep no test case, like the rows of deleted projects
+    names = sorted((project_id, name) for project_id, name in names if project_id is not None)
+    for start in range(0, len(names), CHUNK_SIZE):
+        TestCase.objects.using(using).bulk_create([
+            TestCase(project_id=project_id, name=name) for project_id, name in names[start:start + CHUNK_SIZE]
+        ])
+
+    project_id = Submission.objects.using(using).filter(id=OuterRef(OuterRef('submission_id'))).values('project_id')
+    test_case_of_result = TestCase.objects.using(using).filter(
+        project_id=Subquery(project_id), name=OuterRef('name')).values('id')[:1]
+    test_case = TestCase.objects.using(using).filter(project_id=OuterRef('project_id'), name=OuterRef('test_name'))
+    for model, subquery in [(TestResult, test_case_of_result), (TestReference, test_case.values('id')[:1]),
+                            (ReferenceValue, test_case.values('id')[:1])]:
+        rows = model.objects.using(using)
+        max_id = rows.aggregate(max_id=Max('id'))['max_id'] or 0
+        first_id = rows.order_by('id').values_list('id', flat=True).first() or 0
+        for start in range(first_id, max_id + 1, CHUNK_SIZE):
+            rows.filter(id__gte=start, id__lt=start + CHUNK_SIZE).update(test_case_id=Subquery(subquery))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dtf', '0015_testcase'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_test_cases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-19 05:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dtf', '0016_populate_testcases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionInfo',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50)),
+                ('value', models.CharField(max_length=255)),
+                ('submission', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='info_index', to='dtf.submission')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='submissioninfo',
+            index=models.Index(fields=['key', 'value', 'submission'], name='dtf_submiss_key_31a87e_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='submissioninfo',
+            constraint=models.UniqueConstraint(fields=('submission', 'key'), name='dtf_submissioninfo_submission_key'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+"""
+Index the info of the existing submissions with the keys of DTF_INDEXED_INFO_KEYS, see dtf.submission_info
+"""
+
+import json
+
+from django.conf import settings
+from django.db import migrations
+
+CHUNK_SIZE = 1000
+
+def index_submission_info(apps, schema_editor):
+    using = schema_editor.connection.alias
+    Submission = apps.get_model('dtf', 'Submission')
+    SubmissionInfo = apps.get_model('dtf', 'SubmissionInfo')
+    keys = getattr(settings, 'DTF_INDEXED_INFO_KEYS', ['branch', 'commit', 'host'])
+
+    last_id = 0
+    while True:
+        chunk = list(Submission.objects.using(using).filter(id__gt=last_id).order_by('id').values_list('id', 'info')
+            [:CHUNK_SIZE])
+        if not chunk:
+            return
+        rows = []
+        for submission_id, info in chunk:
+            for key in keys:
+                value = info.get(key) if isinstance(info, dict) else None
+                if value is None or isinstance(value, (dict, list)):
+                    continue
+                value = value if isinstance(value, str) else json.dumps(value)
+                if len(value) <= 255:
+                    rows.append(SubmissionInfo(submission_id=submission_id, key=key, value=value))
+        SubmissionInfo.objects.using(using).bulk_create(rows)
+        last_id = chunk[-1][0]
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dtf', '0017_submissioninfo'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_submission_info, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,12 @@
 """
 Module containing all database definitions
 """
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import MinValueValidator
 from django.db import models
+from django.utils import timezone
+
+from dtf.routers import get_project_database, get_instance_database
 
 # Create your models here.
 class Project(models.Model):
@@ -13,7 +18,27 @@ class Project(models.Model):
     name = models.CharField(max_length=100, blank=False)
     slug = models.SlugField(max_length=40, blank=False, unique=True)
 
-    def get_nav_data(self, test_name, submission_id):
+    # retention policy, submissions outside of these limits get removed by the 'prune_submissions' command
+    retention_max_submissions = models.PositiveIntegerField(null=True, blank=True,
+        help_text="Keep at most this many submissions. Leave empty to keep all submissions.")
+    retention_max_days = models.PositiveIntegerField(null=True, blank=True,
+        help_text="Keep submissions for this many days. Leave empty to keep submissions forever.")
+
+    # ingestion rate limits, enforced with token buckets by dtf.ratelimit
+    rate_limit_per_minute = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1)],
+        help_text="Accept at most this many test results per minute. Leave empty for no limit.")
+    rate_limit_burst = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1)],
+        help_text="Number of test results accepted at once, before the rate limit applies. "
+                  "Defaults to the limit per minute.")
+    client_rate_limit_per_minute = models.PositiveIntegerField(null=True, blank=True,
+        validators=[MinValueValidator(1)], help_text="Accept at most this many test results per minute from a single client. "
+                  "Leave empty for no limit.")
+
+    # alias of the shard holding the submissions, test results and references of the project. Empty for the
+    # default database. Set by the 'move_project_to_shard' command
+    database = models.CharField(max_length=100, blank=True, default='')
+
+    def get_nav_data(self, test_case_id, submission_id):
         nav_data = {
             "previous": {
                 "exists": False
@@ -25,9 +50,9 @@ class Project(models.Model):
             }
         }
         
-        same_project_tests = TestResult.objects.filter(
-            name=test_name,
-            submission__project__id=self.id
+        # the test case belongs to this project, so the submissions do not have to be joined to find its results
+        same_project_tests = TestResult.objects.using(get_project_database(self)).filter(
+            test_case_id=test_case_id
         ).order_by("id")
 
         # previous test
@@ -49,7 +74,7 @@ class Project(models.Model):
             nav_data["next"]["id"] = next_test.id
 
         # most recent
-        most_recent_test = same_project_tests.order_by("-submission__id").first()
+        most_recent_test = same_project_tests.order_by("-submission_id").first()
         nav_data["most_recent"]["id"] = most_recent_test.id
         return nav_data
 
@@ -59,6 +84,33 @@ class Project(models.Model):
     class Meta:
         app_label = 'dtf'
 
+class TestCase(models.Model):
+    """
+    A test of a project, identified by its name
+
+    Test results, references and reference versions point to their test case, so finding all rows of a test \
+        compares integers instead of names. The rows keep a copy of the name for their API representation.
+    """
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True)
+    name = models.CharField(max_length=100, blank=False)
+
+    @classmethod
+    def get_id(cls, project_id, name, using='default'):
+        """
+        Return the id of the test case with the given name, creating it if needed
+        """
+        test_case, _ = cls.objects.using(using).get_or_create(project_id=project_id, name=name)
+        return test_case.id
+
+    def __str__(self):
+        return f"{self.name} [{self.project_id}]"
+
+    class Meta:
+        app_label = 'dtf'
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'name'], name='dtf_testcase_project_name'),
+        ]
+
 class Submission(models.Model):
     """
     Test results get grouped in submissions.
@@ -73,12 +125,38 @@ class Submission(models.Model):
     class Meta:
         app_label = 'dtf'
 
+class SubmissionInfo(models.Model):
+    """
+    Value of an indexed key of the info of a submission, see dtf.submission_info
+
+    The values are copied from Submission.info when the submission is created, so submissions can be looked up \
+        by their info with an index.
+    """
+    # the unique constraint starts with the submission, a separate index of the foreign key is not needed
+    submission = models.ForeignKey(Submission, on_delete=models.CASCADE, related_name="info_index", db_index=False)
+    key = models.CharField(max_length=50)
+    value = models.CharField(max_length=255)
+
+    def __str__(self):
+        return f"{self.key}={self.value} [{self.submission_id}]"
+
+    class Meta:
+        app_label = 'dtf'
+        constraints = [
+            models.UniqueConstraint(fields=['submission', 'key'], name='dtf_submissioninfo_submission_key'),
+        ]
+        indexes = [
+            # filtering by info values, covering the join to the submissions
+            models.Index(fields=['key', 'value', 'submission']),
+        ]
+
 class TestResult(models.Model):
     """
     Model to store test results and metadata
     """
-    name = models.CharField(max_length=100, blank=False, db_index=True)
+    name = models.CharField(max_length=100, blank=False)
     submission = models.ForeignKey(Submission, on_delete=models.SET_NULL, null=True, default=None, related_name="tests")
+    test_case = models.ForeignKey(TestCase, on_delete=models.SET_NULL, null=True, related_name="test_results")
     first_submitted = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
     results = models.JSONField(null=True)
@@ -110,12 +188,44 @@ class TestResult(models.Model):
                 status = result['status']
         self.status = status
 
+    def append_results(self, parameters):
+        """
+        Append the given result parameters, replacing the parameters with the same name, and update the status
+
+        The status is only calculated from all parameters if a replaced parameter could have determined it, \
+            otherwise only the given parameters are checked.
+        """
+        results = list(self.results or [])
+        positions = {parameter['name']: index for index, parameter in enumerate(results)}
+        recalculate = False
+        for parameter in parameters:
+            index = positions.get(parameter['name'])
+            if index is None:
+                positions[parameter['name']] = len(results)
+                results.append(parameter)
+            else:
+                if self.status_order[results[index]['status']] >= self.status_order[self.status]:
+                    recalculate = True
+                results[index] = parameter
+        self.results = results
+
+        if recalculate:
+            self.calculate_status()
+            return
+        for parameter in parameters:
+            if self.status_order[parameter['status']] > self.status_order[self.status]:
+                self.status = parameter['status']
+
     def save(self, *args, **kwargs):
         self.calculate_status()
+        if self.test_case_id is None and self.submission_id is not None:
+            self.test_case_id = TestCase.get_id(self.submission.project_id, self.name,
+                kwargs.get('using') or get_instance_database(self))
         super(TestResult, self).save(*args, **kwargs)
 
     def get_next_not_successful_test_id(self):
-        same_submission_tests = self.submission.tests.all()
+        same_submission_tests = TestResult.objects.using(get_instance_database(self)).filter(
+            submission_id=self.submission_id)
         not_successful = same_submission_tests.filter(
             first_submitted__gt=self.first_submitted
         ).exclude(status = "successful").order_by("first_submitted").values("id").first()
@@ -139,23 +249,39 @@ class TestReference(models.Model):
     The project is a foreign key
     The test_name is not, since the references can be from different test result \
         objects. The test name will be the same though. The test_name must not be UNIQUE constraint though, in order to allow equally named tests from multiple projects to be saved
+    References are looked up by their test case, which is created along with the reference if needed.
     """
     project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True)
     test_name = models.CharField(max_length=100, blank=False)
+    test_case = models.ForeignKey(TestCase, on_delete=models.SET_NULL, null=True, related_name="test_references")
     # maybe this should just have a testresult as a foreign key?
     references = models.JSONField(null=False, default=dict)
 
     def update_references(self, references, test_id):
-        # should not be necessary anymore since we have a default value for the references field
-        # if not self.references:
-        #     self.references = dict
-        #     return
+        """
+        Create a new ReferenceValue for every given parameter and point the references of the test to them
+        """
+        database = get_instance_database(self)
         for k, v in references.items():
-            self.references[k] = v
-            self.references[k]['ref_id'] = test_id
+            reference_value = ReferenceValue.objects.using(database).create(
+                project_id=self.project_id,
+                test_name=self.test_name,
+                test_case_id=self.test_case_id,
+                parameter=k,
+                data=v,
+                ref_id=test_id)
+            self.references[k] = reference_value.id
 
     def get_reference_or_none(self, value_name):
-        return self.references.get(value_name, None)
+        from dtf.references import resolve_references
+
+        return resolve_references({value_name: self.references.get(value_name)}, get_instance_database(self))[value_name]
+
+    def save(self, *args, **kwargs):
+        if self.test_case_id is None:
+            self.test_case_id = TestCase.get_id(self.project_id, self.test_name,
+                kwargs.get('using') or get_instance_database(self))
+        super(TestReference, self).save(*args, **kwargs)
 
     def __str__(self):
         if self.project:
@@ -163,4 +289,64 @@ class TestReference(models.Model):
         return f"{self.test_name} [None]"
 
     class Meta:
-        app_label = 'dtf'
\ No newline at end of file
+        app_label = 'dtf'
+
+class ReferenceValue(models.Model):
+    """
+    Immutable version of the reference of a single test parameter
+
+    The references of a TestReference and the results of a TestResult point to these versions by id instead of \
+        copying the reference value. Every update of a reference creates a new version, versions are never modified.
+    Together the versions form the reference history, the current versions are kept in TestReference.references.
+    """
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True)
+    test_name = models.CharField(max_length=100, blank=False)
+    test_case = models.ForeignKey(TestCase, on_delete=models.SET_NULL, null=True, related_name="reference_values")
+    parameter = models.CharField(max_length=100, blank=False)
+    # the reference as it was sent to 'api/update_references', e.g. {"value": 5}
+    data = models.JSONField(null=False, default=dict)
+    # id of the test result the reference was taken from
+    ref_id = models.IntegerField(null=True)
+    # the version is the reference of the parameter from this point in time until the next version
+    valid_from = models.DateTimeField(default=timezone.now)
+
+    def as_reference(self):
+        return {**self.data, 'ref_id': self.ref_id}
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Reference values are immutable, create a new one instead")
+        if self.test_case_id is None:
+            self.test_case_id = TestCase.get_id(self.project_id, self.test_name,
+                kwargs.get('using') or get_instance_database(self))
+        super(ReferenceValue, self).save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.test_name}.{self.parameter} [{self.pk}]"
+
+    class Meta:
+        app_label = 'dtf'
+        indexes = [
+            # point-in-time lookups of the reference history
+            models.Index(fields=['test_case', 'parameter', 'valid_from']),
+        ]
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a request sent with an 'Idempotency-Key' header, returned again when the request is repeated
+
+    A key without a response belongs to a request that is still being handled. Keys expire after \
+        DTF_IDEMPOTENCY_KEY_TTL seconds, see dtf.idempotency.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    # hash of the method, the path and the data of the request, a key must not be reused for another request
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.IntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        app_label = 'dtf'
+
+    def __str__(self):
+        return self.key
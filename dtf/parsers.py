@@ -0,0 +1,27 @@
+"""
+DRF parser classes of the DTF API
+"""
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class MessagePackParser(BaseParser):
+    """
+    Parses request bodies sent as 'application/msgpack'
+
+    Requires the optional msgpack package.
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if msgpack is None:
+            raise ParseError("MessagePack is not supported, the msgpack package is not installed")
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as error:
+            raise ParseError(f"MessagePack parse error - {error}")
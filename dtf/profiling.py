@@ -0,0 +1,95 @@
+"""
+Helpers to profile single requests with cProfile
+
+A profile is stored as a pstats dump, as text sorted by cumulative time together with the SQL queries of the request,
+and as sampled collapsed stacks that can be turned into a flamegraph, e.g. with flamegraph.pl or speedscope.
+"""
+
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+
+from django.utils import timezone
+
+class QueryLog:
+    """
+    Database execute wrapper collecting the executed SQL statements and their duration
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - start, sql))
+
+    def as_text(self):
+        lines = [f"{len(self.queries)} queries in {sum(d for d, _ in self.queries) * 1000:.3f} ms"]
+        for duration, sql in self.queries:
+            lines.append(f"{duration * 1000:9.3f} ms  {sql}")
+        return '\n'.join(lines)
+
+class StackSampler(threading.Thread):
+    """
+    Periodically samples the stack of another thread to build collapsed stacks for flamegraphs
+
+    cProfile only records caller/callee pairs, which is not enough to reconstruct the stacks, so they are sampled \
+        separately. Only frames below 'base_frame' are recorded.
+    """
+
+    def __init__(self, thread_id, base_frame, interval=0.001):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.base_frame = base_frame
+        self.interval = interval
+        self.stacks = {}
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.base_frame:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+def save_profile(profiler, sampler, request, query_log, directory):
+    """
+    Write the profile of a request to the given directory and return its text representation and the profile id
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = re.sub(r'[^A-Za-z0-9_-]+', '_', request.path).strip('_') or 'root'
+    profile_id = f"{timezone.now().strftime('%Y%m%d%H%M%S%f')}_{request.method}_{path}"
+    base_name = os.path.join(directory, profile_id)
+
+    profiler.dump_stats(f"{base_name}.prof")
+
+    output = io.StringIO()
+    output.write(f"{request.method} {request.get_full_path()}\n\n")
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats('cumulative').print_stats(100)
+    output.write(query_log.as_text() + '\n')
+    text = output.getvalue()
+    with open(f"{base_name}.txt", 'w') as text_file:
+        text_file.write(text)
+
+    with open(f"{base_name}.collapsed", 'w') as collapsed_file:
+        for stack, count in sorted(sampler.stacks.items()):
+            collapsed_file.write(f"{stack} {count}\n")
+
+    return text, profile_id
@@ -0,0 +1,112 @@
+"""
+Process wide cache of projects
+
+Every submission and reference update looks up its project by id, slug or name. The projects found are kept in a
+process wide cache, so most requests do not read the Project table. The cache is cleared whenever a project is saved
+or deleted, including edits of the project settings and moves of a project to its shard. The cached projects decide
+the database their data is written to, so the caches of the other processes must not keep a moved project either.
+
+Processes see the changes of other processes through the generation file set by DTF_PROJECT_CACHE_GENERATION_FILE.
+It is replaced after every committed change of a project, e.g. by the 'move_project_to_shard' command, and every
+lookup compares it with the file seen last, which costs a stat call instead of a query. If the setting is None, the
+other processes see changes only after DTF_PROJECT_CACHE_TTL seconds. A TTL of 0 disables the cache.
+
+Only projects that exist are cached, and a name is only cached if a single project has it. Projects always live in
+the default database.
+"""
+
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from dtf.metrics import CACHE_REQUESTS
+from dtf.models import Project
+
+DEFAULT_PROJECT_CACHE_TTL = 60
+
+_cache = {}
+_cache_lock = threading.Lock()
+_generation = None
+
+def get_generation():
+    """
+    Return the identity of the current generation file, or None if there is none
+    """
+    path = getattr(settings, 'DTF_PROJECT_CACHE_GENERATION_FILE', None)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # the file is replaced, so its inode changes even if the modification time does not
+    return (path, stat.st_ino, stat.st_mtime_ns)
+
+def new_generation():
+    """
+    Replace the generation file, so all processes clear their cache on their next lookup
+    """
+    path = getattr(settings, 'DTF_PROJECT_CACHE_GENERATION_FILE', None)
+    if path is None:
+        return
+    temporary = f"{path}.{uuid.uuid4().hex}"
+    with open(temporary, 'w') as generation_file:
+        generation_file.write(uuid.uuid4().hex)
+    os.replace(temporary, path)
+
+def get_project(field, value):
+    """
+    Return the project whose 'id', 'slug' or 'name' field has the given value, or None
+
+    None is also returned if several projects have the same name. The returned project is shared with the cache and \
+        must not be modified.
+    """
+    global _generation
+
+    ttl = getattr(settings, 'DTF_PROJECT_CACHE_TTL', DEFAULT_PROJECT_CACHE_TTL)
+    key = (field, value)
+    now = time.monotonic()
+    if ttl:
+        generation = get_generation()
+        with _cache_lock:
+            if generation != _generation:
+                _cache.clear()
+                _generation = generation
+            project, expires = _cache.get(key, (None, 0))
+        if expires > now:
+            CACHE_REQUESTS.inc(cache='projects', result='hit')
+            return project
+        CACHE_REQUESTS.inc(cache='projects', result='miss')
+
+    projects = list(Project.objects.using('default').filter(**{'pk' if field == 'id' else field: value})[:2])
+    if len(projects) != 1:
+        return None
+    project = projects[0]
+    if ttl:
+        with _cache_lock:
+            # a project changed while it was read must not be cached
+            if generation == _generation:
+                _cache[key] = (project, now + ttl)
+                # names are not unique, only name lookups may cache a name
+                _cache[('id', project.id)] = (project, now + ttl)
+                _cache[('slug', project.slug)] = (project, now + ttl)
+    return project
+
+def clear_project_cache():
+    with _cache_lock:
+        _cache.clear()
+
+def forget_changed_project(sender, using=None, **kwargs):
+    """
+    Clear the cache when a project is saved or deleted
+
+    The cache is cleared again after the transaction is committed, as other threads could have read the old project \
+        in the meantime, and the generation file is replaced for the other processes.
+    """
+    clear_project_cache()
+    transaction.on_commit(clear_project_cache, using=using)
+    transaction.on_commit(new_generation, using=using)
@@ -0,0 +1,157 @@
+"""
+pytest plugin reporting test outcomes to DTF
+
+Enable the plugin with ``-p dtf.pytest_plugin``, or ``pytest_plugins = ['dtf.pytest_plugin']`` in a conftest.py, and
+point it to a server and project:
+
+.. code-block:: bash
+
+    pytest -p dtf.pytest_plugin --dtf-url http://dtf.example.com --dtf-project my-project --dtf-info build=1234
+
+A submission is created at the start of the run. Its info contains the git branch and commit of the working directory
+and all '--dtf-info' values. Every test is reported as a test result with the parameters 'outcome', 'duration' and,
+for failures, 'message'. The results are uploaded in batches by a dtf.client.Client in the background, so the run
+does not wait for the server.
+
+With pytest-xdist the controller creates the submission and every worker uploads its own results to it.
+"""
+
+import os
+import subprocess
+
+import pytest
+
+from dtf.client import Client
+
+# same order as TestResult.status_order, the worst status of all phases of a test is reported
+STATUS_ORDER = {
+    "skip": 0,
+    "successful": 10,
+    "unstable": 20,
+    "failed": 30,
+    "unknown": 40,
+    "broken": 50
+}
+
+def pytest_addoption(parser):
+    group = parser.getgroup('dtf', "report test results to DTF")
+    group.addoption('--dtf-url', default=os.environ.get('DTF_URL'),
+        help="Base url of the DTF server, defaults to $DTF_URL. The plugin is inactive without it")
+    group.addoption('--dtf-project', default=os.environ.get('DTF_PROJECT'),
+        help="Slug of the project to report to, defaults to $DTF_PROJECT")
+    group.addoption('--dtf-submission-id', type=int, default=None,
+        help="Add the results to this submission instead of creating a new one")
+    group.addoption('--dtf-info', action='append', default=[], metavar='KEY=VALUE',
+        help="Additional submission info, can be given multiple times")
+    group.addoption('--dtf-batch-size', type=int, default=200,
+        help="Number of results uploaded per request")
+
+def pytest_configure(config):
+    if not config.getoption('dtf_url'):
+        return
+    if not config.getoption('dtf_project') and not config.getoption('dtf_submission_id'):
+        raise pytest.UsageError("--dtf-url requires --dtf-project or --dtf-submission-id")
+    config.pluginmanager.register(DTFReporter(config), 'dtf_reporter')
+
+def get_git_info(directory):
+    info = {}
+    for key, command in [('branch', ['git', 'rev-parse', '--abbrev-ref', 'HEAD']),
+                         ('commit', ['git', 'rev-parse', 'HEAD'])]:
+        try:
+            info[key] = subprocess.run(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    return info
+
+def get_submission_info(config):
+    info = get_git_info(str(config.rootdir))
+    for item in config.getoption('dtf_info'):
+        key, separator, value = item.partition('=')
+        if not separator:
+            raise pytest.UsageError(f"--dtf-info expects KEY=VALUE, got {item}")
+        info[key] = value
+    return info
+
+def get_status(report):
+    """
+    Map the report of a single test phase to a DTF status
+    """
+    if report.passed:
+        # an unexpectedly passing xfail test
+        return "unstable" if hasattr(report, 'wasxfail') else "successful"
+    if report.skipped:
+        return "skip"
+    return "failed" if report.when == 'call' else "broken"
+
+class DTFReporter:
+    """
+    Collects the reports of all phases of a test and hands the test result to the client when the test is finished
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.client = Client(config.getoption('dtf_url'), batch_size=config.getoption('dtf_batch_size'))
+        self.tests = {}
+        self.uploaded = 0
+        self.failed = 0
+
+        self.workerinput = getattr(config, 'workerinput', None)
+        if self.workerinput is not None:
+            self.submission_id = self.workerinput['dtf_submission_id']
+        elif config.getoption('dtf_submission_id'):
+            self.submission_id = config.getoption('dtf_submission_id')
+        else:
+            self.submission_id = self.client.create_submission(
+                project_slug=config.getoption('dtf_project'),
+                info=get_submission_info(config))
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_configure_node(self, node):
+        node.workerinput['dtf_submission_id'] = self.submission_id
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        output = getattr(node, 'workeroutput', {})
+        self.uploaded += output.get('dtf_uploaded', 0)
+        self.failed += output.get('dtf_failed', 0)
+
+    def pytest_runtest_logreport(self, report):
+        # the xdist controller receives the reports of the workers as well, these are uploaded by the workers
+        if hasattr(report, 'node'):
+            return
+        test = self.tests.setdefault(report.nodeid, {'status': None, 'duration': 0.0, 'message': None})
+        test['duration'] += report.duration
+        # passing setup and teardown phases do not change the outcome of the test
+        if report.when == 'call' or not report.passed:
+            status = get_status(report)
+            if test['status'] is None or STATUS_ORDER[status] > STATUS_ORDER[test['status']]:
+                test['status'] = status
+            if report.failed:
+                test['message'] = str(report.longrepr)[-1000:]
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        test = self.tests.pop(nodeid, None)
+        if test is None or test['status'] is None:
+            return
+        status = test['status']
+        results = [
+            {"name": "outcome", "value": status, "valuetype": "string", "status": status},
+            {"name": "duration", "value": round(test['duration'], 6), "valuetype": "float", "status": status},
+        ]
+        if test['message']:
+            results.append({"name": "message", "value": test['message'], "valuetype": "string", "status": status})
+        self.client.submit(self.submission_id, nodeid, results)
+
+    def pytest_sessionfinish(self, session):
+        report = self.client.close()
+        self.uploaded += report.uploaded
+        self.failed += report.failed_results
+        if self.workerinput is not None:
+            self.config.workeroutput['dtf_uploaded'] = report.uploaded
+            self.config.workeroutput['dtf_failed'] = report.failed_results
+
+    def pytest_terminal_summary(self, terminalreporter):
+        terminalreporter.write_sep('-', "DTF")
+        terminalreporter.write_line(
+            f"submission {self.submission_id}: {self.uploaded} results uploaded, {self.failed} results failed")
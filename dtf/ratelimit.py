@@ -0,0 +1,194 @@
+"""
+Ingestion rate limits and backpressure
+
+Projects can limit the number of test results they accept per minute, in total and per client, see the rate limit
+fields of the Project model. The limits are token buckets, which are refilled continuously and allow bursts up to
+their capacity. Submitting a test result, or appending a result parameter to one, takes one token. A request taking
+more tokens than available is rejected with status 429 and a 'Retry-After' header with the seconds until enough
+tokens are available. A batch larger than the capacity is accepted from a full bucket, and the following requests
+wait until the bucket is refilled. The tokens are taken before the submitted data is validated, so rejected requests
+do not write to the database, and they are given back if the data turns out to be invalid.
+
+The buckets are kept in a shared SQLite file set by the DTF_RATE_LIMIT_DATABASE setting, so all worker processes
+use the same buckets. If it is None, every process keeps its own buckets. Clients are identified by their user if
+they are authenticated, or by their address. Headers sent by the clients are not used, as a client could escape its
+limit by changing them.
+
+Independent of the rate limits, every process handles at most DTF_INGESTION_MAX_CONCURRENCY ingestion requests at
+once. Further requests are rejected with status 503 and 'Retry-After'. The 'X-DTF-Backpressure' response header
+reports the fraction of the capacity in use, so clients can slow down before they are rejected.
+"""
+
+import functools
+import math
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+from dtf.shared import SharedDatabase
+
+BACKPRESSURE_HEADER = 'X-DTF-Backpressure'
+
+class TokenBuckets:
+    """
+    Token buckets identified by keys, shared by all processes through DTF_RATE_LIMIT_DATABASE
+    """
+
+    def __init__(self):
+        self.local = {}
+        self.lock = threading.Lock()
+        self.database = SharedDatabase('DTF_RATE_LIMIT_DATABASE',
+            "CREATE TABLE IF NOT EXISTS buckets "
+            "(key TEXT NOT NULL PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)",
+            # transactions are started explicitly
+            isolation_level=None)
+
+    def _get_connection(self):
+        return self.database.get_connection()
+
+    def consume(self, key, rate, capacity, cost=1, now=None):
+        """
+        Take 'cost' tokens from the bucket, which is refilled with 'rate' tokens per second up to 'capacity'
+
+        Returns a (allowed, retry_after) tuple, retry_after is the number of seconds until the request would be \
+            allowed, or 0.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            connection = self._get_connection()
+            if connection is None:
+                tokens, updated = self.local.get(key, (capacity, now))
+                tokens, allowed = self._take(tokens, updated, now, rate, capacity, cost)
+                self.local[key] = (tokens, now)
+            else:
+                # the write lock is taken right away, so no other process can take the same tokens
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    row = connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                    tokens, updated = row if row else (capacity, now)
+                    tokens, allowed = self._take(tokens, updated, now, rate, capacity, cost)
+                    connection.execute(
+                        "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                        (key, tokens, now))
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+                connection.execute("COMMIT")
+        if allowed:
+            return True, 0
+        return False, (min(cost, capacity) - tokens) / rate
+
+    @staticmethod
+    def _take(tokens, updated, now, rate, capacity, cost):
+        tokens = min(capacity, tokens + max(0, now - updated) * rate)
+        # requests larger than the capacity are allowed from a full bucket and leave it in debt
+        if tokens >= min(cost, capacity):
+            return tokens - cost, True
+        return tokens, False
+
+    def reset(self):
+        """
+        Remove all buckets. Mainly useful for tests
+        """
+        with self.lock:
+            self.local = {}
+            connection = self._get_connection()
+            if connection is not None:
+                connection.execute("DELETE FROM buckets")
+
+BUCKETS = TokenBuckets()
+
+def get_client_id(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"address:{request.META.get('REMOTE_ADDR', '')}"
+
+def get_project_limits(project, client_id):
+    """
+    Return the (key, rate per second, capacity) of every bucket that applies to submissions to the project
+    """
+    limits = []
+    if project.rate_limit_per_minute:
+        capacity = project.rate_limit_burst or project.rate_limit_per_minute
+        limits.append((f"project:{project.id}", project.rate_limit_per_minute / 60, capacity))
+    if project.client_rate_limit_per_minute:
+        limits.append((f"client:{project.id}:{client_id}", project.client_rate_limit_per_minute / 60,
+            project.client_rate_limit_per_minute))
+    return limits
+
+def check_rate_limits(request, counts):
+    """
+    Take the tokens for the given number of test results per project
+
+    'counts' maps projects to the number of submitted test results. Returns a 429 response if a limit is \
+        exceeded, or None.
+    """
+    client_id = get_client_id(request)
+    consumed = []
+    for project, count in counts.items():
+        for key, rate, capacity in get_project_limits(project, client_id):
+            allowed, retry_after = BUCKETS.consume(key, rate, capacity, count)
+            if not allowed:
+                # rejected requests take no tokens, give back the ones taken from the other buckets
+                for key, rate, capacity, count in consumed:
+                    BUCKETS.consume(key, rate, capacity, -count)
+                return Response({"error":f"Rate limit of project {project.slug} exceeded"},
+                    status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(math.ceil(retry_after))})
+            consumed.append((key, rate, capacity, count))
+    return None
+
+def refund_rate_limits(request, counts):
+    """
+    Give back the tokens taken by check_rate_limits for a request that was not handled after all
+    """
+    client_id = get_client_id(request)
+    for project, count in counts.items():
+        for key, rate, capacity in get_project_limits(project, client_id):
+            BUCKETS.consume(key, rate, capacity, -count)
+
+class IngestionQueue:
+    """
+    Counts the ingestion requests handled by this process at the same time
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.lock = threading.Lock()
+
+    def enter(self, limit):
+        with self.lock:
+            if limit is not None and self.depth >= limit:
+                return False
+            self.depth += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.depth -= 1
+
+INGESTION_QUEUE = IngestionQueue()
+
+def backpressure(view):
+    """
+    Decorator for ingestion views, rejecting requests beyond DTF_INGESTION_MAX_CONCURRENCY and reporting \
+        the load in the 'X-DTF-Backpressure' header
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        limit = getattr(settings, 'DTF_INGESTION_MAX_CONCURRENCY', None)
+        if not INGESTION_QUEUE.enter(limit):
+            return Response({"error":"Too many concurrent submissions, retry later"},
+                status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1', BACKPRESSURE_HEADER: '1.00'})
+        try:
+            load = INGESTION_QUEUE.depth / limit if limit else 0
+            response = view(request, *args, **kwargs)
+        finally:
+            INGESTION_QUEUE.leave()
+        response[BACKPRESSURE_HEADER] = f"{load:.2f}"
+        return response
+    return wrapper
@@ -0,0 +1,224 @@
+"""
+Resolution of reference pointers
+
+References are stored as immutable ReferenceValue versions. The references of a TestReference map every parameter to
+the id of its current version, and every result parameter stores the id of the version that was current when it was
+submitted in a 'reference_id' field. Rows written before may still contain copies of the reference values, they can
+be converted with the 'compact_references' management command. Both forms are resolved to the same API output.
+
+Versions never change, so resolved versions are kept in a process wide LRU cache of DTF_REFERENCE_CACHE_SIZE entries.
+
+The versions also form the reference history. Every version is valid from its 'valid_from' time until the next
+version of the same parameter, which allows to look up the references of a test at any point in time.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from dtf.metrics import CACHE_REQUESTS, ROWS_WRITTEN
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def get_reference_values(ids, using='default'):
+    """
+    Return a dict mapping the given ReferenceValue ids to their reference, e.g. {"value": 5, "ref_id": 1}
+
+    Unknown ids are left out. The returned references are shared with the cache and must not be modified.
+    """
+    from dtf.models import ReferenceValue
+
+    values = {}
+    missing = []
+    with _cache_lock:
+        for value_id in set(ids):
+            reference = _cache.get((using, value_id))
+            if reference is None:
+                missing.append(value_id)
+            else:
+                _cache.move_to_end((using, value_id))
+                values[value_id] = reference
+    if values:
+        CACHE_REQUESTS.inc(len(values), cache='reference_values', result='hit')
+    if not missing:
+        return values
+
+    CACHE_REQUESTS.inc(len(missing), cache='reference_values', result='miss')
+    loaded = {
+        value_id: {**data, 'ref_id': ref_id}
+        for value_id, data, ref_id in ReferenceValue.objects.using(using).filter(
+            id__in=missing).values_list('id', 'data', 'ref_id')
+    }
+    max_size = getattr(settings, 'DTF_REFERENCE_CACHE_SIZE', 10000)
+    with _cache_lock:
+        for value_id, reference in loaded.items():
+            _cache[(using, value_id)] = reference
+        while len(_cache) > max_size:
+            _cache.popitem(last=False)
+    values.update(loaded)
+    return values
+
+def forget_reference_values(ids, using='default'):
+    """
+    Drop the given ids from the cache
+
+    Must be called for newly created versions, because ids of rolled back versions are reused.
+    """
+    with _cache_lock:
+        for value_id in ids:
+            _cache.pop((using, value_id), None)
+
+def forget_created_reference_value(sender, instance, created=False, using=None, **kwargs):
+    if created:
+        forget_reference_values([instance.id], using)
+
+def clear_reference_cache():
+    with _cache_lock:
+        _cache.clear()
+
+def resolve_parameter(parameter, values):
+    """
+    Return the result parameter with its 'reference_id' replaced by the 'reference', keeping the order of the fields
+    """
+    if 'reference_id' not in parameter:
+        return parameter
+    return {
+        ('reference' if key == 'reference_id' else key): (values.get(value) if key == 'reference_id' else value)
+        for key, value in parameter.items()
+    }
+
+def resolve_references(references, using='default'):
+    """
+    Return a copy of the references of a TestReference with all version ids replaced by the references
+    """
+    ids = [reference for reference in references.values() if isinstance(reference, int)]
+    values = get_reference_values(ids, using) if ids else {}
+    return {
+        name: values.get(reference) if isinstance(reference, int) else reference
+        for name, reference in references.items()
+    }
+
+def resolve_test_references(test_references, using='default'):
+    """
+    Resolve the references of the given TestReference objects in place, with a single lookup
+
+    The objects must not be saved afterwards.
+    """
+    ids = [reference for test_reference in test_references
+           for reference in test_reference.references.values() if isinstance(reference, int)]
+    if ids:
+        get_reference_values(ids, using)
+    for test_reference in test_references:
+        test_reference.references = resolve_references(test_reference.references, using)
+    return test_references
+
+def resolve_result_references(test_results, using='default'):
+    """
+    Replace the 'reference_id' of every result parameter of the given TestResult objects by its 'reference' in place
+
+    The objects must not be saved afterwards.
+    """
+    ids = [parameter['reference_id'] for test_result in test_results
+           for parameter in test_result.results or [] if 'reference_id' in parameter]
+    if not ids:
+        return test_results
+    values = get_reference_values(ids, using)
+    for test_result in test_results:
+        test_result.results = [resolve_parameter(parameter, values) for parameter in test_result.results or []]
+    return test_results
+
+def get_reference_versions_at(project, test_name, at):
+    """
+    Return the ReferenceValue versions of all parameters of a test that were current at the given point in time
+    """
+    from dtf.models import ReferenceValue
+    from dtf.routers import get_project_database
+
+    database = get_project_database(project)
+    versions = ReferenceValue.objects.using(database).filter(
+        test_case__project=project,
+        test_case__name=test_name,
+        valid_from__lte=at
+    )
+    latest = ReferenceValue.objects.using(database).filter(
+        test_case_id=OuterRef('test_case_id'),
+        parameter=OuterRef('parameter'),
+        valid_from__lte=at
+    ).order_by('-valid_from', '-id').values('id')[:1]
+    return versions.filter(id=Subquery(latest)).order_by('parameter')
+
+def get_references_at(project, test_name, at):
+    """
+    Return the references of a test at the given point in time, in the same form as the resolved current references
+
+    Parameters without a reference at that time are left out.
+    """
+    return {
+        version.parameter: version.as_reference()
+        for version in get_reference_versions_at(project, test_name, at)
+    }
+
+def promote_test_results(project, test_results, using='default'):
+    """
+    Make the values of the given test results the current references of their tests, in one transaction
+
+    This is the same as calling 'api/update_references' for every test result with all of its parameters, but \
+        uses a constant number of queries. Returns a summary of the changes.
+    """
+    from dtf.models import ReferenceValue, TestReference
+
+    valid_from = timezone.now()
+    versions = [
+        ReferenceValue(project=project, test_name=test_result.name, test_case_id=test_result.test_case_id,
+            parameter=parameter['name'], data={'value': parameter['value']}, ref_id=test_result.id,
+            valid_from=valid_from)
+        for test_result in test_results for parameter in test_result.results or []
+    ]
+    with transaction.atomic(using=using):
+        ReferenceValue.objects.using(using).bulk_create(versions)
+        # bulk_create does not set the ids on SQLite, the new versions all share the same 'valid_from' time
+        version_ids = {
+            (ref_id, parameter): version_id
+            for version_id, ref_id, parameter in ReferenceValue.objects.using(using).filter(
+                project=project, valid_from=valid_from).values_list('id', 'ref_id', 'parameter')
+        }
+        references = {}
+        names = {}
+        for test_result in test_results:
+            names[test_result.test_case_id] = test_result.name
+            for parameter in test_result.results or []:
+                references.setdefault(test_result.test_case_id, {})[parameter['name']] = \
+                    version_ids[(test_result.id, parameter['name'])]
+
+        existing = {
+            test_reference.test_case_id: test_reference
+            for test_reference in TestReference.objects.using(using).filter(test_case_id__in=list(references))
+        }
+        created = []
+        updated = []
+        for test_case_id, pointers in references.items():
+            test_reference = existing.get(test_case_id)
+            if test_reference is None:
+                created.append(TestReference(project=project, test_name=names[test_case_id],
+                    test_case_id=test_case_id, references=pointers))
+            else:
+                test_reference.references.update(pointers)
+                updated.append(test_reference)
+        TestReference.objects.using(using).bulk_create(created)
+        TestReference.objects.using(using).bulk_update(updated, ['references'])
+
+    forget_reference_values(version_ids.values(), using)
+    ROWS_WRITTEN.inc(len(versions), table=ReferenceValue._meta.db_table)
+    ROWS_WRITTEN.inc(len(created), table=TestReference._meta.db_table)
+    return {
+        'promoted_tests': len(test_results),
+        'promoted_parameters': len(versions),
+        'created_references': len(created),
+        'updated_references': len(updated),
+    }
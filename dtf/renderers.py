@@ -0,0 +1,28 @@
+"""
+DRF renderer classes of the DTF API
+"""
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders responses as 'application/msgpack', for clients sending 'Accept: application/msgpack' or '?format=msgpack'
+
+    Values msgpack can not encode natively, like dates and decimals, are converted like in JSON responses.
+    Requires the optional msgpack package.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True, default=JSONEncoder().default)
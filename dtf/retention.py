@@ -0,0 +1,119 @@
+"""
+Retention policy for submissions
+
+A project can limit how many submissions it keeps and for how long. Submissions outside of these limits are pruned,
+except for submissions containing tests that are used as a reference. Pruned submissions can be archived to
+compressed JSON-lines files, which can be loaded again with the 'import_results' management command.
+"""
+
+import gzip
+import json
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from dtf.models import Submission, TestResult, TestReference
+from dtf.routers import get_project_database
+from dtf.references import get_reference_values, resolve_result_references
+
+def get_referenced_submission_ids(project):
+    """
+    Return the ids of all submissions of the project that contain a test used as reference
+    """
+    database = get_project_database(project)
+    test_ids = set()
+    value_ids = []
+    for references in TestReference.objects.using(database).filter(project=project).values_list('references', flat=True):
+        for reference in references.values():
+            if isinstance(reference, int):
+                value_ids.append(reference)
+            elif reference.get('ref_id') is not None:
+                test_ids.add(reference['ref_id'])
+    for reference in get_reference_values(value_ids, database).values():
+        if reference['ref_id'] is not None:
+            test_ids.add(reference['ref_id'])
+    return set(TestResult.objects.using(database).filter(
+        id__in=test_ids
+    ).values_list('submission_id', flat=True))
+
+def get_prunable_submission_ids(project, now=None):
+    """
+    Return the ids of all submissions of the project that are outside of its retention policy, oldest first
+
+    A submission is outside of the retention policy if it is not one of the newest 'retention_max_submissions' submissions \
+        or if it is older than 'retention_max_days' days. Unset limits are ignored.
+    """
+    if project.retention_max_submissions is None and project.retention_max_days is None:
+        return []
+
+    submissions = Submission.objects.using(get_project_database(project)).filter(project=project).order_by('-id')
+    prunable = set()
+    if project.retention_max_submissions is not None:
+        prunable.update(submissions[project.retention_max_submissions:].values_list('id', flat=True))
+    if project.retention_max_days is not None:
+        now = now or timezone.now()
+        oldest = now - timedelta(days=project.retention_max_days)
+        prunable.update(submissions.filter(created__lt=oldest).values_list('id', flat=True))
+
+    prunable -= get_referenced_submission_ids(project)
+    return sorted(prunable)
+
+def write_archive_records(archive, project, submission_ids):
+    """
+    Write the given submissions in the import format to an open archive file
+    """
+    database = get_project_database(project)
+    tests = {}
+    test_results = list(TestResult.objects.using(database).filter(submission_id__in=submission_ids).order_by('id'))
+    # the archive must not depend on the reference versions in the database
+    for test in resolve_result_references(test_results, database):
+        tests.setdefault(test.submission_id, []).append({
+            'name': test.name,
+            'results': test.results,
+        })
+    for submission in Submission.objects.using(database).filter(id__in=submission_ids).order_by('id'):
+        record = {
+            'project_slug': project.slug,
+            'project_name': project.name,
+            'info': submission.info,
+            'created': submission.created.isoformat(),
+            'updated': submission.updated.isoformat(),
+            'tests': tests.get(submission.id, []),
+        }
+        archive.write(json.dumps(record) + '\n')
+
+def delete_submissions(submission_ids, using='default'):
+    """
+    Delete the given submissions and their test results in one short transaction
+    """
+    with transaction.atomic(using=using):
+        TestResult.objects.using(using).filter(submission_id__in=submission_ids).delete()
+        Submission.objects.using(using).filter(id__in=submission_ids).delete()
+
+def prune_project(project, chunk_size=100, archive_path=None, now=None):
+    """
+    Remove all submissions of the project that are outside of its retention policy
+
+    Submissions are deleted in chunks of 'chunk_size', each in its own transaction, to not block writers for long.
+    If an 'archive_path' is given, the submissions are appended to this gzip compressed file before they are deleted.
+
+    Returns the number of pruned submissions
+    """
+    submission_ids = get_prunable_submission_ids(project, now)
+    if not submission_ids:
+        return 0
+
+    archive = gzip.open(archive_path, 'at') if archive_path else None
+    try:
+        for start in range(0, len(submission_ids), chunk_size):
+            chunk = submission_ids[start:start + chunk_size]
+            if archive:
+                write_archive_records(archive, project, chunk)
+                archive.flush()
+            delete_submissions(chunk, get_project_database(project))
+    finally:
+        if archive:
+            archive.close()
+    return len(submission_ids)
@@ -0,0 +1,133 @@
+"""
+Per-project database sharding
+
+Projects always live in the central 'default' database. A project can be moved to its own SQLite database with the
+'move_project_to_shard' management command, after which its test cases, submissions, test results and references are
+stored in the shard. The shard holds a copy of the project row, so the foreign keys stay valid.
+
+The ids of the objects in a shard start at the project id shifted by SHARD_ID_BITS, so the database of every
+submission, test result, reference and reference value can be derived from its id and the cached project, see
+dtf.project_cache. Ids in the range of a project without a shard belong to the default database.
+The shard files are created in the DTF_SHARD_DIRECTORY.
+"""
+
+import os
+
+from django.conf import settings
+from django.db import connections
+
+SHARD_ID_BITS = 32
+SHARD_ALIAS_PREFIX = 'dtf_project_'
+SHARDED_MODELS = ['testcase', 'submission', 'submissioninfo', 'testresult', 'testreference', 'referencevalue']
+
+def get_shard_alias(project_id):
+    return f"{SHARD_ALIAS_PREFIX}{project_id}"
+
+def is_shard(alias):
+    return alias.startswith(SHARD_ALIAS_PREFIX)
+
+def get_shard_id_base(alias):
+    """
+    Return the first id of the objects in the given shard
+    """
+    return int(alias[len(SHARD_ALIAS_PREFIX):]) << SHARD_ID_BITS
+
+def ensure_database(alias):
+    """
+    Make sure the connection settings of the given shard exist and return its alias
+    """
+    if alias not in connections.databases:
+        directory = getattr(settings, 'DTF_SHARD_DIRECTORY', os.path.join(settings.BASE_DIR, 'shards'))
+        os.makedirs(directory, exist_ok=True)
+        database = dict(connections.databases['default'])
+        database['NAME'] = os.path.join(directory, f"{alias}.sqlite3")
+        database['TEST'] = {}
+        connections.databases[alias] = database
+    return alias
+
+def get_project_database(project):
+    """
+    Return the database alias holding the submissions, test results and references of the project
+    """
+    if project is None or not project.database:
+        return 'default'
+    return ensure_database(project.database)
+
+def get_database_for_id(object_id):
+    """
+    Return the database alias holding the submission, test result or reference with the given id
+
+    Ids in the range of a project that is not stored in a shard belong to the default database, where they are \
+        not found. So unknown ids never open a shard.
+    """
+    from dtf.project_cache import get_project
+
+    project_id = int(object_id) >> SHARD_ID_BITS
+    if project_id <= 0:
+        return 'default'
+    project = get_project('id', project_id)
+    if project is None or project.database != get_shard_alias(project_id):
+        return 'default'
+    return ensure_database(project.database)
+
+def get_all_databases():
+    """
+    Return the aliases of the default database and of all shards
+    """
+    from dtf.models import Project
+
+    shards = Project.objects.using('default').exclude(database='').values_list('database', flat=True)
+    return ['default'] + [ensure_database(alias) for alias in shards]
+
+def get_instance_database(instance):
+    from dtf.models import Project, TestResult
+
+    if isinstance(instance, Project):
+        return get_project_database(instance)
+    if instance._state.db:
+        return instance._state.db
+    if isinstance(instance, TestResult):
+        return get_instance_database(instance.submission) if instance.submission_id else 'default'
+    if getattr(instance, 'project_id', None):
+        return get_project_database(instance.project)
+    return 'default'
+
+def sync_project_copy(sender, instance, raw=False, using=None, **kwargs):
+    """
+    Keep the copy of a project in its shard up to date when the project is changed in the default database
+    """
+    if raw or using != 'default' or not instance.database:
+        return
+    fields = {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+    sender.objects.using(ensure_database(instance.database)).filter(pk=instance.pk).update(**fields)
+
+class ProjectShardRouter:
+    """
+    Routes the submissions, test results and references of sharded projects to their shard
+    """
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_model(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_model(model, **hints)
+
+    def db_for_model(self, model, **hints):
+        if model._meta.app_label != 'dtf':
+            return None
+        if model._meta.model_name not in SHARDED_MODELS:
+            return 'default'
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        return get_instance_database(instance)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._meta.app_label == 'dtf' and obj2._meta.app_label == 'dtf':
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if is_shard(db):
+            return app_label == 'dtf'
+        return None
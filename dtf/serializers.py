@@ -3,17 +3,60 @@ Contains all serializers needed for the API to transition between the json repre
 and the database model of data
 """
 
+from fnmatch import fnmatchcase
+
 from rest_framework import serializers
 
 from dtf.functions import reference_structure_is_valid
+from dtf.functions import result_structure_is_valid
 from dtf.functions import get_project_from_data
 
-from dtf.models import Project, TestResult, TestReference, Submission
+from dtf.models import Project, TestResult, Submission
 from dtf.functions import check_result_structure
+from dtf.functions import get_test_reference
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+
+from dtf.instrumentation import timer
+from dtf.routers import get_database_for_id, get_project_database
+from dtf.references import promote_test_results
+from dtf.submission_info import index_submissions
+
+class TimedListSerializer(serializers.ListSerializer):
+    """
+    List serializer that records the serialization time in the 'serializer' timer
+    """
+    @property
+    def data(self):
+        with timer('serializer'):
+            return super().data
+
+class TimedSerializer(serializers.Serializer):
+    """
+    Base class of all serializers, records the validation and serialization time in the 'serializer' timer
+
+    The optional 'fields' argument limits the output to the given fields.
+    """
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def is_valid(self, raise_exception=False):
+        with timer('serializer'):
+            return super().is_valid(raise_exception=raise_exception)
+
+    @property
+    def data(self):
+        with timer('serializer'):
+            return super().data
 
-class ProjectSerializer(serializers.Serializer):
+class ProjectSerializer(TimedSerializer):
     """
     Serializer for projects
 
@@ -27,7 +70,7 @@ class ProjectSerializer(serializers.Serializer):
     def create(self, validated_data):
         return Project.objects.create(**validated_data)
 
-class TestReferenceSerializer(serializers.Serializer):
+class TestReferenceSerializer(TimedSerializer):
     """
     Serializer for references
     """
@@ -55,7 +98,7 @@ class TestReferenceSerializer(serializers.Serializer):
             raise serializers.ValidationError(\
                 "No test_id submitted. Need a valid test_id to properly set the reference")
         try:
-            _ = TestResult.objects.get(id=data['test_id'])
+            _ = TestResult.objects.using(get_database_for_id(data['test_id'])).get(id=data['test_id'])
         except TestResult.DoesNotExist:
             raise serializers.ValidationError(\
                 "No test found with the given test_id. Need a valid test_id to properly set the reference")
@@ -86,17 +129,39 @@ class TestReferenceSerializer(serializers.Serializer):
         return data
 
     def create(self, validated_data):
-        test_reference, _ = TestReference.objects.get_or_create(
-            project=validated_data['project'],
-            test_name=validated_data['test_name']
-        )
+        database = get_project_database(validated_data['project'])
+        test_reference = get_test_reference(validated_data['project'], validated_data['test_name'], database)
         test_reference.update_references(
             validated_data['references'],
             validated_data['test_id'])
         test_reference.save()
         return test_reference
 
-class TestResultSerializer(serializers.Serializer):
+class ReferenceValueSerializer(TimedSerializer):
+    """
+    Serializer for the versions in the reference history, read only
+    """
+    id = serializers.IntegerField(read_only=True)
+    test_name = serializers.CharField(read_only=True)
+    parameter = serializers.CharField(read_only=True)
+    reference = serializers.JSONField(source='as_reference', read_only=True)
+    valid_from = serializers.DateTimeField(read_only=True)
+
+class BatchReferenceSerializer(TimedSerializer):
+    """
+    Serializer for batch reference lookups
+
+    Requires either a list of 'test_names' or a list of 'test_ids'
+    """
+    test_names = serializers.ListField(child=serializers.CharField(), required=False)
+    test_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate(self, data):
+        if not data.get('test_names') and not data.get('test_ids'):
+            raise serializers.ValidationError("Need a list of 'test_names' or 'test_ids'")
+        return data
+
+class TestResultSerializer(TimedSerializer):
     """
     Serializer for tests results
 
@@ -109,6 +174,7 @@ class TestResultSerializer(serializers.Serializer):
     first_submitted = serializers.DateTimeField(required=False)
     last_updated = serializers.DateTimeField(required=False)
     submission_id = serializers.IntegerField(required=True)
+    status = serializers.CharField(read_only=True)
     # submission = serializers.PrimaryKeyRelatedField(required=True)
     # TODO 
     # learn how to require a pk at this point to represent the submission
@@ -121,26 +187,82 @@ class TestResultSerializer(serializers.Serializer):
         The 'results' field must contain a list of dictionaries, where each dictionary \
             has a name, value, and valuetype field
         """
-        try:
-            submission = Submission.objects.get(pk=data['submission_id'])
-        except ObjectDoesNotExist as error:
-            raise serializers.ValidationError(error)
+        # the submissions are shared by all test results of a batch
+        submissions = self.context.setdefault('submissions', {})
+        submission = submissions.get(data['submission_id'])
+        if submission is None:
+            try:
+                submission = Submission.objects.using(get_database_for_id(data['submission_id'])).select_related(
+                    'project').get(pk=data['submission_id'])
+            except ObjectDoesNotExist as error:
+                raise serializers.ValidationError(error)
+            submissions[data['submission_id']] = submission
         data['submission'] = submission
 
+        test_reference = get_test_reference(submission.project, data['name'], submission._state.db)
+        data['test_case'] = test_reference.test_case
         data['results'], errors = check_result_structure(
             data['results'],
-            data['name'],
-            submission)
+            test_reference)
         if not data['results']:
             raise serializers.ValidationError(errors)
 
         return data
 
     def create(self, validated_data):
-        obj = TestResult.objects.create(**validated_data)
+        obj = TestResult.objects.using(validated_data['submission']._state.db).create(**validated_data)
         return obj
 
-class SubmissionSerializer(serializers.Serializer):
+class AppendTestResultSerializer(TimedSerializer):
+    """
+    Serializer for result parameters appended to an existing test result
+
+    Requires a non-empty list of 'results' in the format of the TestResultSerializer
+    """
+    results = serializers.JSONField(required=True)
+
+    def validate_results(self, results):
+        if not isinstance(results, list) or not results:
+            raise serializers.ValidationError("'results' field is not a non-empty list")
+        errors = [f"field {r} does not match wanted format" for r in results
+                  if not isinstance(r, dict) or not result_structure_is_valid(r)]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return results
+
+class PromoteSubmissionSerializer(TimedSerializer):
+    """
+    Serializer to promote the tests of a submission to references
+
+    Requires a submission id
+    The promoted tests can be limited to a list of 'status' values and to names matching a shell style 'name_pattern'
+    """
+    submission_id = serializers.IntegerField(required=True)
+    status = serializers.ListField(
+        child=serializers.ChoiceField(choices=[s for s, _ in TestResult.POSSIBLE_STATUS]), required=False)
+    name_pattern = serializers.CharField(required=False)
+
+    def validate(self, data):
+        try:
+            data['submission'] = Submission.objects.using(get_database_for_id(data['submission_id'])).select_related(
+                'project').get(pk=data['submission_id'])
+        except ObjectDoesNotExist as error:
+            raise serializers.ValidationError(error)
+        return data
+
+    def create(self, validated_data):
+        submission = validated_data['submission']
+        test_results = submission.tests.order_by('id')
+        if 'status' in validated_data:
+            test_results = test_results.filter(status__in=validated_data['status'])
+        test_results = list(test_results)
+        if 'name_pattern' in validated_data:
+            test_results = [t for t in test_results if fnmatchcase(t.name, validated_data['name_pattern'])]
+        summary = promote_test_results(submission.project, test_results, submission._state.db)
+        summary['submission_id'] = submission.id
+        return summary
+
+class SubmissionSerializer(TimedSerializer):
 
     project_id = serializers.IntegerField(required=False)
     project_slug = serializers.SlugField(required=False)
@@ -156,5 +278,9 @@ class SubmissionSerializer(serializers.Serializer):
         return data
     
     def create(self, validated_data):
-        obj = Submission.objects.create(project=validated_data['project'])
+        project = validated_data['project']
+        database = get_project_database(project)
+        with transaction.atomic(using=database):
+            obj = Submission.objects.using(database).create(project=project, info=validated_data.get('info') or {})
+            index_submissions([obj], database)
         return obj
\ No newline at end of file
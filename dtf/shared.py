@@ -0,0 +1,46 @@
+"""
+SQLite files shared by all worker processes
+
+The metrics and the rate limits of all worker processes are combined in small SQLite files outside of the Django
+databases, set by a setting each. Every process opens its own connection to the file.
+"""
+
+import os
+import sqlite3
+
+from django.conf import settings
+
+class SharedDatabase:
+    """
+    Connection of this process to the SQLite file set by the given setting, creating the given table if needed
+    """
+
+    def __init__(self, setting, schema, isolation_level=''):
+        self.setting = setting
+        self.schema = schema
+        self.isolation_level = isolation_level
+        self.connection = None
+        self.connection_key = None
+
+    def get_connection(self):
+        """
+        Return the connection, or None if the setting is None
+        """
+        path = getattr(settings, self.setting, None)
+        if path is None:
+            return None
+        # forked worker processes must not share the connection of their parent
+        key = (path, os.getpid())
+        if self.connection_key != key:
+            self.connection = sqlite3.connect(path, timeout=5, check_same_thread=False,
+                isolation_level=self.isolation_level)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(self.schema)
+            self.connection_key = key
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+        self.connection_key = None
@@ -0,0 +1,100 @@
+"""
+Indexed submission info
+
+The info of a submission is a free-form JSON object. The values of the keys listed in DTF_INDEXED_INFO_KEYS, e.g. the
+branch and the commit, are copied into SubmissionInfo rows when the submission is created. These rows are indexed by
+key and value, so filtering submissions by their info does not read the info of every submission.
+
+Only strings, numbers and booleans of up to 255 characters are indexed, numbers and booleans in their JSON form.
+After changing DTF_INDEXED_INFO_KEYS, run the 'index_submission_info' command to index the existing submissions.
+"""
+
+import json
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from dtf.models import Submission, SubmissionInfo
+
+DEFAULT_INDEXED_INFO_KEYS = ['branch', 'commit', 'host']
+
+# query parameters filtering by an info value, e.g. 'info.branch=master'
+INFO_PARAMETER_PREFIX = 'info.'
+
+def get_indexed_keys():
+    return list(getattr(settings, 'DTF_INDEXED_INFO_KEYS', DEFAULT_INDEXED_INFO_KEYS))
+
+def get_indexed_values(info, keys):
+    """
+    Return the (key, value) pairs of the info that are indexed
+    """
+    if not isinstance(info, dict):
+        return []
+    values = []
+    for key in keys:
+        value = info.get(key)
+        if value is None or isinstance(value, (dict, list)):
+            continue
+        value = value if isinstance(value, str) else json.dumps(value)
+        if len(value) <= SubmissionInfo._meta.get_field('value').max_length:
+            values.append((key, value))
+    return values
+
+def index_submissions(submissions, using='default'):
+    """
+    Create the SubmissionInfo rows of the given saved submissions and return their number
+    """
+    keys = get_indexed_keys()
+    rows = [
+        SubmissionInfo(submission_id=submission.id, key=key, value=value)
+        for submission in submissions for key, value in get_indexed_values(submission.info, keys)
+    ]
+    SubmissionInfo.objects.using(using).bulk_create(rows)
+    return len(rows)
+
+def reindex_submissions(using='default', chunk_size=1000):
+    """
+    Replace the SubmissionInfo rows of all submissions in the database, in chunks of submissions
+
+    Returns the number of created rows.
+    """
+    count = 0
+    last_id = 0
+    while True:
+        chunk = list(Submission.objects.using(using).filter(id__gt=last_id).order_by('id').only('id', 'info')
+            [:chunk_size])
+        if not chunk:
+            return count
+        with transaction.atomic(using=using):
+            SubmissionInfo.objects.using(using).filter(
+                submission_id__gt=last_id, submission_id__lte=chunk[-1].id).delete()
+            count += index_submissions(chunk, using)
+        last_id = chunk[-1].id
+
+def get_info_filters(params):
+    """
+    Return the {key: value} filters given as 'info.<key>' query parameters, empty values are ignored
+
+    Raises a ValidationError for keys that are not indexed.
+    """
+    keys = get_indexed_keys()
+    filters = {}
+    for parameter, value in params.items():
+        if not parameter.startswith(INFO_PARAMETER_PREFIX) or value == '':
+            continue
+        key = parameter[len(INFO_PARAMETER_PREFIX):]
+        if key not in keys:
+            raise serializers.ValidationError({parameter:
+                f"The info key {key} is not indexed, indexed keys are {', '.join(keys)}"})
+        filters[key] = value
+    return filters
+
+def filter_submissions(submissions, filters):
+    """
+    Limit the Submission queryset to the submissions whose info has all the given indexed values
+    """
+    for key, value in filters.items():
+        # separate filter calls join the index once per key
+        submissions = submissions.filter(info_index__key=key, info_index__value=value)
+    return submissions
@@ -69,6 +69,7 @@ def add_bootstrap_class(field, add_class=""):
 
     bootstrap_classes_per_widget = {
         "text": "form-control",
+        "number": "form-control",
         "checkbox" : "form-check-input",
     }
 
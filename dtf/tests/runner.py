@@ -0,0 +1,46 @@
+"""
+Test runner keeping the tests away from the shared files of the running installation
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+class DtfTestRunner(DiscoverRunner):
+    """
+    Runs the tests without the shared SQLite files of the metrics and the rate limits, which would mix the data \
+        of the tests with the one of the installation, and without the generation file of the project cache, \
+        which would clear the caches of the running workers. Tests of these features set their own files
+
+    The test databases are files in a temporary directory instead of shared in-memory databases, which ignore the \
+        busy timeout. So the live server tests with concurrent uploads wait for the write lock instead of failing.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.overridden_settings = override_settings(
+            DTF_METRICS_DATABASE=None,
+            DTF_RATE_LIMIT_DATABASE=None,
+            DTF_PROJECT_CACHE_GENERATION_FILE=None,
+        )
+        self.overridden_settings.enable()
+
+    def setup_databases(self, **kwargs):
+        self.database_directory = tempfile.mkdtemp(prefix='dtf-tests-')
+        for connection in connections.all():
+            test_settings = connection.settings_dict.setdefault('TEST', {})
+            if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+                test_settings['NAME'] = os.path.join(self.database_directory, f"{connection.alias}.sqlite3")
+        return super().setup_databases(**kwargs)
+
+    def teardown_databases(self, old_config, **kwargs):
+        super().teardown_databases(old_config, **kwargs)
+        shutil.rmtree(self.database_directory, ignore_errors=True)
+
+    def teardown_test_environment(self, **kwargs):
+        self.overridden_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -4,21 +4,35 @@ Module containing the API unit tests
 Tests:
 create project
 get_projects
+create_submission
+get_submissions
 submit_test_results
 update_references
 """
 
 import json
+import unittest
+
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
 from rest_framework import status
 
+from django.core.management import call_command
 from django.test import TestCase, Client
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 
-from dtf.models import Project, TestResult, TestReference, Submission
+from dtf.idempotency import PENDING_KEY_TIMEOUT
+from dtf.models import TestCase as TestCaseModel
+from dtf.models import Project, TestResult, TestReference, Submission, SubmissionInfo, IdempotencyKey
+from dtf.models import ReferenceValue
 from dtf.serializers import ProjectSerializer
+from dtf.serializers import SubmissionSerializer
 from dtf.serializers import TestResultSerializer
+from dtf.renderers import msgpack
 
 client = Client()
 
@@ -155,6 +169,45 @@ class SubmissionApiTest(ApiTestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(Submission.objects.count(), 3)
 
+    def test_submission_info(self):
+        infos = [
+            {"branch": "master", "commit": "abc123", "host": "ci-1"},
+            {"branch": "master", "commit": "def456", "host": "ci-2", "build": 42},
+            {"branch": "feature", "commit": 789, "extra": {"nested": True}},
+        ]
+        ids = [self.post('/api/create_submission', {"project_id": self.project_id, "info": info})[1]['id']
+               for info in infos]
+        self.assertEqual(Submission.objects.get(id=ids[1]).info, infos[1])
+        self.assertEqual(SubmissionInfo.objects.count(), 8)
+
+        url = reverse('get_submissions', args=[self.project_slug])
+        response = client.get(url)
+        self.assertEqual([submission['id'] for submission in response.json()], ids[::-1])
+        self.assertEqual(response.json()[0]['info'], infos[2])
+        response = client.get(url, {'info.branch': 'master', 'fields': 'id'})
+        self.assertEqual(response.json(), [{'id': ids[1]}, {'id': ids[0]}])
+        response = client.get(url, {'info.branch': 'master', 'info.host': 'ci-1'})
+        self.assertEqual([submission['id'] for submission in response.json()], [ids[0]])
+        # numbers are indexed in their JSON form
+        response = client.get(url, {'info.commit': '789'})
+        self.assertEqual([submission['id'] for submission in response.json()], [ids[2]])
+        response = client.get(url, {'limit': 1})
+        self.assertEqual([submission['id'] for submission in response.json()], [ids[2]])
+
+        self.assertEqual(client.get(url, {'info.build': '42'}).status_code, 400)
+        self.assertEqual(client.get(url, {'limit': 0}).status_code, 400)
+
+        response = client.get(reverse('project_details', args=[self.project_slug]), {'info.branch': 'feature'})
+        self.assertEqual([submission.id for submission in response.context['submissions']], [ids[2]])
+        self.assertContains(response, 'name="info.commit"')
+
+        # the index follows the configured keys
+        with self.settings(DTF_INDEXED_INFO_KEYS=['build']):
+            call_command('index_submission_info', stdout=StringIO())
+            response = client.get(url, {'info.build': '42'})
+            self.assertEqual([submission['id'] for submission in response.json()], [ids[1]])
+        self.assertEqual(SubmissionInfo.objects.count(), 1)
+
 class TestResultApiTest(ApiTestCase):
     """ Test module for submitting test results via the API """
 
@@ -217,6 +270,186 @@ class TestResultApiTest(ApiTestCase):
         self.assertEqual(TestResult.objects.count(), 1)
         self.assertEqual(response.status_code, 400)
 
+    def test_submit_test_result_batch(self):
+        valid_payload = dict(self.valid_payload, submission_id=self.submission_id)
+        response, data = self.post(
+            '/api/submit_test_results',
+            [valid_payload, dict(valid_payload, name="OTHER_TEST")]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['test_result_ids']), 2)
+        self.assertEqual(TestResult.objects.count(), 2)
+
+        # one invalid test result rejects the whole batch
+        response, _ = self.post(
+            '/api/submit_test_results',
+            [valid_payload, self.missing_name_payload]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(TestResult.objects.count(), 2)
+
+    def test_append_test_results(self):
+        response, data = self.post('/api/submit_test_results', {
+            "name": "UNIT_TEST",
+            "submission_id": self.submission_id,
+            "results": [{"name": "parameter1", "value": 5, "valuetype": "integer", "status": "successful"}]
+        })
+        test_id = data['test_result_id']
+        Submission.objects.filter(id=self.submission_id).update(updated="2021-01-01T00:00:00Z")
+        url = reverse('append_test_results', args=[test_id])
+
+        def append(results):
+            response = client.patch(url, json.dumps({"results": results}), content_type='application/json')
+            return response, response.data
+
+        response, data = append([
+            {"name": "parameter2", "value": 1.5, "valuetype": "float", "status": "unstable"},
+            {"name": "parameter3", "value": 3, "valuetype": "integer", "status": "successful"}
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data, {'test_result_id': test_id, 'status': 'unstable', 'parameters': 3})
+        test_result = TestResult.objects.get(id=test_id)
+        self.assertEqual([r['name'] for r in test_result.results], ["parameter1", "parameter2", "parameter3"])
+        self.assertEqual(test_result.results[2]['margin'], 0)
+        self.assertEqual(test_result.status, "unstable")
+        self.assertGreater(Submission.objects.get(id=self.submission_id).updated.year, 2021)
+
+        # replacing the parameter which determined the status recalculates it
+        _, data = append([{"name": "parameter2", "value": 1.0, "valuetype": "float", "status": "successful"}])
+        self.assertEqual(data['status'], 'successful')
+        self.assertEqual(data['parameters'], 3)
+        self.assertEqual(TestResult.objects.get(id=test_id).results[1]['value'], 1.0)
+
+        for results in [[], [{"name": "parameter4"}], "parameter4"]:
+            response, _ = append(results)
+            self.assertEqual(response.status_code, 400)
+        response = client.patch(reverse('append_test_results', args=[999999]),
+            json.dumps({"results": [{"name": "p", "value": 1, "valuetype": "integer"}]}), content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+class IdempotencyApiTest(ApiTestCase):
+    """ Test module for repeated requests with an Idempotency-Key header """
+
+    def setUp(self):
+        _, data = self.create_project("Idempotent Project")
+        self.project_id = data['project_id']
+
+    def post_with_key(self, url, payload, key):
+        return client.post(url, json.dumps(payload), content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay(self):
+        first = self.post_with_key('/api/create_submission', {'project_id': self.project_id}, 'key-1')
+        second = self.post_with_key('/api/create_submission', {'project_id': self.project_id}, 'key-1')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Submission.objects.count(), 1)
+
+        payload = {
+            "name": "UNIT_TEST",
+            "submission_id": first.json()['id'],
+            "results": [{"name": "parameter1", "value": 5, "valuetype": "integer"}]
+        }
+        responses = [self.post_with_key('/api/submit_test_results', payload, 'key-2') for _ in range(3)]
+        self.assertEqual(len({response.json()['test_result_id'] for response in responses}), 1)
+        self.assertEqual(TestResult.objects.count(), 1)
+
+        # the same key for another request, and the same request with another key
+        response = self.post_with_key('/api/submit_test_results', dict(payload, name="OTHER_TEST"), 'key-2')
+        self.assertEqual(response.status_code, 422)
+        self.post_with_key('/api/submit_test_results', payload, 'key-3')
+        self.assertEqual(TestResult.objects.count(), 2)
+
+        # validation errors are replayed as well
+        response = self.post_with_key('/api/create_submission', {}, 'key-4')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post_with_key('/api/create_submission', {}, 'key-4')['Idempotent-Replayed'], 'true')
+
+    def test_in_progress_and_expired(self):
+        IdempotencyKey.objects.create(key='key-1', fingerprint='unfinished')
+        response = self.post_with_key('/api/create_submission', {'project_id': self.project_id}, 'key-1')
+        self.assertEqual(response.status_code, 422)
+
+        IdempotencyKey.objects.filter(key='key-1').update(created="2021-01-01T00:00:00Z")
+        response = self.post_with_key('/api/create_submission', {'project_id': self.project_id}, 'key-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 200)
+
+        IdempotencyKey.objects.update(status_code=None)
+        response = self.post_with_key('/api/create_submission', {'project_id': self.project_id}, 'key-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+        # the key of a request that never finished is taken over after a while
+        IdempotencyKey.objects.update(created=timezone.now() - timedelta(seconds=PENDING_KEY_TIMEOUT + 1))
+        response = self.post_with_key('/api/create_submission', {'project_id': self.project_id}, 'key-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Submission.objects.count(), 2)
+
+        # failed requests release their key, so they can be retried with it
+        with mock.patch.object(SubmissionSerializer, 'save', side_effect=RuntimeError("database is locked")):
+            with self.assertRaises(RuntimeError):
+                self.post_with_key('/api/create_submission', {'project_id': self.project_id}, 'key-2')
+        self.assertFalse(IdempotencyKey.objects.filter(key='key-2').exists())
+        response = self.post_with_key('/api/create_submission', {'project_id': self.project_id}, 'key-2')
+        self.assertEqual(response.status_code, 200)
+
+        IdempotencyKey.objects.update(created="2021-01-01T00:00:00Z")
+        output = StringIO()
+        call_command('prune_idempotency_keys', stdout=output)
+        self.assertIn("deleted 2 expired idempotency keys", output.getvalue())
+
+class WipeDatabaseApiTest(ApiTestCase):
+    """ Test module for wiping the database """
+
+    def test_wipe_database(self):
+        _, data = self.create_project("Wiped Project")
+        _, data = self.create_submission(project_id=data['project_id'])
+        response = client.post('/api/submit_test_results', json.dumps({
+            "name": "UNIT_TEST",
+            "submission_id": data['id'],
+            "results": [{"name": "parameter1", "value": 5, "valuetype": "integer"}]
+        }), content_type='application/json', HTTP_IDEMPOTENCY_KEY='key-1')
+        self.put('/api/update_references', {
+            "project_id": Project.objects.get().id,
+            "test_name": "UNIT_TEST",
+            "test_id": response.json()['test_result_id'],
+            "references": {"parameter1": {"value": 5}}
+        })
+
+        self.assertEqual(client.get('/api/WIPE_DATABASE').status_code, 200)
+        for model in [Project, Submission, SubmissionInfo, TestCaseModel, TestResult, TestReference, ReferenceValue,
+                      IdempotencyKey]:
+            self.assertFalse(model.objects.exists(), model.__name__)
+
+@unittest.skipIf(msgpack is None, "msgpack is not installed")
+class MessagePackApiTest(ApiTestCase):
+    """ Test module for MessagePack request and response bodies """
+
+    def test_submit_and_read(self):
+        _, data = self.create_project("MessagePack Project")
+        _, data = self.create_submission(project_id=data['project_id'])
+        submission_id = data['id']
+        payload = {
+            "name": "UNIT_TEST",
+            "submission_id": submission_id,
+            "results": [{"name": "parameter1", "value": [0.5, 1.5], "valuetype": "list"}]
+        }
+        response = client.post('/api/submit_test_results', msgpack.packb(payload),
+            content_type='application/msgpack', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        test_id = msgpack.unpackb(response.content)['test_result_id']
+
+        url = reverse('get_submission_by_id', args=[submission_id])
+        data = msgpack.unpackb(client.get(url, HTTP_ACCEPT='application/msgpack').content)
+        self.assertEqual(data, client.get(url).json())
+        self.assertEqual(data[0]['id'], test_id)
+        self.assertEqual(data[0]['results'][0]['value'], [0.5, 1.5])
+        self.assertEqual(client.get(url + '?format=msgpack')['Content-Type'], 'application/msgpack')
+
+        response = client.post('/api/submit_test_results', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
 class TestReferenceApiTest(ApiTestCase):
     def setUp(self):
         self.test_name = "UNIT_TEST"
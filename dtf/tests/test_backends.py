@@ -0,0 +1,42 @@
+"""
+Module containing the tests for the DTF SQLite backend
+"""
+
+import json
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from dtf.backends.sqlite3.base import DatabaseWrapper
+from dtf.models import Project
+
+class SQLiteBackendTest(TransactionTestCase):
+
+    def setUp(self):
+        if not isinstance(connections['default'], DatabaseWrapper):
+            self.skipTest("the DTF SQLite backend is not configured")
+
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            # 1 is NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+    def test_immediate_transactions(self):
+        with CaptureQueriesContext(connection) as context:
+            with transaction.atomic():
+                Project.objects.create(name="Backend Project", slug="backend-project")
+        self.assertEqual(context.captured_queries[0]['sql'], "BEGIN IMMEDIATE")
+
+    def test_stress_command(self):
+        out = StringIO()
+        call_command('dtf_sqlite_stress', '--writers', '2', '--duration', '0.5', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertGreater(report['dtf']['writes'], 0)
+        self.assertEqual(report['dtf']['locked_errors'], 0)
@@ -0,0 +1,50 @@
+"""
+Module containing the tests for the synthetic data generator and the benchmark runner
+"""
+
+import unittest
+
+from django.test import TestCase
+
+from dtf.benchmark import SyntheticDataGenerator, BenchmarkRunner, VALUE_TYPES, percentile, run_codec_benchmarks
+from dtf.renderers import msgpack
+from dtf.models import TestResult, TestReference
+
+class BenchmarkTest(TestCase):
+
+    def test_generator_is_deterministic(self):
+        first = SyntheticDataGenerator(seed=42, value_types=VALUE_TYPES, image_size=16)
+        second = SyntheticDataGenerator(seed=42, value_types=VALUE_TYPES, image_size=16)
+        self.assertEqual(first.test_result(1, 0), second.test_result(1, 0))
+        self.assertEqual(len(first.test_result(1, 1)['results']), 5)
+
+    def test_percentile(self):
+        self.assertEqual(percentile(list(range(1, 101)), 50), 50)
+        self.assertEqual(percentile(list(range(1, 101)), 99), 99)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertIsNone(percentile([], 50))
+
+    def test_runner(self):
+        runner = BenchmarkRunner(SyntheticDataGenerator(seed=1), submissions=2, tests=3, repeat=2)
+        benchmarks = runner.run()
+        self.assertEqual(TestResult.objects.count(), 6)
+        self.assertEqual(TestReference.objects.count(), 3)
+        self.assertEqual(benchmarks['submit_test_results']['calls'], 6)
+        self.assertEqual(benchmarks['get_submission_by_id']['calls'], 2)
+        self.assertEqual(benchmarks['serialize_submission_fastpath']['calls'], 2)
+        for name in ['view_test_result_details', 'get_reference_by_test_id', 'update_references',
+                     'serialize_submission_serializer']:
+            self.assertIn(name, benchmarks)
+            self.assertIsNotNone(benchmarks[name]['peak_memory_bytes'])
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_runner(self):
+        runner = BenchmarkRunner(SyntheticDataGenerator(seed=1), submissions=1, tests=2, repeat=1, format='msgpack')
+        benchmarks = runner.run()
+        self.assertEqual(TestResult.objects.count(), 2)
+        self.assertEqual(benchmarks['get_submission_by_id']['calls'], 1)
+
+        generator = SyntheticDataGenerator(seed=1, value_types=['list'])
+        codecs = run_codec_benchmarks([generator.test_result(1, t) for t in range(3)], repeat=2)
+        self.assertLess(codecs['msgpack']['bytes'], codecs['json']['bytes'])
+        self.assertIn('decode_p50_ms', codecs['json'])
@@ -0,0 +1,87 @@
+"""
+Module containing the tests for the Python client, run against the Django test server
+"""
+
+import time
+
+from unittest import mock
+
+import requests
+
+from django.test import LiveServerTestCase
+
+from dtf.client import Client, ClientError
+from dtf.models import Project, Submission, TestResult
+
+class ClientTest(LiveServerTestCase):
+
+    def setUp(self):
+        self.project = Project.objects.create(name="Client Project", slug="client-project")
+
+    def test_batches(self):
+        with Client(self.live_server_url, batch_size=3, flush_interval=60, workers=1, compress=True) as client:
+            submission_id = client.create_submission(project_slug=self.project.slug)
+            for i in range(7):
+                client.submit(submission_id, f"TEST_{i}", [{"name": "parameter1", "value": i, "valuetype": "integer"}])
+        self.assertEqual(client.report.uploaded, 7)
+        self.assertEqual(client.report.batches, 3)
+        self.assertEqual(client.report.failed, [])
+        self.assertEqual(TestResult.objects.filter(submission_id=submission_id).count(), 7)
+
+        with self.assertRaises(ClientError):
+            client.submit(submission_id, "TEST_8", [])
+
+    def test_flush_interval(self):
+        client = Client(self.live_server_url, batch_size=100, flush_interval=0.05, workers=1)
+        self.addCleanup(client.close)
+        submission_id = client.create_submission(project_id=self.project.id)
+        client.submit(submission_id, "TEST", [{"name": "parameter1", "value": 1, "valuetype": "integer"}])
+
+        deadline = time.monotonic() + 5
+        while client.report.uploaded == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(client.report.uploaded, 1)
+        self.assertEqual(client.get_references(self.project.slug, ["TEST"]), {"TEST": {}})
+
+        test_id = TestResult.objects.get(name="TEST").id
+        status = client.append(test_id, [{"name": "parameter2", "value": 2, "valuetype": "integer", "status": "broken"}])
+        self.assertEqual(status, "broken")
+
+    def test_failures_are_reported(self):
+        client = Client(self.live_server_url, workers=1, backoff=0)
+        client.submit(999999, "TEST", [{"name": "parameter1", "value": 1, "valuetype": "integer"}])
+        with self.assertLogs('dtf.client', level='ERROR'):
+            report = client.close()
+        self.assertEqual(report.failed_results, 1)
+        self.assertTrue(report.failed[0][1].startswith("400"))
+        self.assertEqual(report.retries, 0)
+
+    def test_retries(self):
+        client = Client("http://127.0.0.1:1", retries=2, backoff=0)
+        self.addCleanup(client.close)
+        with self.assertRaises(ClientError):
+            client.create_submission(project_slug=self.project.slug)
+        self.assertEqual(client.report.retries, 2)
+
+
+    def test_retry_conflict(self):
+        client = Client(self.live_server_url, workers=1, max_backoff=0)
+        self.addCleanup(client.close)
+        send = client.session.request
+        keys = []
+
+        def request(method, url, **kwargs):
+            # a retry overlapping an attempt still handled by the server is answered with 409
+            keys.append(kwargs['headers']['Idempotency-Key'])
+            if len(keys) == 1:
+                response = requests.Response()
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            return send(method, url, **kwargs)
+
+        with mock.patch.object(client.session, 'request', side_effect=request):
+            submission_id = client.create_submission(project_slug=self.project.slug)
+        self.assertTrue(Submission.objects.filter(id=submission_id).exists())
+        self.assertEqual(client.report.retries, 1)
+        self.assertEqual(len(set(keys)), 1)
@@ -0,0 +1,100 @@
+"""
+Module containing the tests for the fast read path, which must produce the output of the serializers
+"""
+
+import json
+
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from dtf import fastpath
+from dtf.models import Project, Submission, TestResult, TestReference, ReferenceValue
+from dtf.references import clear_reference_cache, resolve_result_references
+from dtf.serializers import TestResultSerializer, ReferenceValueSerializer
+
+client = Client()
+
+class FastPathTest(TestCase):
+
+    def setUp(self):
+        clear_reference_cache()
+        self.project = Project.objects.create(name="Fast Project", slug="fast-project")
+        self.submission = Submission.objects.create(project=self.project)
+        first = TestResult.objects.create(name="UNIT_TEST", submission=self.submission, results=[
+            {"name": "parameter1", "value": [0.1, 1e-05, 3], "valuetype": "list", "reference": None,
+             "margin": None, "status": "successful"},
+            {"name": "parameter2", "value": "äöü", "valuetype": "string", "reference": {"value": "x"},
+             "margin": None, "status": "failed"},
+        ])
+        TestReference.objects.create(project=self.project, test_name="UNIT_TEST").update_references(
+            {"parameter1": {"value": [0.1, 1e-05, 3]}}, first.id)
+        version = ReferenceValue.objects.get()
+        TestResult.objects.create(name="UNIT_TEST", submission=self.submission, results=[
+            {"name": "parameter1", "value": [0.2], "valuetype": "list", "reference_id": version.id,
+             "margin": None, "status": "unstable"},
+        ])
+        TestResult.objects.create(name="EMPTY_TEST", submission=self.submission, results=[])
+
+    def test_test_results(self):
+        tests = TestResult.objects.filter(submission=self.submission).order_by('id')
+        expected = TestResultSerializer(resolve_result_references(list(tests)), many=True).data
+        rows = fastpath.test_result_rows(list(tests.values(*fastpath.TEST_RESULT_FIELDS)))
+        self.assertEqual(json.loads(fastpath.dumps(rows)), json.loads(JSONRenderer().render(expected)))
+        self.assertEqual([list(row) for row in rows], [list(test) for test in expected])
+
+        response = client.get(reverse('get_submission_by_id', args=[self.submission.id]))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(sorted(response.json(), key=lambda test: test['id']), json.loads(JSONRenderer().render(expected)))
+
+    def test_reference_history(self):
+        expected = ReferenceValueSerializer(ReferenceValue.objects.all(), many=True).data
+        response = client.get(reverse('get_reference_history', args=[self.project.slug, "UNIT_TEST"]))
+        self.assertEqual(response.json(), json.loads(JSONRenderer().render(expected)))
+
+    def test_stdlib_fallback(self):
+        data = [{"name": "äöü", "value": [0.1, 1e-05, 2 ** 70]}]
+        with mock.patch.object(fastpath, 'orjson', None):
+            encoded = fastpath.dumps(data)
+        self.assertEqual(encoded, JSONRenderer().render(data))
+        self.assertEqual(json.loads(fastpath.dumps(data)), data)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        return response, " ".join(query['sql'] for query in context.captured_queries)
+
+    def test_fieldsets(self):
+        url = reverse('get_submission_by_id', args=[self.submission.id])
+        response, sql = self.get(url + '?fields=status,name')
+        self.assertEqual([list(test) for test in response.json()], [['name', 'status']] * 3)
+        self.assertEqual(sorted(test['status'] for test in response.json()), ['failed', 'successful', 'unstable'])
+        self.assertNotIn('"results"', sql)
+
+        response, sql = self.get(url + '?exclude=results,last_updated')
+        self.assertEqual(list(response.json()[0]), ['name', 'id', 'first_submitted', 'submission_id', 'status'])
+        self.assertNotIn('"results"', sql)
+
+        response, _ = self.get(reverse('get_projects') + '?fields=slug')
+        self.assertEqual(response.json(), [{'slug': "fast-project"}])
+
+        response, sql = self.get(reverse('get_reference', args=[self.project.slug, "UNIT_TEST"]) + '?exclude=references')
+        self.assertEqual(list(response.json()[0]), ['id', 'test_name', 'project_id'])
+        self.assertNotIn('"references"', sql)
+
+        response, sql = self.get(reverse('get_reference_history', args=[self.project.slug, "UNIT_TEST"]) +
+            '?fields=valid_from,parameter')
+        self.assertEqual(list(response.json()[0]), ['parameter', 'valid_from'])
+        self.assertNotIn('"data"', sql)
+
+        for query in ['?fields=name,color', '?exclude=name,results,id,first_submitted,last_updated,submission_id,status']:
+            self.assertEqual(client.get(url + query).status_code, 400)
+
+    def test_submission_details_defer_results(self):
+        response, sql = self.get(reverse('submission_details', args=[self.submission.id]))
+        self.assertContains(response, "EMPTY_TEST")
+        self.assertNotIn('"results"', sql)
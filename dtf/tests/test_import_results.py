@@ -0,0 +1,102 @@
+"""
+Module containing the tests for the import_results management command
+"""
+
+import json
+import os
+import tempfile
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, Client
+
+from dtf.models import Project, TestResult, TestReference, Submission, ReferenceValue
+from dtf.references import resolve_result_references
+
+client = Client()
+
+class ImportResultsTest(TestCase):
+
+    def write_dump(self, records):
+        handle, file_name = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(handle, 'w') as dump:
+            for record in records:
+                dump.write(json.dumps(record) + '\n')
+        self.addCleanup(os.remove, file_name)
+        return file_name
+
+    def import_records(self, records, *args):
+        out = StringIO()
+        call_command('import_results', self.write_dump(records), *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_results(self):
+        records = [
+            {
+                "project_slug": "import-project",
+                "project_name": "Import Project",
+                "info": {"branch": "master"},
+                "created": "2020-12-01T10:00:00+00:00",
+                "tests": [
+                    {
+                        "name": "UNIT_TEST",
+                        "results": [{"name": "parameter1", "value": 5, "valuetype": "integer", "status": "failed"}],
+                        "references": {"parameter1": {"value": 5}}
+                    }
+                ]
+            },
+            {
+                "project_slug": "import-project",
+                "tests": [
+                    {
+                        "name": "UNIT_TEST",
+                        "results": [{"name": "parameter1", "value": 6, "valuetype": "integer", "status": "successful"}]
+                    }
+                ]
+            }
+        ]
+        output = self.import_records(records, '--chunk-size', '1', '--defer-indexes')
+        self.assertIn("Imported 2 submissions and 2 test results", output)
+
+        self.assertEqual(Project.objects.count(), 1)
+        self.assertEqual(Submission.objects.count(), 2)
+        self.assertEqual(TestReference.objects.count(), 1)
+
+        first, second = TestResult.objects.order_by('id')
+        self.assertEqual(first.status, "failed")
+        self.assertEqual(second.status, "successful")
+        self.assertEqual(first.submission.info, {"branch": "master"})
+        self.assertEqual(first.submission.created.year, 2020)
+
+        # the reference set by the first test is used for the second one
+        resolve_result_references([first, second])
+        self.assertIsNone(first.results[0]['reference'])
+        self.assertEqual(second.results[0]['reference'], {"value": 5, "ref_id": first.id})
+        reference = TestReference.objects.get()
+        self.assertEqual(reference.get_reference_or_none('parameter1')['ref_id'], first.id)
+
+        # imports continue after existing rows
+        self.import_records(records[1:])
+        self.assertEqual(TestResult.objects.count(), 3)
+
+        # ids of deleted rows are not reused, they may still be cached by other processes
+        last_value_id = ReferenceValue.objects.order_by('-id').first().id
+        last_test_id = TestResult.objects.order_by('-id').first().id
+        for model in [TestResult, Submission, ReferenceValue]:
+            model.objects.all().delete()
+        self.import_records(records[:1])
+        self.assertGreater(ReferenceValue.objects.get().id, last_value_id)
+        self.assertGreater(TestResult.objects.get().id, last_test_id)
+        test_id = client.post('/api/submit_test_results', json.dumps({
+            "name": "UNIT_TEST",
+            "submission_id": Submission.objects.get().id,
+            "results": [{"name": "parameter1", "value": 7, "valuetype": "integer"}]
+        }), content_type='application/json').json()['test_result_id']
+        self.assertEqual(test_id, TestResult.objects.order_by('id').first().id + 1)
+
+    def test_import_unknown_project(self):
+        with self.assertRaises(CommandError):
+            self.import_records([{"project_slug": "does-not-exist", "tests": []}])
+        self.assertEqual(Submission.objects.count(), 0)
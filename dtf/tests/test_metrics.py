@@ -0,0 +1,83 @@
+"""
+Module containing the tests for the metrics registry and the metrics endpoint
+"""
+
+import json
+import os
+import tempfile
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from dtf.metrics import MetricsRegistry, REGISTRY
+from dtf.models import Project, Submission
+
+client = Client()
+
+@override_settings(DTF_METRICS_DATABASE=None)
+class MetricsRegistryTest(TestCase):
+
+    def test_counter_and_histogram(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('test_total', "A counter", ['project'])
+        histogram = registry.histogram('test_seconds', "A histogram", buckets=[0.1, 1])
+
+        counter.inc(project="a")
+        counter.inc(2, project="a")
+        histogram.observe(0.5)
+        histogram.observe(5)
+        with self.assertRaises(ValueError):
+            counter.inc(other="a")
+
+        text = registry.exposition()
+        self.assertIn('# TYPE test_total counter', text)
+        self.assertIn('test_total{project="a"} 3', text)
+        self.assertIn('test_seconds_bucket{le="0.1"} 0', text)
+        self.assertIn('test_seconds_bucket{le="1"} 1', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn('test_seconds_count 2', text)
+        self.assertIn('test_seconds_sum 5.5', text)
+
+    def test_shared_file(self):
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+
+        # two registries stand in for two worker processes
+        with override_settings(DTF_METRICS_DATABASE=path):
+            first, second = MetricsRegistry(), MetricsRegistry()
+            first.counter('shared_total', "A counter").inc(2)
+            second.counter('shared_total', "A counter").inc(3)
+            first.flush()
+            self.assertIn('shared_total 5', second.exposition())
+
+@override_settings(DTF_METRICS_DATABASE=None)
+class MetricsEndpointTest(TestCase):
+
+    def setUp(self):
+        REGISTRY.reset()
+
+    def test_metrics_endpoint(self):
+        project = Project.objects.create(name="Metrics Project", slug="metrics-project")
+        submission = Submission.objects.create(project=project)
+        client.post('/api/submit_test_results', json.dumps({
+            "name": "UNIT_TEST",
+            "submission_id": submission.id,
+            "results": [{"name": "parameter1", "value": 5, "valuetype": "integer"}]
+        }), content_type='application/json')
+
+        response = client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('dtf_ingested_test_results_total{project="metrics-project"} 1', text)
+        self.assertIn('dtf_check_result_structure_seconds_count 1', text)
+        self.assertIn('dtf_rows_written_total{table="dtf_testresult"} 1', text)
+        self.assertIn('dtf_request_payload_bytes_count{view="dtf.views.submit_test_results"} 1', text)
+        self.assertIn('dtf_view_duration_seconds_count{view="dtf.views.submit_test_results"} 1', text)
+
+    def test_metrics_project_slug(self):
+        # the endpoint does not hide the page of a project called 'metrics'
+        Project.objects.create(name="Metrics", slug="metrics")
+        response = client.get(reverse('project_details', args=["metrics"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['project'].slug, "metrics")
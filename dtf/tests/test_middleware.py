@@ -0,0 +1,185 @@
+"""
+Module containing the tests for the middleware classes
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from dtf.models import Project, Submission, TestResult
+from dtf.profiling import StackSampler
+from dtf.ratelimit import BUCKETS, TokenBuckets
+
+client = Client()
+
+class ServerTimingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.project = Project.objects.create(name="Timing Project", slug="timing-project")
+
+    @override_settings(DTF_TIMING_SAMPLE_RATE=1.0)
+    def test_server_timing_header(self):
+        with self.assertLogs('dtf.timing', level='INFO') as logs:
+            response = client.get(reverse('get_projects'))
+        header = response['Server-Timing']
+        self.assertIn('db;dur=', header)
+        self.assertIn('desc="1 queries"', header)
+        self.assertIn('serializer;dur=', header)
+        self.assertIn('total;dur=', header)
+
+        log_data = json.loads(logs.records[0].getMessage())
+        self.assertEqual(log_data['path'], reverse('get_projects'))
+        self.assertEqual(log_data['queries'], 1)
+
+        response = client.get(reverse('project_details', args=[self.project.slug]))
+        self.assertIn('template;dur=', response['Server-Timing'])
+
+    @override_settings(DTF_TIMING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = client.get(reverse('get_projects'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_default_sample_rate(self):
+        # without the setting, only a small sample of the requests is instrumented
+        with override_settings():
+            del settings.DTF_TIMING_SAMPLE_RATE
+            with mock.patch('dtf.middleware.random.random', return_value=0.5):
+                response = client.get(reverse('get_projects'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+class CompressionTest(TestCase):
+
+    def setUp(self):
+        self.project = Project.objects.create(name="Compression Project", slug="compression-project")
+        self.submission = Submission.objects.create(project=self.project)
+        self.payload = json.dumps({
+            "name": "UNIT_TEST",
+            "submission_id": self.submission.id,
+            "results": [{"name": "parameter1", "value": list(range(1000)), "valuetype": "list"}]
+        }).encode()
+
+    def submit(self, body, encoding):
+        return client.post('/api/submit_test_results', body, content_type='application/json',
+            HTTP_CONTENT_ENCODING=encoding)
+
+    def test_request_decompression(self):
+        for body, encoding in [(gzip.compress(self.payload), 'gzip'), (zlib.compress(self.payload), 'deflate')]:
+            response = self.submit(body, encoding)
+            self.assertEqual(response.status_code, 200, encoding)
+        self.assertEqual(TestResult.objects.count(), 2)
+        self.assertEqual(TestResult.objects.first().results[0]['value'], list(range(1000)))
+
+        self.assertEqual(self.submit(self.payload, 'br').status_code, 415)
+        self.assertEqual(self.submit(self.payload, 'gzip').status_code, 400)
+        self.assertEqual(self.submit(gzip.compress(self.payload)[:-10], 'gzip').status_code, 400)
+        self.assertEqual(TestResult.objects.count(), 2)
+
+    @override_settings(DTF_MAX_DECOMPRESSED_BODY_SIZE=1024 * 1024)
+    def test_decompression_limit(self):
+        bomb = gzip.compress(b' ' * 100 * 1024 * 1024)
+        response = self.submit(bomb, 'gzip')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(TestResult.objects.count(), 0)
+
+    @override_settings(DTF_STREAMING_THRESHOLD=2)
+    def test_response_compression(self):
+        for _ in range(5):
+            self.submit(gzip.compress(self.payload), 'gzip')
+        url = reverse('get_submission_by_id', args=[self.submission.id])
+
+        response = client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[0]['results'][0]['value'], list(range(1000)))
+
+        with override_settings(DTF_STREAMING_THRESHOLD=1000):
+            response = client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertFalse(response.streaming)
+            self.assertEqual(json.loads(gzip.decompress(response.content)), data)
+            self.assertFalse(client.get(url).has_header('Content-Encoding'))
+
+class ProfilingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        self.settings = override_settings(DTF_PROFILE_DIR=self.profile_dir, DTF_PROFILE_RATE_LIMIT=2)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        BUCKETS.reset()
+
+        self.client = Client()
+        self.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        self.user = User.objects.create_user('user', password='password')
+        Project.objects.create(name="Profile Project", slug="profile-project")
+
+    def test_profile_parameter(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('projects') + '?profile=1')
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('function calls', text)
+        self.assertIn('dtf_project', text)
+
+        profile_id = response['X-DTF-Profile-Id']
+        for extension in ['prof', 'txt', 'collapsed']:
+            self.assertTrue(os.path.exists(os.path.join(self.profile_dir, f"{profile_id}.{extension}")))
+
+    def test_stack_sampler(self):
+        def slow_function():
+            time.sleep(0.05)
+
+        sampler = StackSampler(threading.get_ident(), sys._getframe(), interval=0.001)
+        sampler.start()
+        slow_function()
+        sampler.stop()
+        self.assertTrue(any(stack.startswith('slow_function') for stack in sampler.stacks))
+
+    def test_profile_header(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('get_projects'), HTTP_X_DTF_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['slug'], "profile-project")
+        self.assertIn('X-DTF-Profile-Id', response)
+
+    def test_profile_restrictions(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('projects') + '?profile=1')
+        self.assertNotIn('X-DTF-Profile-Id', response)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+        self.client.force_login(self.staff)
+        for _ in range(2):
+            response = self.client.get(reverse('projects') + '?profile=1')
+            self.assertIn('X-DTF-Profile-Id', response)
+        response = self.client.get(reverse('projects') + '?profile=1')
+        self.assertEqual(response['X-DTF-Profile'], 'rate limited')
+        self.assertNotIn('X-DTF-Profile-Id', response)
+
+    def test_shared_rate_limit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(DTF_RATE_LIMIT_DATABASE=os.path.join(directory, 'ratelimit.sqlite3')):
+                # another worker process used up the profiles of the user
+                other_process = TokenBuckets()
+                other_process.consume(f"profile:{self.staff.pk}", 2 / 60, 2, cost=2)
+
+                self.client.force_login(self.staff)
+                response = self.client.get(reverse('projects') + '?profile=1')
+                other_process.database.close()
+                BUCKETS.database.close()
+        self.assertEqual(response['X-DTF-Profile'], 'rate limited')
@@ -0,0 +1,98 @@
+"""
+Module containing the tests for the process wide project cache
+"""
+
+import json
+import os
+import tempfile
+
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from dtf import project_cache
+from dtf.functions import get_project_by_id, get_project_by_name, get_project_by_slug, get_project_from_data
+from dtf.models import Project
+
+client = Client()
+
+class ProjectCacheTest(TestCase):
+
+    def setUp(self):
+        project_cache.clear_project_cache()
+        self.project = Project.objects.create(name="Cached Project", slug="cached-project")
+
+    def test_lookups_are_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_project_by_slug("cached-project"), self.project)
+        # the id and the slug of a found project are cached together
+        with self.assertNumQueries(0):
+            self.assertEqual(get_project_by_slug("cached-project"), self.project)
+            self.assertEqual(get_project_by_id(self.project.id), self.project)
+            self.assertEqual(get_project_from_data({"project_slug": "cached-project"}), self.project)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_project_by_name("Cached Project"), self.project)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_project_by_name("Cached Project"), self.project)
+
+    def test_missing_and_duplicate_projects(self):
+        with self.assertNumQueries(2):
+            self.assertIsNone(get_project_by_slug("missing-project"))
+            self.assertIsNone(get_project_by_slug("missing-project"))
+        # a project created later is found right away
+        Project.objects.create(name="Cached Project", slug="missing-project")
+        self.assertIsNotNone(get_project_by_slug("missing-project"))
+        with self.assertNumQueries(2):
+            self.assertIsNone(get_project_by_name("Cached Project"))
+            self.assertIsNone(get_project_by_name("Cached Project"))
+
+    def test_invalidation(self):
+        self.assertEqual(get_project_by_slug("cached-project").name, "Cached Project")
+        response = client.post(reverse('project_settings', args=["cached-project"]),
+            {"name": "Renamed Project", "slug": "renamed-project"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Project.objects.get(pk=self.project.id).slug, "renamed-project")
+        self.assertIsNone(get_project_by_slug("cached-project"))
+        self.assertEqual(get_project_by_id(self.project.id).name, "Renamed Project")
+
+        self.project.delete()
+        self.assertIsNone(get_project_by_id(self.project.id))
+        self.assertIsNone(get_project_by_slug("renamed-project"))
+
+    def test_ttl(self):
+        get_project_by_slug("cached-project")
+        Project.objects.filter(pk=self.project.id).update(name="Changed Elsewhere")
+        # updates by other processes send no signal and are seen once the cached project expires
+        self.assertEqual(get_project_by_slug("cached-project").name, "Cached Project")
+        with mock.patch.object(project_cache.time, 'monotonic', return_value=project_cache.time.monotonic() + 61):
+            self.assertEqual(get_project_by_slug("cached-project").name, "Changed Elsewhere")
+
+        with override_settings(DTF_PROJECT_CACHE_TTL=0):
+            with self.assertNumQueries(2):
+                get_project_by_slug("cached-project")
+                get_project_by_slug("cached-project")
+
+    def test_generation_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(DTF_PROJECT_CACHE_GENERATION_FILE=os.path.join(directory, 'generation')):
+                get_project_by_slug("cached-project")
+                Project.objects.filter(pk=self.project.id).update(name="Changed Elsewhere")
+                self.assertEqual(get_project_by_slug("cached-project").name, "Cached Project")
+                # another process changed the project and replaced the generation file
+                project_cache.new_generation()
+                self.assertEqual(get_project_by_slug("cached-project").name, "Changed Elsewhere")
+                with self.assertNumQueries(0):
+                    get_project_by_slug("cached-project")
+
+    def test_submission_reads_cached_project(self):
+        payload = json.dumps({"project_slug": "cached-project"})
+        counts = []
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as context:
+                response = client.post(reverse('create_submission'), payload, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[1], counts[0] - 1)
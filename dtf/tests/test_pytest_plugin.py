@@ -0,0 +1,90 @@
+"""
+Module containing the tests for the pytest plugin, which runs pytest against the Django test server
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from django.conf import settings
+from django.test import LiveServerTestCase
+
+from dtf.models import Project, Submission, TestResult
+
+try:
+    import xdist
+except ImportError:
+    xdist = None
+
+TEST_MODULE = textwrap.dedent("""
+    import pytest
+
+    @pytest.fixture
+    def broken_fixture():
+        raise RuntimeError("broken")
+
+    def test_passed():
+        pass
+
+    def test_failed():
+        assert 1 == 2
+
+    @pytest.mark.skip
+    def test_skipped():
+        pass
+
+    @pytest.mark.xfail
+    def test_xfailed():
+        assert False
+
+    def test_broken(broken_fixture):
+        pass
+""")
+
+class PytestPluginTest(LiveServerTestCase):
+
+    def setUp(self):
+        self.project = Project.objects.create(name="Pytest Project", slug="pytest-project")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        with open(os.path.join(self.directory, 'test_module.py'), 'w') as test_module:
+            test_module.write(TEST_MODULE)
+
+    def run_pytest(self, *args):
+        environment = dict(os.environ, PYTHONPATH=settings.BASE_DIR)
+        environment.pop('DTF_URL', None)
+        return subprocess.run([
+            sys.executable, '-m', 'pytest', '-p', 'dtf.pytest_plugin', '-p', 'no:cacheprovider',
+            '--dtf-url', self.live_server_url, '--dtf-project', self.project.slug, '--dtf-info', 'build=42',
+            'test_module.py', *args
+        ], cwd=self.directory, env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, timeout=120)
+
+    def assertReported(self, output):
+        self.assertIn("5 results uploaded, 0 results failed", output)
+        submission = Submission.objects.get(project=self.project)
+        self.assertEqual(submission.info['build'], "42")
+        outcomes = {test.name: test.results[0]['value'] for test in TestResult.objects.filter(submission=submission)}
+        self.assertEqual(outcomes, {
+            "test_module.py::test_passed": "successful",
+            "test_module.py::test_failed": "failed",
+            "test_module.py::test_skipped": "skip",
+            "test_module.py::test_xfailed": "skip",
+            "test_module.py::test_broken": "broken",
+        })
+        failed = TestResult.objects.get(name="test_module.py::test_failed")
+        self.assertEqual([p['name'] for p in failed.results], ["outcome", "duration", "message"])
+        self.assertIn("assert 1 == 2", failed.results[2]['value'])
+
+    def test_plugin(self):
+        process = self.run_pytest()
+        self.assertReported(process.stdout)
+
+    @unittest.skipIf(xdist is None, "pytest-xdist is not installed")
+    def test_plugin_with_xdist(self):
+        process = self.run_pytest('-n', '2')
+        self.assertReported(process.stdout)
@@ -0,0 +1,195 @@
+"""
+Module containing the query budget tests
+
+Every view and API endpoint has a maximum number of SQL queries it may execute. The number of queries must not grow
+with the amount of data in the database, which would hint at an N+1 problem.
+The query plans of the hot lookups are checked to make sure they keep using an index.
+"""
+
+import json
+import re
+
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from dtf.models import TestCase as TestCaseModel
+from dtf.models import Project, TestResult, TestReference, Submission, SubmissionInfo, ReferenceValue
+from dtf.project_cache import clear_project_cache
+from dtf.references import clear_reference_cache, get_reference_versions_at
+from dtf.submission_info import filter_submissions, index_submissions
+
+client = Client()
+
+def seed_project(slug, submission_count, tests_per_submission):
+    """
+    Create a project with the given amount of submissions and tests. Every test uses the first test as reference
+    """
+    project = Project.objects.create(name=slug, slug=slug)
+    submissions = [Submission(project=project, info={"branch": "master"}) for _ in range(submission_count)]
+    Submission.objects.bulk_create(submissions)
+    submissions = list(Submission.objects.filter(project=project).order_by('id'))
+    index_submissions(submissions)
+
+    TestCaseModel.objects.bulk_create([
+        TestCaseModel(project=project, name=f"TEST_{i}") for i in range(tests_per_submission)
+    ])
+    test_cases = dict(TestCaseModel.objects.filter(project=project).values_list('name', 'id'))
+
+    tests = []
+    for submission in submissions:
+        for i in range(tests_per_submission):
+            status = "failed" if i % 3 == 0 else "successful"
+            tests.append(TestResult(name=f"TEST_{i}", test_case_id=test_cases[f"TEST_{i}"], submission=submission,
+                status=status, results=[
+                {"name": "parameter1", "value": i, "valuetype": "integer", "reference": None,
+                 "margin": 0, "status": status}
+            ]))
+    TestResult.objects.bulk_create(tests)
+
+    versions = {
+        test.name: ReferenceValue.objects.create(project=project, test_name=test.name,
+            test_case_id=test.test_case_id, parameter="parameter1", data={"value": 0}, ref_id=test.id)
+        for test in TestResult.objects.filter(submission=submissions[0])
+    }
+    TestReference.objects.bulk_create([
+        TestReference(project=project, test_name=name, test_case_id=test_cases[name],
+            references={"parameter1": version.id})
+        for name, version in versions.items()
+    ])
+
+    # the results point to the reference versions, like results submitted through the API
+    tests = list(TestResult.objects.filter(submission__project=project))
+    for test in tests:
+        del test.results[0]['reference']
+        test.results[0]['reference_id'] = versions[test.name].id
+    TestResult.objects.bulk_update(tests, ['results'])
+    return project
+
+class QueryBudgetTest(TestCase):
+    """
+    Every endpoint is called on a small and on a large project. Both calls must stay within the budget \
+        and execute the same number of queries
+    """
+
+    def setUp(self):
+        self.small = seed_project("small-project", 2, 3)
+        self.large = seed_project("large-project", 20, 30)
+
+    def count_queries(self, method, url, payload=None):
+        # count the worst case of cold reference and project caches
+        clear_reference_cache()
+        clear_project_cache()
+        with CaptureQueriesContext(connection) as context:
+            if payload is None:
+                response = getattr(client, method)(url)
+            else:
+                response = getattr(client, method)(url, json.dumps(payload), content_type='application/json')
+        self.assertLess(response.status_code, 400, url)
+        return len(context.captured_queries)
+
+    def assertQueryBudget(self, budget, method, url_for_project, payload_for_project=None):
+        counts = []
+        for project in [self.small, self.large]:
+            payload = payload_for_project(project) if payload_for_project else None
+            counts.append(self.count_queries(method, url_for_project(project), payload))
+        small_count, large_count = counts
+        self.assertLessEqual(large_count, budget)
+        self.assertEqual(small_count, large_count,
+            f"query count grows with data size: {small_count} vs {large_count}")
+
+    def last_submission(self, project):
+        return Submission.objects.filter(project=project).order_by('-id').first()
+
+    def middle_test(self, project):
+        tests = TestResult.objects.filter(submission__project=project).order_by('id')
+        return tests[tests.count() // 2]
+
+    def test_user_views(self):
+        # the frontpage looks up the shards in the project catalog
+        self.assertQueryBudget(2, 'get', lambda p: '/')
+        self.assertQueryBudget(1, 'get', lambda p: reverse('projects'))
+        self.assertQueryBudget(2, 'get', lambda p: reverse('project_details', args=[p.slug]))
+        self.assertQueryBudget(2, 'get', lambda p: reverse('project_details', args=[p.slug]) + '?info.branch=master')
+        self.assertQueryBudget(1, 'get', lambda p: reverse('project_settings', args=[p.slug]))
+        self.assertQueryBudget(2, 'get', lambda p: reverse('submission_details', args=[self.last_submission(p).id]))
+        # reads resolve the reference versions with one query on a cold cache
+        self.assertQueryBudget(7, 'get', lambda p: reverse('test_result_details', args=[self.middle_test(p).id]))
+
+    def test_get_endpoints(self):
+        self.assertQueryBudget(1, 'get', lambda p: reverse('get_projects'))
+        self.assertQueryBudget(3, 'get', lambda p: reverse('get_submission_by_id', args=[self.last_submission(p).id]))
+        self.assertQueryBudget(2, 'get',
+            lambda p: reverse('get_submissions', args=[p.slug]) + '?info.branch=master&info.host=ci')
+        # the project is looked up first to find its database
+        self.assertQueryBudget(3, 'get', lambda p: reverse('get_reference', args=[p.slug, "TEST_1"]))
+        self.assertQueryBudget(3, 'get', lambda p: reverse('get_reference_by_test_id', args=[self.middle_test(p).id]))
+        self.assertQueryBudget(3, 'post', lambda p: reverse('get_references', args=[p.slug]), lambda p: {
+            "test_names": list(TestReference.objects.filter(project=p).values_list('test_name', flat=True))
+        })
+
+    def test_post_endpoints(self):
+        # the submission and its indexed info are created in one transaction
+        self.assertQueryBudget(5, 'post', lambda p: reverse('create_submission'), lambda p: {
+            "project_slug": p.slug,
+            "info": {"branch": "master", "commit": "abc123", "build": 42}
+        })
+        self.assertQueryBudget(6, 'post', lambda p: '/api/submit_test_results', lambda p: {
+            "name": "TEST_1",
+            "submission_id": self.last_submission(p).id,
+            "results": [{"name": "parameter1", "value": 1, "valuetype": "integer"}]
+        })
+        # one new reference version per parameter
+        self.assertQueryBudget(5, 'put', lambda p: reverse('update_references'), lambda p: {
+            "project_slug": p.slug,
+            "test_name": "TEST_1",
+            "test_id": self.middle_test(p).id,
+            "references": {"parameter1": {"value": 1}}
+        })
+        self.assertQueryBudget(8, 'put', lambda p: reverse('promote_submission'), lambda p: {
+            "submission_id": self.last_submission(p).id
+        })
+
+class QueryPlanTest(TestCase):
+    """
+    Check that the hot lookups are answered using an index instead of a full table scan
+    """
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("query plans are only checked on SQLite")
+        self.project = seed_project("plan-project", 3, 5)
+
+    def assertUsesIndex(self, queryset, table):
+        plan = queryset.explain()
+        full_scan = re.compile(rf"SCAN (TABLE )?{table}\b(?!.*USING)")
+        for line in plan.splitlines():
+            self.assertIsNone(full_scan.search(line), f"full scan of {table}:\n{plan}")
+
+    def test_query_plans(self):
+        test = TestResult.objects.filter(submission__project=self.project).first()
+        for table in [TestReference._meta.db_table, TestCaseModel._meta.db_table]:
+            self.assertUsesIndex(
+                TestReference.objects.filter(test_case__project=self.project, test_case__name=test.name),
+                table)
+        self.assertUsesIndex(
+            TestResult.objects.filter(test_case_id=test.test_case_id),
+            TestResult._meta.db_table)
+        self.assertUsesIndex(
+            TestResult.objects.filter(submission_id=test.submission_id),
+            TestResult._meta.db_table)
+        self.assertUsesIndex(
+            Submission.objects.filter(project=self.project),
+            Submission._meta.db_table)
+        for table in [Submission._meta.db_table, SubmissionInfo._meta.db_table]:
+            self.assertUsesIndex(
+                filter_submissions(Submission.objects.all(), {'branch': 'master', 'commit': 'abc123'}),
+                table)
+        self.assertUsesIndex(
+            Project.objects.filter(slug=self.project.slug),
+            Project._meta.db_table)
+        self.assertUsesIndex(
+            get_reference_versions_at(self.project, test.name, timezone.now()),
+            ReferenceValue._meta.db_table)
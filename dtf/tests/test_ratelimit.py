@@ -0,0 +1,135 @@
+"""
+Module containing the tests for the ingestion rate limits and the backpressure
+"""
+
+import json
+import os
+import tempfile
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from dtf.models import TestCase as TestCaseModel
+from dtf.models import Project, Submission, TestResult
+from dtf.ratelimit import BUCKETS, INGESTION_QUEUE, TokenBuckets
+
+client = Client()
+
+class TokenBucketTest(TestCase):
+
+    def check_buckets(self, buckets):
+        self.assertEqual(buckets.consume('a', rate=1, capacity=2, now=0), (True, 0))
+        self.assertEqual(buckets.consume('a', rate=1, capacity=2, now=0), (True, 0))
+        self.assertEqual(buckets.consume('a', rate=1, capacity=2, now=0.5), (False, 0.5))
+        self.assertEqual(buckets.consume('a', rate=1, capacity=2, now=1), (True, 0))
+        # other keys have their own bucket
+        self.assertEqual(buckets.consume('b', rate=1, capacity=2, cost=2, now=1), (True, 0))
+        # a cost larger than the capacity is taken from a full bucket and has to be paid back
+        self.assertEqual(buckets.consume('c', rate=1, capacity=2, cost=5, now=0), (True, 0))
+        self.assertEqual(buckets.consume('c', rate=1, capacity=2, now=3), (False, 1))
+        self.assertEqual(buckets.consume('c', rate=1, capacity=2, now=100), (True, 0))
+
+    @override_settings(DTF_RATE_LIMIT_DATABASE=None)
+    def test_local_buckets(self):
+        self.check_buckets(TokenBuckets())
+
+    def test_shared_buckets(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(DTF_RATE_LIMIT_DATABASE=os.path.join(directory, 'ratelimit.sqlite3')):
+                buckets = TokenBuckets()
+                self.check_buckets(buckets)
+                # another process sees the same buckets
+                self.assertEqual(TokenBuckets().consume('a', rate=1, capacity=2, now=1), (False, 1))
+                buckets.database.close()
+
+@override_settings(DTF_RATE_LIMIT_DATABASE=None)
+class RateLimitApiTest(TestCase):
+
+    def setUp(self):
+        BUCKETS.reset()
+        self.project = Project.objects.create(name="Limited Project", slug="limited-project",
+            rate_limit_per_minute=60, rate_limit_burst=3, client_rate_limit_per_minute=2)
+        self.submission = Submission.objects.create(project=self.project)
+
+    def submit(self, count=1, client_id="10.0.0.1", **headers):
+        payload = [{
+            "name": f"UNIT_TEST_{i}",
+            "submission_id": self.submission.id,
+            "results": [{"name": "parameter1", "value": 1, "valuetype": "integer"}]
+        } for i in range(count)]
+        return client.post('/api/submit_test_results', json.dumps(payload[0] if count == 1 else payload),
+            content_type='application/json', REMOTE_ADDR=client_id, **headers)
+
+    def test_rate_limits(self):
+        self.assertEqual(self.submit(client_id="10.0.0.1").status_code, 200)
+        self.assertEqual(self.submit(client_id="10.0.0.1").status_code, 200)
+        # the limit of the client is reached, the project accepts one more result
+        response = self.submit(client_id="10.0.0.1")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        # headers chosen by the client do not give it another bucket
+        self.assertEqual(self.submit(client_id="10.0.0.1", HTTP_X_DTF_CLIENT="runner-2").status_code, 429)
+        self.assertEqual(self.submit(client_id="10.0.0.2").status_code, 200)
+        response = self.submit(count=2, client_id="10.0.0.3")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(TestResult.objects.count(), 3)
+        # rejected requests are not validated, which would create the test cases of their tests
+        self.assertFalse(TestCaseModel.objects.filter(name="UNIT_TEST_1").exists())
+
+        # projects without limits are not affected
+        project = Project.objects.create(name="Free Project", slug="free-project")
+        self.submission = Submission.objects.create(project=project)
+        self.assertEqual(self.submit(count=10).status_code, 200)
+
+    def test_invalid_requests_are_refunded(self):
+        for _ in range(3):
+            response = client.post('/api/submit_test_results', json.dumps({
+                "name": "UNIT_TEST",
+                "submission_id": self.submission.id,
+                "results": "not a list"
+            }), content_type='application/json', REMOTE_ADDR="10.0.0.1")
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.submit(count=2).status_code, 200)
+
+    def test_append_test_results(self):
+        test_id = self.submit().json()['test_result_id']
+        url = reverse('append_test_results', args=[test_id])
+        payload = json.dumps({"results": [{"name": "parameter2", "value": 2, "valuetype": "integer"}]})
+        response = client.patch(url, payload, content_type='application/json', REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 200)
+        # every appended parameter takes a token
+        response = client.patch(url, payload, content_type='application/json', REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(TestResult.objects.get(pk=test_id).results), 2)
+
+    @override_settings(DTF_INGESTION_MAX_CONCURRENCY=4)
+    def test_backpressure(self):
+        response = self.submit()
+        self.assertEqual(response['X-DTF-Backpressure'], '0.25')
+
+        INGESTION_QUEUE.depth = 4
+        self.addCleanup(setattr, INGESTION_QUEUE, 'depth', 0)
+        response = self.submit()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(TestResult.objects.count(), 1)
+
+    def test_settings_form(self):
+        response = client.post(reverse('project_settings', args=[self.project.slug]), {
+            'name': self.project.name,
+            'slug': self.project.slug,
+            'rate_limit_per_minute': 100,
+            'rate_limit_burst': 0,
+        })
+        self.assertContains(response, "Rate Limits")
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.rate_limit_per_minute, 60)
+
+        client.post(reverse('project_settings', args=[self.project.slug]), {
+            'name': self.project.name,
+            'slug': self.project.slug,
+            'rate_limit_per_minute': 100,
+        })
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.rate_limit_per_minute, 100)
+        self.assertIsNone(self.project.client_rate_limit_per_minute)
@@ -0,0 +1,207 @@
+"""
+Module containing the tests for the reference versions
+"""
+
+import json
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from dtf.models import Project, Submission, TestResult, TestReference, ReferenceValue
+from dtf.references import clear_reference_cache, get_reference_values
+
+client = Client()
+
+class ReferenceValueTest(TestCase):
+
+    def setUp(self):
+        clear_reference_cache()
+        self.project = Project.objects.create(name="Reference Project", slug="reference-project")
+        self.submission = Submission.objects.create(project=self.project)
+
+    def submit(self, value):
+        response = client.post('/api/submit_test_results', json.dumps({
+            "name": "UNIT_TEST",
+            "submission_id": self.submission.id,
+            "results": [{"name": "parameter1", "value": value, "valuetype": "list"}]
+        }), content_type='application/json')
+        return response.json()['test_result_id']
+
+    def update_references(self, test_id, value):
+        client.put('/api/update_references', json.dumps({
+            "project_id": self.project.id,
+            "test_name": "UNIT_TEST",
+            "test_id": test_id,
+            "references": {"parameter1": {"value": value}}
+        }), content_type='application/json')
+
+    def test_results_point_to_versions(self):
+        first_id = self.submit([1, 2, 3])
+        self.update_references(first_id, [1, 2, 3])
+        second_id = self.submit([1, 2, 4])
+        self.update_references(second_id, [1, 2, 4])
+
+        first_version, second_version = ReferenceValue.objects.order_by('id')
+        self.assertEqual(first_version.data, {"value": [1, 2, 3]})
+        self.assertEqual(TestReference.objects.get().references, {"parameter1": second_version.id})
+        stored = TestResult.objects.get(id=second_id).results[0]
+        self.assertEqual(stored['reference_id'], first_version.id)
+        self.assertNotIn('reference', stored)
+
+        response = client.get(reverse('get_submission_by_id', args=[self.submission.id]))
+        results = {test['id']: test['results'][0] for test in response.json()}
+        self.assertIsNone(results[first_id]['reference'])
+        self.assertEqual(results[second_id]['reference'], {"value": [1, 2, 3], "ref_id": first_id})
+        self.assertEqual(list(results[second_id].keys()),
+            ['name', 'value', 'valuetype', 'reference', 'margin', 'status'])
+
+        response = client.get(reverse('get_reference', args=[self.project.slug, "UNIT_TEST"]))
+        self.assertEqual(response.json()[0]['references'], {"parameter1": {"value": [1, 2, 4], "ref_id": second_id}})
+        self.assertEqual(client.get(reverse('test_result_details', args=[second_id])).status_code, 200)
+
+        with self.assertRaises(ValueError):
+            first_version.save()
+
+    def test_cache(self):
+        version = ReferenceValue.objects.create(project=self.project, test_name="UNIT_TEST", parameter="parameter1",
+            data={"value": 1}, ref_id=None)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(get_reference_values([version.id]), {version.id: {"value": 1, "ref_id": None}})
+            self.assertEqual(get_reference_values([version.id]), {version.id: {"value": 1, "ref_id": None}})
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_reference_history(self):
+        first_id = self.submit([1])
+        self.update_references(first_id, [1])
+        second_id = self.submit([2])
+        self.update_references(second_id, [2])
+        first_version, second_version = ReferenceValue.objects.order_by('id')
+        ReferenceValue.objects.filter(id=first_version.id).update(valid_from="2021-01-01T00:00:00Z")
+        ReferenceValue.objects.filter(id=second_version.id).update(valid_from="2021-02-01T00:00:00Z")
+        Submission.objects.filter(id=self.submission.id).update(created="2021-01-20T00:00:00Z")
+
+        url = reverse('get_reference_history', args=[self.project.slug, "UNIT_TEST"])
+        response = client.get(url)
+        self.assertEqual([version['reference'] for version in response.json()],
+            [{"value": [1], "ref_id": first_id}, {"value": [2], "ref_id": second_id}])
+        self.assertEqual(response.json()[0]['valid_from'], "2021-01-01T00:00:00Z")
+        self.assertEqual(client.get(url + '?parameter=parameter2').json(), [])
+
+        url = reverse('get_reference_at', args=[self.project.slug, "UNIT_TEST"])
+        for query, references in [
+            ('?at=2020-12-31T00:00:00Z', {}),
+            ('?at=2021-01-15T00:00:00Z', {"parameter1": {"value": [1], "ref_id": first_id}}),
+            ('?at=2021-03-01T00:00:00', {"parameter1": {"value": [2], "ref_id": second_id}}),
+            (f'?submission_id={self.submission.id}', {"parameter1": {"value": [1], "ref_id": first_id}}),
+        ]:
+            response = client.get(url + query)
+            self.assertEqual(response.json()['references'], references, query)
+        self.assertEqual(client.get(url + '?at=yesterday').status_code, 400)
+        self.assertEqual(client.get(url + '?submission_id=999999').status_code, 400)
+
+    def test_promote_submission(self):
+        first_id = self.submit([1])
+        self.update_references(first_id, [1])
+        submission = Submission.objects.create(project=self.project)
+        tests = {}
+        for name, status in [("UNIT_TEST", "failed"), ("OTHER_TEST", "failed"), ("NEW_TEST", "successful")]:
+            tests[name] = TestResult.objects.create(name=name, submission=submission, results=[
+                {"name": "parameter1", "value": [2], "valuetype": "list", "status": status},
+                {"name": "parameter2", "value": 3, "valuetype": "integer", "status": "successful"}
+            ]).id
+
+        url = reverse('promote_submission')
+        response = client.put(url, json.dumps({
+            "submission_id": submission.id,
+            "status": ["failed"],
+            "name_pattern": "UNIT_*"
+        }), content_type='application/json')
+        self.assertEqual(response.json(), {"submission_id": submission.id, "promoted_tests": 1,
+            "promoted_parameters": 2, "created_references": 0, "updated_references": 1})
+        response = client.get(reverse('get_reference', args=[self.project.slug, "UNIT_TEST"]))
+        self.assertEqual(response.json()[0]['references'], {
+            "parameter1": {"value": [2], "ref_id": tests["UNIT_TEST"]},
+            "parameter2": {"value": 3, "ref_id": tests["UNIT_TEST"]}
+        })
+
+        response = client.put(url, json.dumps({"submission_id": submission.id}), content_type='application/json')
+        self.assertEqual(response.json()['promoted_tests'], 3)
+        self.assertEqual(response.json()['created_references'], 2)
+        response = client.get(reverse('get_reference', args=[self.project.slug, "NEW_TEST"]))
+        self.assertEqual(response.json()[0]['references']['parameter2'], {"value": 3, "ref_id": tests["NEW_TEST"]})
+        # the history keeps the replaced versions
+        self.assertEqual(ReferenceValue.objects.filter(test_name="UNIT_TEST", parameter="parameter1").count(), 3)
+
+        for payload in [{"submission_id": 999999}, {"submission_id": submission.id, "status": ["green"]}]:
+            response = client.put(url, json.dumps(payload), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_batch_lookup(self):
+        first_id = self.submit([1])
+        self.update_references(first_id, [1])
+        url = reverse('get_references', args=[self.project.slug])
+        payload = json.dumps({"test_names": ["UNIT_TEST", "MISSING_TEST"]})
+
+        response = client.post(url, payload, content_type='application/json', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.json(), {"references": {"UNIT_TEST": {"parameter1": {"value": [1], "ref_id": first_id}}}})
+        etag = response['ETag']
+
+        response = client.post(url, payload, content_type='application/json', HTTP_IF_NONE_MATCH=etag,
+            HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        # the GZipMiddleware weakens the ETags of compressed responses
+        strong_etag = etag[2:] if etag.startswith('W/') else etag
+        for if_none_match in [f'W/{strong_etag}', f'"other", {strong_etag}', '*']:
+            response = client.post(url, payload, content_type='application/json', HTTP_IF_NONE_MATCH=if_none_match)
+            self.assertEqual(response.status_code, 304, if_none_match)
+
+        second_id = self.submit([2])
+        self.update_references(second_id, [2])
+        response = client.post(url, payload, content_type='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        response = client.get(f"{url}?test_id={first_id}&test_id=999999")
+        self.assertEqual(response.json(), {"references": {str(first_id): {"parameter1": {"value": [2], "ref_id": second_id}}}})
+        self.assertEqual(client.post(url, json.dumps({}), content_type='application/json').status_code, 400)
+
+    def test_compact_references(self):
+        test_result = TestResult.objects.create(name="UNIT_TEST", submission=self.submission, results=[
+            {"name": "parameter1", "value": 1, "valuetype": "integer", "reference": None, "margin": 0,
+             "status": "successful"}
+        ])
+        TestReference.objects.create(project=self.project, test_name="UNIT_TEST", references={
+            "parameter1": {"value": 1, "ref_id": test_result.id}
+        })
+        for _ in range(3):
+            TestResult.objects.create(name="UNIT_TEST", submission=self.submission, results=[
+                {"name": "parameter1", "value": 2, "valuetype": "integer",
+                 "reference": {"value": 1, "ref_id": test_result.id}, "margin": 0, "status": "failed"},
+                {"name": "parameter2", "value": 2, "valuetype": "integer",
+                 "reference": {"value": 2}, "margin": 0, "status": "successful"}
+            ])
+        urls = [reverse('get_submission_by_id', args=[self.submission.id]),
+                reverse('get_reference', args=[self.project.slug, "UNIT_TEST"])]
+        before = [client.get(url).json() for url in urls]
+
+        output = StringIO()
+        call_command('compact_references', stdout=output)
+        self.assertIn("default: compacted 1 references and 3 test results", output.getvalue())
+
+        version = ReferenceValue.objects.get()
+        self.assertEqual(TestReference.objects.get().references, {"parameter1": version.id})
+        results = TestResult.objects.order_by('id').last().results
+        self.assertEqual(results[0]['reference_id'], version.id)
+        # explicitly submitted references are kept
+        self.assertEqual(results[1]['reference'], {"value": 2})
+        self.assertEqual([client.get(url).json() for url in urls], before)
+
+        output = StringIO()
+        call_command('compact_references', stdout=output)
+        self.assertIn("default: compacted 0 references and 0 test results", output.getvalue())
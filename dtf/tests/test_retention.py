@@ -0,0 +1,70 @@
+"""
+Module containing the tests for the retention policy
+"""
+
+import os
+import shutil
+import tempfile
+
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from dtf.models import Project, TestResult, TestReference, Submission
+from dtf.retention import get_prunable_submission_ids
+
+class RetentionTest(TestCase):
+
+    def setUp(self):
+        self.project = Project.objects.create(name="Retention Project", slug="retention-project")
+        self.submissions = []
+        for i in range(5):
+            submission = Submission.objects.create(project=self.project, info={"run": i})
+            TestResult.objects.create(name="UNIT_TEST", submission=submission, results=[
+                {"name": "parameter1", "value": i, "valuetype": "integer", "status": "successful"}
+            ])
+            self.submissions.append(submission)
+
+        # the test of the oldest submission is used as reference and must never be pruned
+        reference_test = self.submissions[0].tests.get()
+        TestReference.objects.create(project=self.project, test_name="UNIT_TEST", references={
+            "parameter1": {"value": 0, "ref_id": reference_test.id}
+        })
+
+    def test_no_policy(self):
+        self.assertEqual(get_prunable_submission_ids(self.project), [])
+
+    def test_prunable_submissions(self):
+        self.project.retention_max_submissions = 2
+        self.assertEqual(
+            get_prunable_submission_ids(self.project),
+            [s.id for s in self.submissions[1:3]])
+
+        self.project.retention_max_submissions = None
+        self.project.retention_max_days = 10
+        Submission.objects.filter(id=self.submissions[4].id).update(
+            created=timezone.now() - timedelta(days=11))
+        self.assertEqual(get_prunable_submission_ids(self.project), [self.submissions[4].id])
+
+    def test_prune_and_restore(self):
+        self.project.retention_max_submissions = 2
+        self.project.save()
+
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        call_command('prune_submissions', '--chunk-size', '1', '--archive-dir', archive_dir, stdout=StringIO())
+
+        self.assertEqual(Submission.objects.count(), 3)
+        self.assertEqual(TestResult.objects.count(), 3)
+        self.assertTrue(Submission.objects.filter(id=self.submissions[0].id).exists())
+
+        archives = os.listdir(archive_dir)
+        self.assertEqual(len(archives), 1)
+        call_command('import_results', os.path.join(archive_dir, archives[0]), stdout=StringIO())
+        self.assertEqual(Submission.objects.count(), 5)
+        self.assertEqual(
+            sorted(s.info["run"] for s in Submission.objects.all()),
+            [0, 1, 2, 3, 4])
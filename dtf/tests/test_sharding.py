@@ -0,0 +1,195 @@
+"""
+Module containing the tests for the per-project database shards
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+from django.test import TransactionTestCase, Client, override_settings
+from django.urls import reverse
+
+from dtf import project_cache
+from dtf.management.commands.move_project_to_shard import Command as MoveProjectCommand
+from dtf.models import TestCase as TestCaseModel
+from dtf.models import Project, Submission, TestResult, TestReference
+from dtf.retention import prune_project
+from dtf.routers import get_database_for_id, get_shard_alias, get_shard_id_base
+
+client = Client()
+
+class ShardingTest(TransactionTestCase):
+
+    def setUp(self):
+        shard_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shard_directory)
+        self.shard_directory = shard_directory
+        self.settings = override_settings(DTF_SHARD_DIRECTORY=shard_directory,
+            DTF_PROJECT_CACHE_GENERATION_FILE=os.path.join(shard_directory, 'project_cache.generation'))
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        self.project = Project.objects.create(name="Sharded Project", slug="sharded-project")
+        self.other = Project.objects.create(name="Other Project", slug="other-project")
+        self.alias = get_shard_alias(self.project.id)
+        self.addCleanup(self.remove_shard_connection)
+
+        self.submission_id = self.create_submission(self.project)
+        self.test_id = self.submit("UNIT_TEST", self.submission_id, 5)
+        client.put('/api/update_references', json.dumps({
+            "test_name": "UNIT_TEST",
+            "test_id": self.test_id,
+            "project_id": self.project.id,
+            "references": {"parameter1": {"value": 5}}
+        }), content_type='application/json')
+        self.submit("UNIT_TEST", self.create_submission(self.other), 1)
+
+    def remove_shard_connection(self):
+        if self.alias in connections.databases:
+            connections[self.alias].close()
+            del connections[self.alias]
+            del connections.databases[self.alias]
+
+    def create_submission(self, project):
+        response = client.post('/api/create_submission', json.dumps({"project_id": project.id}),
+            content_type='application/json')
+        return response.json()['id']
+
+    def submit(self, name, submission_id, value):
+        response = client.post('/api/submit_test_results', json.dumps({
+            "name": name,
+            "submission_id": submission_id,
+            "results": [{"name": "parameter1", "value": value, "valuetype": "integer"}]
+        }), content_type='application/json')
+        return response.json()['test_result_id']
+
+    def test_database_for_id(self):
+        self.assertEqual(get_database_for_id(self.test_id), 'default')
+        self.assertEqual(get_database_for_id(get_shard_id_base(self.alias) + 1), 'default')
+        call_command('move_project_to_shard', self.project.slug, stdout=io.StringIO())
+        self.assertEqual(get_database_for_id(get_shard_id_base(self.alias) + 1), self.alias)
+
+    def test_unknown_shard_ids(self):
+        # ids in the range of projects without a shard, or of no project at all, are not found
+        for object_id in [99999999999, get_shard_id_base(get_shard_alias(self.other.id)) + 1]:
+            for url in [reverse('get_submission_by_id', args=[object_id]),
+                        reverse('submission_details', args=[object_id]),
+                        reverse('test_result_details', args=[object_id]),
+                        reverse('get_reference_by_test_id', args=[object_id])]:
+                self.assertIn(client.get(url).status_code, [400, 404], url)
+        self.assertEqual([name for name in os.listdir(self.shard_directory) if 'sqlite3' in name], [])
+        self.assertFalse(any(alias.startswith('dtf_project_') for alias in connections.databases))
+
+    def test_move_project(self):
+        call_command('move_project_to_shard', self.project.slug, stdout=io.StringIO())
+        id_base = get_shard_id_base(self.alias)
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.database, self.alias)
+        self.assertFalse(Submission.objects.filter(project=self.project).exists())
+        self.assertEqual(Submission.objects.filter(project=self.other).count(), 1)
+        self.assertEqual(Submission.objects.using(self.alias).get().id, id_base + self.submission_id)
+
+        reference = TestReference.objects.using(self.alias).get(project=self.project)
+        self.assertEqual(reference.get_reference_or_none('parameter1')['ref_id'], id_base + self.test_id)
+        test_case = TestCaseModel.objects.using(self.alias).get()
+        self.assertGreater(test_case.id, id_base)
+        self.assertEqual(reference.test_case_id, test_case.id)
+        self.assertFalse(TestCaseModel.objects.filter(project=self.project).exists())
+
+        # new data of the project is written to the shard, with ids in the range of the shard
+        submission_id = self.create_submission(self.project)
+        test_id = self.submit("UNIT_TEST", submission_id, 6)
+        self.assertGreater(submission_id, id_base)
+        self.assertGreater(test_id, id_base)
+        self.assertEqual(TestResult.objects.using(self.alias).count(), 2)
+        self.assertEqual(TestResult.objects.using(self.alias).filter(test_case=test_case).count(), 2)
+
+        response = client.get(reverse('get_submission_by_id', args=[submission_id]))
+        self.assertEqual(response.json()[0]['id'], test_id)
+        self.assertEqual(response.json()[0]['results'][0]['reference'], {"value": 5, "ref_id": id_base + self.test_id})
+        response = client.get(reverse('get_reference', args=[self.project.slug, "UNIT_TEST"]))
+        self.assertEqual(response.json()[0]['references']['parameter1']['value'], 5)
+        response = client.get(reverse('get_reference_by_test_id', args=[test_id]))
+        self.assertEqual(response.json()[0]['test_name'], "UNIT_TEST")
+
+        for url in [reverse('test_result_details', args=[test_id]),
+                    reverse('submission_details', args=[submission_id]),
+                    reverse('project_details', args=[self.project.slug]),
+                    '/']:
+            self.assertEqual(client.get(url).status_code, 200, url)
+
+        # the copy of the project in the shard follows changes in the catalog
+        self.project.name = "Renamed Project"
+        self.project.retention_max_submissions = 1
+        self.project.save()
+        self.assertEqual(Project.objects.using(self.alias).get().name, "Renamed Project")
+
+        # the first submission holds the reference and is kept
+        self.assertEqual(prune_project(self.project), 0)
+        self.assertEqual(Submission.objects.using(self.alias).count(), 2)
+
+        response = client.post('/api/create_submission', json.dumps({
+            "project_id": self.project.id, "info": {"branch": "master"}}), content_type='application/json')
+        response = client.get(reverse('get_submissions', args=[self.project.slug]), {'info.branch': 'master'})
+        self.assertEqual([submission['id'] for submission in response.json()], [submission_id + 1])
+
+    def test_move_cached_project(self):
+        # the submissions in setUp cached the project. Another process moving it sends no signal to this one
+        cached = dict(project_cache._cache)
+        self.assertIn(('id', self.project.id), cached)
+        call_command('move_project_to_shard', self.project.slug, stdout=io.StringIO())
+        project_cache._cache.update(cached)
+
+        # the generation file written by the move clears the cache, so new data is written to the shard
+        submission_id = self.create_submission(self.project)
+        self.assertGreater(submission_id, get_shard_id_base(self.alias))
+        self.assertTrue(Submission.objects.using(self.alias).filter(pk=submission_id).exists())
+        self.assertFalse(Submission.objects.filter(project=self.project).exists())
+
+    def test_import_into_shard(self):
+        call_command('move_project_to_shard', self.project.slug, stdout=io.StringIO())
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name")
+            indexes = cursor.fetchall()
+
+        handle, file_name = tempfile.mkstemp(suffix='.jsonl')
+        self.addCleanup(os.remove, file_name)
+        with os.fdopen(handle, 'w') as dump:
+            dump.write(json.dumps({"project_slug": self.project.slug, "tests": [
+                {"name": "UNIT_TEST", "results": [{"name": "parameter1", "value": 7, "valuetype": "integer"}]}
+            ]}) + '\n')
+        call_command('import_results', file_name, '--defer-indexes', '--fast-sqlite', stdout=io.StringIO())
+
+        # the options are applied to the shard the records are written to, and undone afterwards
+        self.assertEqual(TestResult.objects.using(self.alias).count(), 2)
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name")
+            self.assertEqual(cursor.fetchall(), indexes)
+            cursor.execute("PRAGMA synchronous")
+            self.assertNotEqual(cursor.fetchone()[0], 0)
+
+    def test_move_locks_default_database(self):
+        in_transaction = []
+        copy_rows = MoveProjectCommand.copy_rows
+        def record_transaction(command, model, *args, **kwargs):
+            # the copy holds the write lock of the default database until the rows are deleted there
+            in_transaction.append(connections['default'].in_atomic_block)
+            return copy_rows(command, model, *args, **kwargs)
+        with mock.patch.object(MoveProjectCommand, 'copy_rows', record_transaction):
+            call_command('move_project_to_shard', self.project.slug, stdout=io.StringIO())
+        self.assertTrue(in_transaction)
+        self.assertTrue(all(in_transaction))
+        self.assertFalse(connections['default'].in_atomic_block)
+
+    def test_move_twice(self):
+        call_command('move_project_to_shard', self.project.slug, stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command('move_project_to_shard', self.project.slug)
@@ -0,0 +1,114 @@
+"""
+Module containing the tests for the test cases, which identify the tests of a project by an integer key
+"""
+
+import json
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, Client
+from django.urls import reverse
+
+from dtf.models import TestCase as TestCaseModel
+from dtf.models import Project, Submission, TestResult, TestReference, ReferenceValue
+
+client = Client()
+
+class TestCaseTest(TestCase):
+
+    def setUp(self):
+        self.projects = [
+            Project.objects.create(name="First Project", slug="first-project"),
+            Project.objects.create(name="Second Project", slug="second-project"),
+        ]
+
+    def submit(self, project, name, value):
+        submission = Submission.objects.create(project=project)
+        response = client.post('/api/submit_test_results', json.dumps({
+            "name": name,
+            "submission_id": submission.id,
+            "results": [{"name": "parameter1", "value": value, "valuetype": "integer"}]
+        }), content_type='application/json')
+        return response.json()['test_result_id']
+
+    def test_test_cases(self):
+        first_ids = [self.submit(self.projects[0], "UNIT_TEST", value) for value in range(3)]
+        other_id = self.submit(self.projects[1], "UNIT_TEST", 0)
+
+        # equally named tests of different projects are different test cases
+        test_case = TestCaseModel.objects.get(project=self.projects[0])
+        self.assertEqual(TestCaseModel.objects.count(), 2)
+        self.assertEqual(list(test_case.test_results.order_by('id').values_list('id', flat=True)), first_ids)
+        self.assertEqual(TestResult.objects.get(id=other_id).test_case.project, self.projects[1])
+
+        client.put(reverse('update_references'), json.dumps({
+            "project_id": self.projects[0].id,
+            "test_name": "UNIT_TEST",
+            "test_id": first_ids[0],
+            "references": {"parameter1": {"value": 0}}
+        }), content_type='application/json')
+        self.assertEqual(TestReference.objects.get(project=self.projects[0]).test_case, test_case)
+        self.assertEqual(ReferenceValue.objects.get().test_case, test_case)
+
+        # the API output still carries the names
+        response = client.get(reverse('get_reference_by_test_id', args=[first_ids[1]]))
+        self.assertEqual(response.json()[0]['test_name'], "UNIT_TEST")
+        response = client.get(reverse('get_reference_history', args=[self.projects[0].slug, "UNIT_TEST"]))
+        self.assertEqual(len(response.json()), 1)
+        response = client.get(reverse('get_reference_history', args=[self.projects[1].slug, "UNIT_TEST"]))
+        self.assertEqual(response.json(), [])
+
+        nav_data = self.projects[0].get_nav_data(test_case.id, TestResult.objects.get(id=first_ids[1]).submission_id)
+        self.assertEqual(nav_data['previous']['id'], first_ids[0])
+        self.assertEqual(nav_data['next']['id'], first_ids[2])
+        self.assertEqual(nav_data['most_recent']['id'], first_ids[2])
+
+    def test_created_without_test_case(self):
+        submission = Submission.objects.create(project=self.projects[0])
+        test_result = TestResult.objects.create(name="UNIT_TEST", submission=submission, results=[])
+        test_reference = TestReference.objects.create(project=self.projects[0], test_name="UNIT_TEST")
+        self.assertIsNotNone(test_result.test_case_id)
+        self.assertEqual(test_reference.test_case_id, test_result.test_case_id)
+
+class PopulateTestCasesMigrationTest(TransactionTestCase):
+
+    def setUp(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('dtf')[0][1]
+        self.addCleanup(self.migrate, latest)
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('dtf', target)])
+        return executor.loader.project_state([('dtf', target)]).apps
+
+    def test_populate(self):
+        apps = self.migrate('0014_project_rate_limits')
+        Project = apps.get_model('dtf', 'Project')
+        Submission = apps.get_model('dtf', 'Submission')
+        TestResult = apps.get_model('dtf', 'TestResult')
+        TestReference = apps.get_model('dtf', 'TestReference')
+        ReferenceValue = apps.get_model('dtf', 'ReferenceValue')
+
+        projects = [Project.objects.create(name=f"Project {i}", slug=f"project-{i}") for i in range(2)]
+        for project in projects:
+            submission = Submission.objects.create(project=project)
+            for name in ["FIRST_TEST", "SECOND_TEST"]:
+                TestResult.objects.create(name=name, submission=submission, results=[])
+        TestReference.objects.create(project=projects[0], test_name="FIRST_TEST")
+        ReferenceValue.objects.create(project=projects[0], test_name="THIRD_TEST", parameter="parameter1")
+        TestResult.objects.create(name="ORPHAN_TEST", submission=None, results=[])
+
+        apps = self.migrate('0016_populate_testcases')
+        TestCase = apps.get_model('dtf', 'TestCase')
+        TestResult = apps.get_model('dtf', 'TestResult')
+        self.assertEqual(TestCase.objects.count(), 5)
+        for test_result in TestResult.objects.exclude(submission=None):
+            test_case = TestCase.objects.get(id=test_result.test_case_id)
+            self.assertEqual((test_case.project_id, test_case.name),
+                (Submission.objects.get(id=test_result.submission_id).project_id, test_result.name))
+        self.assertIsNone(TestResult.objects.get(name="ORPHAN_TEST").test_case_id)
+        self.assertEqual(apps.get_model('dtf', 'TestReference').objects.get().test_case_id,
+            TestCase.objects.get(project_id=projects[0].id, name="FIRST_TEST").id)
+        self.assertEqual(apps.get_model('dtf', 'ReferenceValue').objects.get().test_case_id,
+            TestCase.objects.get(name="THIRD_TEST").id)
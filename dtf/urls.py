@@ -16,11 +16,15 @@ urlpatterns = [
     path('test_details/<int:test_id>', views.view_test_result_details, name='test_result_details'),
 
     path('api/submit_test_results', views.submit_test_results),
+    path('api/append_test_results/<int:test_id>',
+     views.append_test_results,
+     name='append_test_results'),
 
     path('api/create_project', views.create_project),
     path('api/get_projects', views.get_projects, name='get_projects'),
 
     path('api/create_submission', views.create_submission, name='create_submission'),
+    path('api/get_submissions/<str:project_slug>', views.get_submissions, name='get_submissions'),
     path('api/get_submission_by_id/<int:submission_id>',
      views.get_submission_by_id,
      name='get_submission_by_id'),
@@ -31,7 +35,19 @@ urlpatterns = [
     path('api/get_reference_by_test_id/<int:test_id>',
      views.get_reference_by_test_id,
      name='get_reference_by_test_id'),
+    path('api/get_references/<str:project_slug>',
+     views.get_references,
+     name='get_references'),
+    path('api/get_reference_history/<str:project_slug>/<str:test_name>',
+     views.get_reference_history,
+     name='get_reference_history'),
+    path('api/get_reference_at/<str:project_slug>/<str:test_name>',
+     views.get_reference_at,
+     name='get_reference_at'),
     path('api/update_references', views.update_references, name='update_references'),
+    path('api/promote_submission', views.promote_submission, name='promote_submission'),
+
+    path('api/metrics', views.metrics, name='metrics'),
 
     path('api/WIPE_DATABASE', views.WIPE_DATABASE),
 ]
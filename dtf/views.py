@@ -1,26 +1,57 @@
-from django.shortcuts import render, get_object_or_404
-from django.db import IntegrityError
-from django.http import HttpResponseRedirect
+import collections
+import hashlib
+import itertools
+import json
+
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from contextlib import ExitStack
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, StreamingHttpResponse
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
 
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import serializers, status
 
 from dtf.serializers import ProjectSerializer
 from dtf.serializers import TestResultSerializer
 from dtf.serializers import TestReferenceSerializer
 from dtf.serializers import SubmissionSerializer
-from dtf.models import TestResult, Project, TestReference, Submission
-from dtf.functions import create_view_data_from_test_references
+from dtf.serializers import PromoteSubmissionSerializer
+from dtf.serializers import BatchReferenceSerializer
+from dtf.serializers import AppendTestResultSerializer
+from dtf.models import TestResult, Project, TestReference, Submission, ReferenceValue
+from dtf.models import TestCase, SubmissionInfo, IdempotencyKey
+from dtf.functions import create_view_data_from_test_references, check_result_structure, get_test_reference
+from dtf.functions import get_project_by_id
 from dtf.forms import NewProjectForm, ProjectSettingsForm
+from dtf.idempotency import idempotent
+from dtf.ratelimit import backpressure, check_rate_limits, refund_rate_limits
+from dtf.instrumentation import render
+from dtf.metrics import REGISTRY, INGESTED_TEST_RESULTS
+from dtf.routers import get_all_databases, get_database_for_id, get_project_database
+from dtf.references import resolve_references, resolve_result_references, resolve_test_references
+from dtf.references import get_references_at, get_reference_values
+from dtf.fastpath import PROJECT_FIELDS, SUBMISSION_FIELDS, TEST_RESULT_FIELDS, TEST_REFERENCE_FIELDS
+from dtf.fastpath import REFERENCE_VALUE_FIELDS, TEST_REFERENCE_COLUMNS, REFERENCE_VALUE_COLUMNS
+from dtf.fastpath import get_columns, get_fieldset
+from dtf.fastpath import dumps, json_response, submission_rows, test_result_rows, reference_value_rows
+from dtf.submission_info import INFO_PARAMETER_PREFIX, filter_submissions, get_indexed_keys, get_info_filters
 
 """
 User views
 """
 
 def frontpage(request):
-    results = TestResult.objects.order_by('-first_submitted')[:5]
+    results = []
+    for database in get_all_databases():
+        results.extend(TestResult.objects.using(database).order_by('-first_submitted')[:5])
+    results = sorted(results, key=lambda result: result.first_submitted, reverse=True)[:5]
     return render(request, 'dtf/index.html', {'data':results})
 
 def view_projects(request):
@@ -56,26 +87,34 @@ def view_project_settings(request, project_slug):
 
 def view_project_details(request, project_slug):
     project = get_object_or_404(Project, slug=project_slug)
-    submissions = Submission.objects.filter(project=project)
+    try:
+        filters = get_info_filters(request.GET)
+    except serializers.ValidationError as error:
+        return HttpResponseBadRequest(str(error.detail))
+    submissions = filter_submissions(
+        Submission.objects.using(get_project_database(project)).filter(project=project), filters)
     return render(request, 'dtf/project_details.html', {
         'project':project,
-        'submissions':submissions
+        'submissions':submissions,
+        'info_filters':[(f"{INFO_PARAMETER_PREFIX}{key}", key, filters.get(key, '')) for key in get_indexed_keys()]
     })
 
 def view_test_result_details(request, test_id):
-    test_result = get_object_or_404(TestResult, pk=test_id)
+    test_result = get_object_or_404(
+        TestResult.objects.using(get_database_for_id(test_id)).select_related('submission__project'),
+        pk=test_id)
     project = test_result.submission.project
     # we did try except at this point. with our current method, there is no way that
     # a test result object exists without a corresponding reference object
     # worst case the references are empty, but the object still exists
-    references_object = TestReference.objects.get(
-        test_name=test_result.name,
-        project=project)
+    references_object = TestReference.objects.using(test_result._state.db).get(
+        test_case_id=test_result.test_case_id)
     # this can fail if a submission gets assigned another project by hand
-    references = references_object.references
+    references = resolve_references(references_object.references, test_result._state.db)
+    resolve_result_references([test_result], test_result._state.db)
     data = create_view_data_from_test_references(
         test_result.results, references)
-    nav_data = project.get_nav_data(test_result.name, test_result.submission.id)
+    nav_data = project.get_nav_data(test_result.test_case_id, test_result.submission.id)
     return render(request, 'dtf/test_result_details.html', {
         'project':project,
         'test_name':test_result.name,
@@ -85,32 +124,92 @@ def view_test_result_details(request, test_id):
     })
 
 def view_submission_details(request, submission_id):
-    submission = get_object_or_404(Submission, pk=submission_id)
+    submission = get_object_or_404(
+        Submission.objects.using(get_database_for_id(submission_id)).select_related('project'),
+        pk=submission_id)
+    # the results are not displayed, so they are not read. The submission id is needed by the related manager
+    tests = submission.tests.only('id', 'name', 'status', 'first_submitted', 'submission')
     return render(request, 'dtf/submission_details.html', {
-        'submission':submission
+        'submission':submission,
+        'tests':tests
     })
 
+def metrics(request):
+    """
+    Returns all metrics in the Prometheus text format
+    """
+    return HttpResponse(REGISTRY.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 """
 GET API endpoints
 """
 
+# number of test results serialized at once when a submission is streamed
+STREAMING_CHUNK_SIZE = 500
+
+def stream_test_results(rows, using):
+    """
+    Encode the test result rows to a JSON list chunk by chunk
+    """
+    yield b'['
+    separator = b''
+    while True:
+        chunk = list(itertools.islice(rows, STREAMING_CHUNK_SIZE))
+        if not chunk:
+            break
+        # strip the brackets of the encoded list
+        yield separator + dumps(test_result_rows(chunk, using))[1:-1]
+        separator = b','
+    yield b']'
+
 @api_view(["GET"])
 def get_submission_by_id(request, submission_id):
     """
     Returns a list of test results assigned to the submission with the given id
+
+    Submissions with more than DTF_STREAMING_THRESHOLD test results are streamed as JSON, so they are never held in \
+        memory as a whole. Select fields with the 'fields' or 'exclude' query parameters, e.g. 'fields=name,status'.
     """
-    submission = get_object_or_404(Submission, pk=submission_id)
-    data = submission.tests.all()
-    serializer = TestResultSerializer(data, many=True)
-    return Response(serializer.data, status.HTTP_200_OK)
+    fields = get_fieldset(request, TEST_RESULT_FIELDS)
+    submission = get_object_or_404(Submission.objects.using(get_database_for_id(submission_id)), pk=submission_id)
+    using = submission._state.db
+    threshold = getattr(settings, 'DTF_STREAMING_THRESHOLD', 1000)
+    rows = submission.tests.values(*fields).iterator(chunk_size=STREAMING_CHUNK_SIZE)
+    first = list(itertools.islice(rows, threshold + 1))
+    if len(first) <= threshold or request.accepted_renderer.format != 'json':
+        return json_response(request, test_result_rows(first + list(rows), using))
+    return StreamingHttpResponse(stream_test_results(itertools.chain(first, rows), using),
+        content_type='application/json')
+
+@api_view(["GET"])
+def get_submissions(request, project_slug):
+    """
+    Returns the submissions of a project, newest first
+
+    Filter the submissions by the values of indexed info keys with 'info.<key>' query parameters, e.g. \
+        'info.branch=master', see dtf.submission_info. At most 'limit' submissions are returned, 100 by default.
+    """
+    fields = get_fieldset(request, SUBMISSION_FIELDS)
+    filters = get_info_filters(request.query_params)
+    try:
+        limit = int(request.query_params.get('limit', 100))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return Response({"error":"'limit' must be a positive integer"}, status.HTTP_400_BAD_REQUEST)
+    project = get_object_or_404(Project, slug=project_slug)
+    submissions = filter_submissions(
+        Submission.objects.using(get_project_database(project)).filter(project=project), filters)
+    return json_response(request, submission_rows(list(submissions.order_by('-id').values(*fields)[:limit])))
 
 @api_view(["GET"])
 def get_projects(request):
     """
     Returns a list with all current projects in the database
     """
-    projects = Project.objects.order_by('-pk')
-    serializer = ProjectSerializer(projects, many=True)
+    fields = get_fieldset(request, PROJECT_FIELDS)
+    projects = Project.objects.order_by('-pk').only(*fields)
+    serializer = ProjectSerializer(projects, many=True, fields=fields)
     return Response(serializer.data, status.HTTP_200_OK)
 
 @api_view(["GET"])
@@ -118,11 +217,18 @@ def get_reference(request, project_slug, test_name):
     """
     Return the references of a test matching the given project slug and test name
     """
-    data = TestReference.objects.filter(
-        test_name=test_name,
-        project__slug=project_slug
-    )
-    serializer = TestReferenceSerializer(data, many=True)
+    fields = get_fieldset(request, TEST_REFERENCE_FIELDS)
+    project = Project.objects.filter(slug=project_slug).first()
+    if not project:
+        return Response([], status.HTTP_200_OK)
+    database = get_project_database(project)
+    data = list(TestReference.objects.using(database).filter(
+        test_case__project=project,
+        test_case__name=test_name
+    ).only(*get_columns(fields, TEST_REFERENCE_COLUMNS)))
+    if 'references' in fields:
+        resolve_test_references(data, database)
+    serializer = TestReferenceSerializer(data, many=True, fields=fields)
     return Response(serializer.data, status.HTTP_200_OK)
 
 @api_view(["GET"])
@@ -130,39 +236,260 @@ def get_reference_by_test_id(request, test_id):
     """
     Return the references for the test with the given test_id
     """
+    fields = get_fieldset(request, TEST_REFERENCE_FIELDS)
     try:
-        test_result = TestResult.objects.get(id=test_id)
+        test_result = TestResult.objects.using(get_database_for_id(test_id)).only('test_case').get(id=test_id)
     except TestResult.DoesNotExist:
         return Response({"error":"No test_result with given id found"}, status.HTTP_400_BAD_REQUEST)
-    data = TestReference.objects.filter(
-        test_name=test_result.name,
-        project=test_result.submission.project
-    )
-    serializer = TestReferenceSerializer(data, many=True)
+    data = []
+    if test_result.test_case_id is not None:
+        data = list(TestReference.objects.using(test_result._state.db).filter(
+            test_case_id=test_result.test_case_id
+        ).only(*get_columns(fields, TEST_REFERENCE_COLUMNS)))
+    if 'references' in fields:
+        resolve_test_references(data, test_result._state.db)
+    serializer = TestReferenceSerializer(data, many=True, fields=fields)
     return Response(serializer.data, status.HTTP_200_OK)
 
+@api_view(["GET", "POST"])
+def get_references(request, project_slug):
+    """
+    Return the references of many tests of a project at once
+
+    The tests are given as 'test_names' or 'test_ids' lists in the posted data, or as repeated 'test_name' or \
+        'test_id' query parameters for GET requests. The response maps every test name, or test id, to its references.
+        Tests without references are left out.
+    The response carries an ETag. If it matches the 'If-None-Match' header, an empty 304 response is returned.
+    """
+    project = get_object_or_404(Project, slug=project_slug)
+    if request.method == 'GET':
+        data = {
+            'test_names': request.query_params.getlist('test_name'),
+            'test_ids': request.query_params.getlist('test_id'),
+        }
+    else:
+        data = request.data
+    serializer = BatchReferenceSerializer(data=data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    database = get_project_database(project)
+    keys = {name: [name] for name in serializer.validated_data.get('test_names', [])}
+    if serializer.validated_data.get('test_ids'):
+        for test_id, name in TestResult.objects.using(database).filter(
+                id__in=serializer.validated_data['test_ids'],
+                submission__project=project).values_list('id', 'name'):
+            keys.setdefault(name, []).append(str(test_id))
+    references = TestReference.objects.using(database).filter(
+        test_case__project=project,
+        test_case__name__in=list(keys)
+    ).order_by('test_name').values_list('test_name', 'references')
+
+    # reference versions are immutable, so the version ids identify the content
+    etag = hashlib.sha1(json.dumps([keys, list(references)], sort_keys=True).encode()).hexdigest()
+    etag = f'"{etag}"'
+    if etag_matches(request.headers.get('If-None-Match', ''), etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    values = get_reference_values([reference for _, test_references in references
+        for reference in test_references.values() if isinstance(reference, int)], database)
+    data = {}
+    for test_name, test_references in references:
+        resolved = {
+            name: values.get(reference) if isinstance(reference, int) else reference
+            for name, reference in test_references.items()
+        }
+        for key in keys[test_name]:
+            data[key] = resolved
+    return Response({'references': data}, status.HTTP_200_OK, headers={'ETag': etag})
+
+def etag_matches(if_none_match, etag):
+    """
+    Check the 'If-None-Match' header, weak ETags match as well since the GZipMiddleware weakens the sent ETags
+    """
+    tags = parse_etags(if_none_match)
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+@api_view(["GET"])
+def get_reference_history(request, project_slug, test_name):
+    """
+    Return all versions of the references of a test, ordered by parameter and time
+
+    The optional 'parameter' query parameter limits the history to a single parameter
+    """
+    fields = get_fieldset(request, REFERENCE_VALUE_FIELDS)
+    project = get_object_or_404(Project, slug=project_slug)
+    data = ReferenceValue.objects.using(get_project_database(project)).filter(
+        test_case__project=project,
+        test_case__name=test_name
+    ).order_by('parameter', 'valid_from', 'id')
+    if 'parameter' in request.query_params:
+        data = data.filter(parameter=request.query_params['parameter'])
+    return json_response(request, reference_value_rows(
+        data.values(*get_columns(fields, REFERENCE_VALUE_COLUMNS)), fields))
+
+@api_view(["GET"])
+def get_reference_at(request, project_slug, test_name):
+    """
+    Return the references of a test at a point in time
+
+    The point in time is given as ISO 8601 timestamp in the 'at' query parameter, or as the creation time of \
+        the submission given in the 'submission_id' query parameter
+    """
+    project = get_object_or_404(Project, slug=project_slug)
+    if 'submission_id' in request.query_params:
+        try:
+            submission_id = int(request.query_params['submission_id'])
+            at = Submission.objects.using(get_database_for_id(submission_id)).get(
+                id=submission_id, project=project).created
+        except (ValueError, Submission.DoesNotExist):
+            return Response({"error":"No submission with given id found"}, status.HTTP_400_BAD_REQUEST)
+    else:
+        try:
+            at = parse_datetime(request.query_params.get('at', ''))
+        except ValueError:
+            at = None
+        if at is None:
+            return Response({"error":"Need an 'at' timestamp or a 'submission_id'"}, status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+    return Response({
+        'test_name': test_name,
+        'at': at,
+        'references': get_references_at(project, test_name, at)
+    }, status.HTTP_200_OK)
+
 """
 POST API endpoints
 """
 
 @api_view(["POST"])
+@idempotent
+@backpressure
 def submit_test_results(request):
-    serializer = TestResultSerializer(data=request.data)
-    if serializer.is_valid():
-        # we just get or create the reference object here
-        test_reference, _ = TestReference.objects.get_or_create(
-            project=serializer.validated_data['submission'].project,
-            test_name=serializer.validated_data['name']
-        )
-        # we do NOT automatically set the posted test as a reference
-        # no matter if the reference is set yet or not. just save it
-        test_reference.save()
+    """
+    Submit a single test result, or a list of test results
 
+    A list is stored in one transaction and returns the ids of all created test results. If one of the test \
+        results is invalid, none of them is stored. Requests exceeding the rate limits of a project are rejected, \
+        see dtf.ratelimit.
+    """
+    if isinstance(request.data, list):
+        return submit_test_result_batch(request)
+    submissions = load_submissions([request.data])
+    counts = count_results_per_project([request.data], submissions)
+    rate_limited = check_rate_limits(request, counts)
+    if rate_limited:
+        return rate_limited
+    serializer = TestResultSerializer(data=request.data, context={'submissions': submissions})
+    if serializer.is_valid():
+        submission = serializer.validated_data['submission']
+        # the reference of the test was already created by the validation, we do NOT automatically set the
+        # posted test as a reference. no matter if the reference is set yet or not. just save it
         created_test_result = serializer.save()
+        INGESTED_TEST_RESULTS.inc(project=submission.project.slug)
         return Response({'test_result_id':created_test_result.pk}, status.HTTP_200_OK)
+    refund_rate_limits(request, counts)
     return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
+def submit_test_result_batch(request):
+    submissions = load_submissions(request.data)
+    counts = count_results_per_project(request.data, submissions)
+    rate_limited = check_rate_limits(request, counts)
+    if rate_limited:
+        return rate_limited
+    serializer = TestResultSerializer(data=request.data, many=True, context={'submissions': submissions})
+    if not serializer.is_valid():
+        refund_rate_limits(request, counts)
+        return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    # the test cases and references of the tests were already created during the validation
+    databases = {item['submission']._state.db for item in serializer.validated_data}
+    with ExitStack() as stack:
+        for database in sorted(databases):
+            stack.enter_context(transaction.atomic(using=database))
+        created_test_results = serializer.save()
+    for item in serializer.validated_data:
+        INGESTED_TEST_RESULTS.inc(project=item['submission'].project.slug)
+    return Response({'test_result_ids':[t.pk for t in created_test_results]}, status.HTTP_200_OK)
+
+def load_submissions(items):
+    """
+    Return the submissions of the posted test results by their id, with one query per database
+
+    Invalid and unknown ids are left out, the validation of the test results reports them.
+    """
+    ids_by_database = collections.defaultdict(set)
+    for item in items:
+        try:
+            submission_id = int(item['submission_id'])
+            ids_by_database[get_database_for_id(submission_id)].add(submission_id)
+        except (KeyError, TypeError, ValueError):
+            continue
+    submissions = {}
+    for database, submission_ids in ids_by_database.items():
+        for submission in Submission.objects.using(database).select_related('project').filter(pk__in=submission_ids):
+            submissions[submission.pk] = submission
+    return submissions
+
+def count_results_per_project(items, submissions):
+    counts = collections.Counter()
+    for item in items:
+        try:
+            counts[submissions[int(item['submission_id'])].project] += 1
+        except (KeyError, TypeError, ValueError):
+            continue
+    return counts
+
+@api_view(["PATCH"])
+@idempotent
+@backpressure
+def append_test_results(request, test_id):
+    """
+    Append result parameters to an existing test result, replacing the parameters with the same name
+
+    Expects a 'results' list in the format of submit_test_results. The stored parameters are not sent again, \
+        so long running tests can submit their parameters as they are produced. The test result and its submission \
+        are marked as updated.
+    """
+    serializer = AppendTestResultSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    database = get_database_for_id(test_id)
+    # every appended parameter takes a token of the rate limits of the project
+    project_id = TestResult.objects.using(database).filter(pk=test_id).values_list(
+        'submission__project_id', flat=True).first()
+    project = get_project_by_id(project_id) if project_id is not None else None
+    if project is not None:
+        rate_limited = check_rate_limits(request, {project: len(serializer.validated_data['results'])})
+        if rate_limited:
+            return rate_limited
+    # SQLite ignores select_for_update. Concurrent appends are serialized because the DTF backend starts the
+    # transaction with BEGIN IMMEDIATE, which takes the write lock of the whole database before the row is read
+    with transaction.atomic(using=database):
+        test_result = get_object_or_404(
+            TestResult.objects.using(database).select_for_update().select_related('submission__project'),
+            pk=test_id)
+        if test_result.submission is None:
+            return Response({"error":"The test result has no submission"}, status.HTTP_400_BAD_REQUEST)
+        parameters, _ = check_result_structure(
+            serializer.validated_data['results'],
+            get_test_reference(test_result.submission.project, test_result.name, database))
+        # the stored results are updated as they are, their references are not resolved
+        test_result.append_results(parameters)
+        now = timezone.now()
+        TestResult.objects.using(database).filter(pk=test_id).update(
+            results=test_result.results,
+            status=test_result.status,
+            last_updated=now)
+        Submission.objects.using(database).filter(pk=test_result.submission_id).update(updated=now)
+    return Response({
+        'test_result_id': test_id,
+        'status': test_result.status,
+        'parameters': len(test_result.results)
+    }, status.HTTP_200_OK)
+
 @api_view(["POST"])
+@idempotent
 def create_project(request):
     """Looks for a 'name' and 'slug' fields in the sent data. If both are valid, creates a \
         new project and returns the id of the project
@@ -186,6 +513,7 @@ def create_project(request):
     return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
 @api_view(["POST"])
+@idempotent
 def create_submission(request):
     """
     Creates a new submission with incrementing IDs
@@ -203,6 +531,7 @@ PUT API endpoints
 """
 
 @api_view(["PUT"])
+@idempotent
 def update_references(request):
     serializer = TestReferenceSerializer(data=request.data)
     if serializer.is_valid():
@@ -210,12 +539,30 @@ def update_references(request):
         return Response({}, status.HTTP_200_OK)
     return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
+@api_view(["PUT"])
+@idempotent
+def promote_submission(request):
+    """
+    Use the values of the tests of a submission as their new references, in one transaction
+
+    Requires a 'submission_id'. A list of 'status' values and a shell style 'name_pattern' limit the promoted tests.
+    Returns the number of promoted tests and parameters and the number of created and updated references.
+    """
+    serializer = PromoteSubmissionSerializer(data=request.data)
+    if serializer.is_valid():
+        summary = serializer.save()
+        return Response(summary, status.HTTP_200_OK)
+    return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
 """
 DEBUGGING
 """
 
 @api_view(["GET"])
 def WIPE_DATABASE(request):
-    for model in [Project, Submission, TestResult, TestReference]:
-        model.objects.all().delete()
+    for database in reversed(get_all_databases()):
+        # children are deleted before their parents
+        for model in [ReferenceValue, TestReference, TestResult, SubmissionInfo, Submission, TestCase, Project,
+                      IdempotencyKey]:
+            model.objects.using(database).all().delete()
     return Response({}, status.HTTP_200_OK)
\ No newline at end of file
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
+import importlib.util
 import os
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -48,22 +49,86 @@ REST_FRAMEWORK = {
     # voss: im not sure what this does for me right now
     # docs https://www.django-rest-framework.org/api-guide/permissions/#setting-the-permission-policy
     # 'DEFAULT_PERMISSION_CLASSES': [],
-    'TEST_REQUEST_DEFAULT_FORMAT': 'json'
+    'TEST_REQUEST_DEFAULT_FORMAT': 'json',
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# MessagePack request and response bodies are only offered if the optional msgpack package is installed
+if importlib.util.find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('dtf.parsers.MessagePackParser')
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('dtf.renderers.MessagePackRenderer')
+
 
 MIDDLEWARE = [
+    'django.middleware.gzip.GZipMiddleware',
+    'dtf.middleware.ServerTimingMiddleware',
+    'dtf.middleware.MetricsMiddleware',
+    'dtf.middleware.RequestDecompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'dtf.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request bodies sent with 'Content-Encoding: gzip' or 'deflate' are rejected if they decompress to more bytes.
+# Responses are compressed with gzip for clients that accept it
+DTF_MAX_DECOMPRESSED_BODY_SIZE = 64 * 1024 * 1024
+
+# get_submission_by_id streams submissions with more test results as chunked JSON
+DTF_STREAMING_THRESHOLD = 1000
+
+# Responses of requests with an 'Idempotency-Key' header are kept for this many seconds, see dtf.idempotency
+DTF_IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Token buckets of the ingestion rate limits of the projects, shared by all worker processes. Set to None to keep
+# the buckets in the memory of each process. Every process handles at most DTF_INGESTION_MAX_CONCURRENCY
+# submissions at once, see dtf.ratelimit
+DTF_RATE_LIMIT_DATABASE = os.path.join(BASE_DIR, 'ratelimit.sqlite3')
+DTF_INGESTION_MAX_CONCURRENCY = 32
+
+# Keys of the submission info that are copied into an index, so submissions can be filtered by their values, e.g.
+# 'api/get_submissions/<project>?info.branch=master'. Run the 'index_submission_info' command after changing them
+DTF_INDEXED_INFO_KEYS = ['branch', 'commit', 'host']
+
+# Projects looked up by the API are cached for this many seconds in every process, see dtf.project_cache. Changes
+# of projects replace the generation file, which tells the other worker processes to clear their cache. Without it,
+# the changes are seen after the TTL. Set the TTL to 0 to disable the cache
+DTF_PROJECT_CACHE_TTL = 60
+DTF_PROJECT_CACHE_GENERATION_FILE = os.path.join(BASE_DIR, 'project_cache.generation')
+
+# Fraction of requests for which SQL queries, serializer and template times are measured and reported
+# in the 'Server-Timing' header and the 'dtf.timing' logger (on INFO level). Set to 0 to disable
+DTF_TIMING_SAMPLE_RATE = 0.1
+
+# SQLite file combining the metrics of all worker processes, exposed on /api/metrics. Set to None to keep the
+# metrics in the memory of each process
+DTF_METRICS_DATABASE = os.path.join(BASE_DIR, 'metrics.sqlite3')
+DTF_METRICS_FLUSH_INTERVAL = 5
+
+# Staff users can profile requests with '?profile=1' or the 'X-DTF-Profile: 1' header. The profiles are stored
+# in this directory, and every user may profile DTF_PROFILE_RATE_LIMIT requests per DTF_PROFILE_RATE_PERIOD seconds
+DTF_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+DTF_PROFILE_RATE_LIMIT = 10
+DTF_PROFILE_RATE_PERIOD = 60
+DTF_PROFILE_SAMPLE_INTERVAL = 0.001
+
 ROOT_URLCONF = 'rest.urls'
 
+# the tests do not use the shared files of the installation, see dtf.tests.runner
+TEST_RUNNER = 'dtf.tests.runner.DtfTestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -86,13 +151,24 @@ WSGI_APPLICATION = 'rest.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# The DTF SQLite backend allows several worker processes to write at the same time, see dtf.backends.sqlite3.
+# Connections are kept open for CONN_MAX_AGE seconds, so the pragmas are only set once per connection.
+# Set DTF_SQLITE_PRAGMAS to replace the DEFAULT_PRAGMAS of the backend
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'dtf.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'timeout': 20,
+        },
     }
 }
 
+# projects moved with the 'move_project_to_shard' command keep their data in their own database in this directory
+DATABASE_ROUTERS = ['dtf.routers.ProjectShardRouter']
+DTF_SHARD_DIRECTORY = os.path.join(BASE_DIR, 'shards')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators